@@ -9,21 +9,36 @@
 # take in user data via POST requests from HomePage.tsx on the frontend.
 # In the submit() function, this user data and job listings gathered using
 # the fetch_jobs.py file are passed into our job-recommender ML model. The
-# top 5 results are then sent back to the frontend as a JSON response.
+# top 5 results (or the requested page of results) are then sent back to
+# the frontend as a JSON response. The model is served from a corpus cache
+# that loads and reloads it in the background. The request options and the
+# /ready and /metrics endpoints are described in the README. Scoring is
+# timed as one "similarity" stage, not per field.
 # Built in collaboration with Alex, from his file: scrape_googlejobs.py.
 #
 # Source:
 # 1.) CORS Documentation: https://flask-cors.readthedocs.io/en/latest/api.html
 #
 # Should run on PORT  http://localhost:5001/
+# In production the app is served by gunicorn (see gunicorn.conf.py) with
+# several worker processes and threads sharing the read-only model.
 
 # Import the required modules: CORS enables frontend-backend communication
+import logging
 import os
-from flask import Flask, request, jsonify
+from functools import partial
+from flask import Flask, Response, g, request, jsonify
 from dotenv import load_dotenv
 from flask_cors import CORS
-import json
-from model.recommender import job_recommender
+from model.corpus_cache import CorpusCache, CorpusNotReady
+from model.listing_store import summarize
+from model.metrics import Registry, RequestTimer, current_timer, stage
+from model.recommender import (
+    ENGINES, field_weights, job_recommender, job_recommender_batch,
+    job_recommender_json, load_index)
+from model.result_cache import PROFILE_KEYS, ResultCache
+from model.segments import update_index
+from model.sharding import ShardPool
 
 # Load .env file
 load_dotenv()
@@ -31,56 +46,344 @@ load_dotenv()
 # Initialize the Flask application
 app = Flask(__name__)
 CORS(app)
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger(__name__)
 
-# Create the user_list to store frontend input
-user_list = []
+# The most user profiles accepted by a single /api/submit/batch request
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '10000'))
+# The default and largest number of results returned per request
+DEFAULT_K = 5
+MAX_K = int(os.getenv('MAX_K', '50'))
+
+# Use the os module to create a portable path for our JSON file, which
+# CLEAN_PATH can override (e.g. to serve a benchmark corpus)
+clean_path = os.getenv('CLEAN_PATH', os.path.join(
+    os.path.dirname(__file__), 'json_files', 'cleaned_listings.json'))
+# Score very large corpora across SCORING_SHARDS worker processes
+SCORING_SHARDS = int(os.getenv('SCORING_SHARDS', '1'))
+shard_pool = ShardPool(SCORING_SHARDS) if SCORING_SHARDS > 1 else None
+# Cache the rankings of recently submitted profiles for a few minutes
+result_cache = ResultCache(int(os.getenv('RESULT_CACHE_SIZE', '4096')),
+                           float(os.getenv('RESULT_CACHE_TTL', '300')))
+# Load the corpus and its recommender index once for the whole process,
+# checking for a new cleaned_listings.json at most every few seconds. New
+# listings are added to the index as delta segments until it is compacted.
+# INDEX_HASH_FEATURES hashes the text fields instead of keeping their
+# vocabularies, for corpora too large to hold them in memory. The first
+# load runs in the background unless CORPUS_BACKGROUND_LOAD is 0
+index_options = {'hash_features': int(os.getenv('INDEX_HASH_FEATURES', '0'))}
+corpus_cache = CorpusCache(
+    clean_path, float(os.getenv('CORPUS_CHECK_INTERVAL', '2')),
+    loader=partial(load_index, **index_options),
+    on_reload=[lambda snapshot: result_cache.clear()],
+    updater=update_index,
+    background=os.getenv('CORPUS_BACKGROUND_LOAD', '1') != '0',
+    ready_timeout=float(os.getenv('CORPUS_READY_TIMEOUT', '10')))
+
+# The metrics served on /metrics in the Prometheus text format
+metrics = Registry()
+request_seconds = metrics.histogram(
+    'jhai_request_seconds', 'Time spent serving each request.',
+    ('endpoint',))
+stage_seconds = metrics.histogram(
+    'jhai_stage_seconds', 'Time spent in each stage of /api/submit.',
+    ('stage',))
+metrics.sampled('jhai_result_cache_hits_total',
+                'Rankings served from the result cache.', 'counter',
+                lambda: result_cache.hits)
+metrics.sampled('jhai_result_cache_misses_total',
+                'Rankings that had to be scored.', 'counter',
+                lambda: result_cache.misses)
+metrics.sampled('jhai_result_cache_entries',
+                'Profiles held in the result cache.', 'gauge',
+                lambda: len(result_cache))
+metrics.sampled('jhai_corpus_reloads_total',
+                'Times a new cleaned_listings.json was loaded.', 'counter',
+                lambda: corpus_cache.reloads)
+metrics.sampled('jhai_corpus_compactions_total',
+                'Times the segments of the index were refitted as one.',
+                'counter', lambda: corpus_cache.compactions)
+metrics.sampled('jhai_corpus_ready',
+                'Whether the corpus has been loaded.', 'gauge',
+                lambda: int(corpus_cache.ready))
+metrics.sampled('jhai_corpus_listings',
+                'Job listings in the current corpus.', 'gauge',
+                lambda: len(corpus_cache.snapshot().index)
+                if corpus_cache.ready else 0)
+
+
+def check_profile(user_data):
+    """A helper function that checks every field of a user profile is a
+    string or a list of strings, as the frontend sends them."""
+    if not isinstance(user_data, dict):
+        raise ValueError('A user profile must be a JSON object')
+    for key in PROFILE_KEYS:
+        value = user_data.get(key, [])
+        if isinstance(value, str):
+            continue
+        if not isinstance(value, list) or not all(
+                isinstance(item, str) for item in value):
+            raise ValueError(f'{key} must be a string or a list of strings')
+
+
+def read_paging(data):
+    """A helper function that reads the k and offset request parameters,
+    from the query string or else from the JSON body, so the frontend can
+    ask for more results ("load more") and checks they are in range."""
+    body = data if isinstance(data, dict) else {}
+    k = int(request.args.get('k', body.get('k', DEFAULT_K)))
+    offset = int(request.args.get('offset', body.get('offset', 0)))
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f'k must be between 1 and {MAX_K}')
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+    return k, offset
+
+
+def read_flag(data, name):
+    """A helper function that reads a true/false request parameter from the
+    query string or else from the JSON body."""
+    body = data if isinstance(data, dict) else {}
+    value = request.args.get(name, body.get(name, False))
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def read_fields(data):
+    """A helper function that reads the fields= request parameter, a comma
+    separated string or a list of the listing fields to return, or None
+    to return whole listings."""
+    body = data if isinstance(data, dict) else {}
+    fields = request.args.get('fields', body.get('fields'))
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',')]
+    if fields is not None and not (isinstance(fields, list) and all(
+            isinstance(field, str) for field in fields)):
+        raise ValueError('fields must be a list of field names')
+    return fields or None
+
+
+def pick_fields(rankings, fields=None, summary=False):
+    """A helper function that keeps only the listed fields of every ranked
+    listing (all of them when fields is None) and, in summary mode,
+    shortens their descriptions as the summary payloads do."""
+    picked = [job if fields is None else {
+        field: job[field] for field in fields if field in job}
+        for job in rankings]
+    if summary:
+        picked = [dict(job, description=summarize(job['description']))
+                  if 'description' in job else job for job in picked]
+    return picked
+
+
+def read_weights(data):
+    """A helper function that reads the weights= request parameter, which
+    overrides the weight of some fields for this request: an object in the
+    JSON body, or e.g. weights=sector:0.5,text:0.2 in the query string.
+    Returns None to keep the default weights."""
+    body = data if isinstance(data, dict) else {}
+    weights = request.args.get('weights', body.get('weights'))
+    if isinstance(weights, str):
+        pairs = [pair.split(':') for pair in weights.split(',') if pair]
+        if not all(len(pair) == 2 for pair in pairs):
+            raise ValueError('weights must look like sector:0.5,text:0.2')
+        weights = {name.strip(): float(value) for name, value in pairs}
+    if weights is not None and not isinstance(weights, dict):
+        raise ValueError('weights must map field names to numbers')
+    return field_weights(weights) if weights else None
+
+
+def read_engine(data):
+    """A helper function that reads which retrieval engine to use: "exact"
+    (the default) scores every listing, "ann" only re-ranks the best
+    candidates by label and text and stays fast on very large corpora."""
+    body = data if isinstance(data, dict) else {}
+    engine = request.args.get('engine', body.get('engine', 'exact'))
+    if engine not in ENGINES:
+        raise ValueError(f'engine must be one of {", ".join(ENGINES)}')
+    return engine
+
+
+@app.before_request
+def start_timer():
+    """A function that starts timing the stages of the request."""
+    g.timer = RequestTimer()
+    g.timer_token = current_timer.set(g.timer)
+
+
+@app.after_request
+def record_timings(response):
+    """A function that records the request's stage timings in the
+    histograms, and sends them back in a Server-Timing header when the
+    caller asked for them."""
+    timer = g.get('timer')
+    if timer is None or request.endpoint in (None, 'metrics_endpoint',
+                                             'ready'):
+        return response
+    request_seconds.observe(timer.total(), endpoint=request.endpoint)
+    if request.endpoint == 'submit':
+        for name, seconds in timer.stages.items():
+            stage_seconds.observe(seconds, stage=name)
+    if read_flag(None, 'timing') or request.headers.get(
+            'X-Server-Timing', '').lower() in ('1', 'true', 'yes', 'on'):
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+@app.teardown_request
+def stop_timer(error=None):
+    """A function that detaches the request's timer from the thread."""
+    token = g.pop('timer_token', None)
+    if token is not None:
+        current_timer.reset(token)
+
+
+@app.errorhandler(CorpusNotReady)
+def corpus_not_ready(error):
+    """A function that answers requests that timed out waiting for the
+    first load of the corpus with 503 Service Unavailable."""
+    logger.warning('Corpus not ready: %s', error)
+    response = jsonify({'Error': 'The job listings are still loading'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+# Tell the load balancer when this instance can serve requests
+@app.route('/ready', methods=['GET'])
+def ready():
+    """A function that returns 200 with the corpus version and size once
+    the corpus is loaded, and 503 until then."""
+    if not corpus_cache.ready:
+        return jsonify({'ready': False}), 503
+    snapshot = corpus_cache.snapshot()
+    return jsonify({'ready': True, 'version': snapshot.version,
+                    'listings': len(snapshot.index),
+                    'loaded_at': snapshot.loaded_at})
+
+
+# Serve the metrics to Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """A function that returns the request metrics in the Prometheus text
+    exposition format."""
+    return Response(metrics.render(),
+                    mimetype='text/plain; version=0.0.4')
 
 
 # Set our API endpoint from the frontend to /api/submit
 @app.route('/api/submit', methods=['POST'])
 def submit():
     """A function that takes in user input from the frontend, converts
-    the response to JSON format, appends that data to a Python list,
-    then loads this list and the cleaned_listings.json file into our ML
-    model, job_recommender(), and returns the output to the frontend."""
-    # Use the os module to create a portable path for our JSON file
-    # Clear the list so the status message refreshes properly
-    user_list.clear()
-    clean_path = os.path.join(os.path.dirname(__file__),
-                              'json_files', 'cleaned_listings.json')
+    the response to JSON format, then passes it and the cached snapshot of
+    the cleaned_listings.json file into our ML model, job_recommender(),
+    and returns the output to the frontend. The request only reads its own
+    input and the shared read-only model, so it is safe to serve from many
+    threads at once."""
     # Implement try / catch block when assigning the incoming response
     try:
-        data = request.get_json()
-        if data is None:
+        with stage('parse'):
+            data = request.get_json()
+        if not isinstance(data, dict):
             raise ValueError('No user input found')
+        check_profile(data)
+        k, offset = read_paging(data)
+        # Strict mode only returns listings matching every checkbox field
+        strict = read_flag(data, 'strict')
+        engine = read_engine(data)
+        # Explain mode adds each listing's per-field score breakdown
+        explain = read_flag(data, 'explain')
+        # Summary mode shortens the descriptions, fields picks the fields
+        summary = read_flag(data, 'summary')
+        fields = read_fields(data)
+        # Weights override how much each field counts towards the score
+        weights = read_weights(data)
     except Exception as error:
-        print(f'Error parsing data: {error}')
+        logger.info('Rejected /api/submit request: %s', error)
         return jsonify({'Error': f'Invalid JSON data: {error}'}), 400
 
-    # Confirm receipt of the data
-    print('\nSuccessfully received data from frontend.\n')
+    # Implement Try / Except block if unable to run the model
+    try:
+        # Take one snapshot so a reload cannot change the corpus mid-request
+        with stage('corpus'):
+            snapshot = corpus_cache.snapshot()
+        # Call the ML model with this request's input in try/except
+        options = {'index': snapshot.index, 'k': k, 'offset': offset,
+                   'strict': strict, 'cache': result_cache,
+                   'engine': engine, 'shards': shard_pool,
+                   'explain': explain, 'weights': weights}
+        if fields is None:
+            payload = job_recommender_json(data, summary=summary, **options)
+        else:
+            parsed_rankings = job_recommender(data, **options)
+    except IOError as error:
+        logger.error('Error running /api/submit: %s', error)
+        return jsonify(
+            {'Error': f'Error reading or running data: {error}'}), 500
+
+    # Return the parsed rankings to the frontend
+    with stage('serialize'):
+        if fields is None:
+            return Response(payload, mimetype='application/json')
+        if explain:
+            fields = fields + ['explanation']
+        return jsonify(pick_fields(parsed_rankings, fields, summary))
+
 
-    # Append the received data to the user_list
-    user_list.append(data)
-    print(f'Data successfully written to list:, {user_list}\n')
+# Serve the full listing behind a summary result
+@app.route('/api/listing/<path:job_id>', methods=['GET'])
+def listing(job_id):
+    """A function that returns the full listing with the given job_id from
+    the current corpus, e.g. the whole description of a summary result."""
+    index = corpus_cache.snapshot().index
+    row = index.find(job_id)
+    if row is None:
+        return jsonify({'Error': f'No listing with job_id {job_id}'}), 404
+    return Response(index.fragments(None, [row])[0],
+                    mimetype='application/json')
 
-    # Implement Try / Except block if unable to read cleaned_listings.json
+
+# Set our batch API endpoint for the email digest job and load tests
+@app.route('/api/submit/batch', methods=['POST'])
+def submit_batch():
+    """A function that takes in a list of user profiles, either as the JSON
+    body itself or under a "users" key, scores all of them together with
+    job_recommender_batch() and returns one list of rankings per user,
+    shortened by summary= and fields= as for /api/submit."""
     try:
-        # Load Scraped Jobs From jobs.json (read mode)
-        with open(clean_path, 'r') as jobFile:
-            job_listings = json.load(jobFile)
+        data = request.get_json()
+        users = data.get('users') if isinstance(data, dict) else data
+        if not isinstance(users, list):
+            raise ValueError('Expected a list of user profiles')
+        for user in users:
+            check_profile(user)
+        if len(users) > MAX_BATCH_SIZE:
+            raise ValueError(f'At most {MAX_BATCH_SIZE} profiles per batch')
+        k, offset = read_paging(data)
+        weights = read_weights(data)
+        summary = read_flag(data, 'summary')
+        fields = read_fields(data)
+    except Exception as error:
+        logger.info('Rejected /api/submit/batch request: %s', error)
+        return jsonify({'Error': f'Invalid JSON data: {error}'}), 400
 
-        # Call the ML model with the most recent item in list in try/except
-        parsed_rankings = job_recommender(user_list[-1], job_listings)
+    # Implement Try / Except block if unable to run the model
+    try:
+        snapshot = corpus_cache.snapshot()
+        parsed_rankings = job_recommender_batch(
+            users, index=snapshot.index, k=k, offset=offset,
+            weights=weights)
     except IOError as error:
-        print(f'Error: {error}')
+        logger.error('Error running /api/submit/batch: %s', error)
         return jsonify(
             {'Error': f'Error reading or running data: {error}'}), 500
 
-    # Return the parsed rankings to the frontend and print success message
-    print('Data successfully sent to frontend\n')
-    return jsonify(parsed_rankings)
+    logger.info('Batch of %d rankings sent', len(users))
+    return jsonify([pick_fields(rankings, fields, summary)
+                    for rankings in parsed_rankings])
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0')
+    # The development server; production runs under gunicorn.conf.py
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5000')),
+            threaded=True)
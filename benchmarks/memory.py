@@ -0,0 +1,118 @@
+# Job Hunting AI Tool: memory.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# Reports what the storage options of the recommender index (see
+# DEFAULT_OPTIONS in model/recommender.py) cost and save. The same corpus
+# is indexed once per configuration: the original float64 matrices with
+# unbounded vocabularies, float32 storage, float32 with capped
+# vocabularies, and float32 with hashed fields. For each one the report
+# lists the bytes of every free text field (matrix, vocabulary and idf
+# weights) and the ranking overlap with the float64 model: the share of
+# its top k listings that the configuration also returns, averaged over
+# random user profiles.
+#
+#     python benchmarks/memory.py
+#     python benchmarks/memory.py --size 100000 --queries 500
+#
+# Source:
+# 1.) Scikit-learn: https://scikit-learn.org/stable/modules/
+# feature_extraction.html#vectorizing-a-large-text-corpus-with-the-
+# hashing-trick
+
+# Imports: argparse, json, os, sys and time
+import argparse
+import json
+import os
+import sys
+import time
+
+# The project root, which holds app.py, model/ and data/
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.run import random_profiles  # noqa: E402
+from model.recommender import RecommenderIndex, read_listings  # noqa: E402
+
+CLEAN_PATH = os.path.join(ROOT_DIR, 'json_files', 'cleaned_listings.json')
+
+# The index options compared, the first one being the reference
+CONFIGURATIONS = {
+    'float64': {'dtype': 'float64', 'max_features': {}},
+    'float32': {'max_features': {}},
+    'float32_capped': {'max_features': {'description': 5000,
+                                        'text': 20000}},
+    'float32_hashed': {'hash_features': 2 ** 16}}
+
+
+def synthetic_listings(size):
+    """Generates and cleans size synthetic listings."""
+    from benchmarks.synthetic import load_generator
+    from data.clean_data import clean_data
+    return clean_data(list(load_generator().listings(size)))
+
+
+def overlap(index, reference, profiles, k):
+    """Returns the average share of the reference's top k listings that the
+    index also ranks in its top k."""
+    shares = []
+    for user_data in profiles:
+        expected = set(reference.rank(user_data, k).tolist())
+        found = set(index.rank(user_data, k).tolist())
+        shares.append(len(expected & found) / max(len(expected), 1))
+    return sum(shares) / len(shares)
+
+
+def memory_report(job_listings, profiles, k=10,
+                  configurations=CONFIGURATIONS):
+    """Builds the index of job_listings with every configuration and
+    returns its bytes per field and its ranking overlap with the first."""
+    report, reference = {}, None
+    for name, options in configurations.items():
+        start = time.perf_counter()
+        index = RecommenderIndex.build(job_listings, **options)
+        fields = index.nbytes()
+        report[name] = {
+            'build_seconds': time.perf_counter() - start,
+            'fields': fields,
+            'total_bytes': sum(sum(field.values())
+                               for field in fields.values())}
+        if reference is None:
+            reference = index
+        report[name][f'overlap_at_{k}'] = overlap(index, reference,
+                                                  profiles, k)
+    return report
+
+
+def parse_args(argv=None):
+    """Reads the command line options of the report."""
+    parser = argparse.ArgumentParser(
+        description='Compare the memory of the index storage options')
+    parser.add_argument('--input', default=CLEAN_PATH,
+                        help='the cleaned listings to index')
+    parser.add_argument('--size', type=int,
+                        help='index this many synthetic listings instead')
+    parser.add_argument('--queries', type=int, default=200,
+                        help='user profiles used for the overlap')
+    parser.add_argument('-k', type=int, default=10,
+                        help='the number of results compared per profile')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Prints the memory report as JSON."""
+    args = parse_args(argv)
+    if args.size:
+        job_listings = synthetic_listings(args.size)
+    else:
+        job_listings, _ = read_listings(args.input)
+    report = memory_report(job_listings, random_profiles(args.queries),
+                           args.k)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
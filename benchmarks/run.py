@@ -0,0 +1,323 @@
+# Job Hunting AI Tool: run.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# The benchmark harness. For every corpus size it generates synthetic raw
+# listings (synthetic.py) and measures:
+#   - clean_data.clean_data() throughput in listings/sec,
+#   - fitting and saving the recommender index, and loading it back,
+#   - the latency of job_recommender() with the exact and ann engines,
+#   - the latency of /api/submit through the Flask test client,
+#   - the cold start of app.py in a fresh process: the import time, the
+#     time until the corpus is loaded, and whether scikit-learn or pandas
+#     were imported on the way,
+#   - the peak resident memory of the process.
+# Latencies are reported as p50/p95/p99 in milliseconds. Each size runs in
+# a fresh Python process so its peak memory is its own. The results are
+# written as JSON, and compared against a stored baseline: a metric that
+# is worse than the baseline by more than the tolerance fails the run, and
+# so does an import of app.py slower than IMPORT_BUDGET_MS.
+#
+#     python benchmarks/run.py --sizes 1000,10000
+#     python benchmarks/run.py --save-baseline
+#
+# Source:
+# 1.) resource Documentation: https://docs.python.org/3/library/
+# resource.html#resource.getrusage
+
+# Imports: argparse, json, os, random, resource, subprocess, sys, tempfile
+# and time
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# The project root, which holds app.py, model/ and data/
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT_DIR)
+
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# Cleaning is timed as the best of a few runs, and the latencies after a
+# few untimed warm-up calls, to keep the numbers stable between runs
+CLEAN_REPEATS = 3
+WARMUP_CALLS = 5
+
+# The most time importing app.py may take, and the libraries that must not
+# be imported to serve a saved index
+IMPORT_BUDGET_MS = 1000
+HEAVY_MODULES = ('sklearn', 'pandas')
+
+# Run in a fresh process to time the cold start of app.py: importing it,
+# waiting for the corpus and serving a first request (sys.argv[1])
+COLD_START_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.corpus_cache.snapshot()
+ready = time.perf_counter()
+app.app.test_client().post('/api/submit', json=json.loads(sys.argv[1]))
+print(json.dumps({
+    'import_ms': 1000 * (imported - start),
+    'ready_ms': 1000 * (ready - start),
+    'modules': sorted({name.split('.')[0] for name in sys.modules})}))
+'''
+
+# The metrics compared with the baseline, and whether higher is better.
+# The median latencies are compared since the tails are noisy on shared
+# machines; p95 and p99 are still reported
+COMPARED = {('clean', 'listings_per_sec'): True,
+            ('recommender', 'p50_ms'): False,
+            ('recommender_ann', 'p50_ms'): False,
+            ('api', 'p50_ms'): False,
+            ('cold_start', 'import_ms'): False,
+            ('cold_start', 'ready_ms'): False,
+            ('peak_rss_mb',): False}
+
+# The choices used to build random user profiles
+PROFILE_CHOICES = {
+    'jobType': ['Full-time', 'Part-time', 'Internship', 'Contractor'],
+    'arrangement': ['Remote', 'Hybrid', 'On-site'],
+    'sector': ['Technology', 'Finance', 'Healthcare', 'Education',
+               'Real Estate', 'Energy'],
+    'experience': ['Entry-Level', 'Junior-Level', 'Intermediate-Level',
+                   'Senior-Level']}
+TEXT_WORDS = ['python', 'java', 'sql', 'cloud', 'react', 'data', 'machine',
+              'learning', 'security', 'network', 'frontend', 'backend',
+              'nurse', 'finance', 'design', 'testing', 'mobile', 'devops']
+
+
+def random_profiles(count, seed=467):
+    """Returns count random user profiles like the frontend sends, half of
+    them with an empty textInput."""
+    rng = random.Random(seed)
+    profiles = []
+    for _ in range(count):
+        profile = {key: rng.sample(values, rng.randint(1, 2))
+                   for key, values in PROFILE_CHOICES.items()}
+        profile['experience'] = profile['experience'][0]
+        profile['textInput'] = ' '.join(rng.sample(TEXT_WORDS, 3)) if (
+            rng.random() < 0.5) else ''
+        profiles.append(profile)
+    return profiles
+
+
+def latency_summary(samples):
+    """Returns the p50, p95 and p99 latencies (ms) and the throughput of a
+    list of per-call durations in seconds."""
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return 1000 * ordered[min(len(ordered) - 1,
+                                  int(fraction * len(ordered)))]
+    return {'calls': len(samples), 'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99),
+            'per_sec': len(samples) / sum(samples) if sum(samples) else 0}
+
+
+def timed_calls(function, arguments):
+    """Calls function once per argument and returns the durations, after
+    a few untimed warm-up calls."""
+    for argument in arguments[:WARMUP_CALLS]:
+        function(argument)
+    samples = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def cold_start(clean_path):
+    """Imports app.py in a fresh process serving clean_path and returns
+    how long the import and the first load of the corpus took, and which
+    of HEAVY_MODULES were imported by then or by a first request."""
+    env = dict(os.environ, CLEAN_PATH=clean_path, LOG_LEVEL='WARNING',
+               CORPUS_READY_TIMEOUT='600')
+    output = subprocess.run(
+        [sys.executable, '-c', COLD_START_SCRIPT,
+         json.dumps(random_profiles(1)[0])],
+        check=True, capture_output=True, text=True, cwd=ROOT_DIR,
+        env=env).stdout
+    results = json.loads(output.strip().splitlines()[-1])
+    modules = results.pop('modules')
+    results['heavy_modules'] = [name for name in HEAVY_MODULES
+                                if name in modules]
+    return results
+
+
+def peak_rss_mb():
+    """Returns the peak resident memory of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+
+def run_size(size, queries, use_cache=False):
+    """Runs every benchmark for one corpus size in this process."""
+    from benchmarks.synthetic import load_generator
+    from data.clean_data import clean_data, save_cleaned_data
+    from model.recommender import default_index_path, fit_index, load_index
+    from model.recommender import job_recommender
+
+    results = {'size': size}
+    raw = list(load_generator().listings(size))
+    # The best of a few runs, since a single run is noisy at small sizes
+    seconds = []
+    for _ in range(CLEAN_REPEATS):
+        start = time.perf_counter()
+        cleaned = clean_data(raw)
+        seconds.append(time.perf_counter() - start)
+    results['clean'] = {'seconds': min(seconds),
+                        'listings_per_sec': size / min(seconds)}
+    del raw
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clean_path = os.path.join(tmp, 'cleaned_listings.json')
+        save_cleaned_data(clean_path, cleaned)
+        del cleaned
+        start = time.perf_counter()
+        fit_index(clean_path).save(default_index_path(clean_path))
+        results['index'] = {'build_seconds': time.perf_counter() - start}
+        start = time.perf_counter()
+        index = load_index(clean_path)
+        results['index']['load_ms'] = 1000 * (time.perf_counter() - start)
+        results['cold_start'] = cold_start(clean_path)
+
+        profiles = random_profiles(queries)
+        for engine in ('exact', 'ann'):
+            samples = timed_calls(
+                lambda user: job_recommender(user, index=index,
+                                             engine=engine), profiles)
+            name = 'recommender' if engine == 'exact' else 'recommender_ann'
+            results[name] = latency_summary(samples)
+
+        # Point the app at the synthetic corpus before importing it
+        os.environ['CLEAN_PATH'] = clean_path
+        if not use_cache:
+            os.environ['RESULT_CACHE_SIZE'] = '0'
+        import app
+        client = app.app.test_client()
+        results['api'] = latency_summary(timed_calls(
+            lambda user: client.post('/api/submit', json=user), profiles))
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def metric(results, path):
+    """Returns the value at a path of keys in a results dict, or None."""
+    for key in path:
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns a message for every metric that regressed by more than the
+    tolerance (a fraction) against the baseline run of the same size, or
+    whose cold start is over budget."""
+    regressions = []
+    baselines = {run['size']: run for run in baseline.get('runs', [])}
+    for run in results['runs']:
+        import_ms = metric(run, ('cold_start', 'import_ms'))
+        if import_ms is not None and import_ms > IMPORT_BUDGET_MS:
+            regressions.append(
+                f"size {run['size']}: importing app.py took "
+                f'{import_ms:.0f} ms, budget {IMPORT_BUDGET_MS} ms')
+        for name in metric(run, ('cold_start', 'heavy_modules')) or []:
+            regressions.append(
+                f"size {run['size']}: serving imported {name}")
+        reference = baselines.get(run['size'])
+        if reference is None:
+            continue
+        for path, higher_is_better in COMPARED.items():
+            current, expected = metric(run, path), metric(reference, path)
+            if current is None or expected is None:
+                continue
+            if higher_is_better:
+                regressed = current < expected / (1 + tolerance)
+            else:
+                regressed = current > expected * (1 + tolerance)
+            if regressed:
+                regressions.append(
+                    f"size {run['size']}: {'.'.join(path)} is "
+                    f'{current:.4g}, baseline {expected:.4g}')
+    return regressions
+
+
+def parse_args(argv=None):
+    """Reads the command line options of the harness."""
+    parser = argparse.ArgumentParser(description='Run the benchmarks')
+    parser.add_argument('--sizes', default='1000',
+                        help='comma separated corpus sizes, e.g. 1000,10000')
+    parser.add_argument('--queries', type=int, default=200,
+                        help='user profiles timed per benchmark')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the API result cache enabled')
+    parser.add_argument('--output', default=os.path.join(
+        BENCHMARK_DIR, 'results.json'), help='where the results go')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='allowed regression against the baseline')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    # Used internally to run a single size in a child process
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs every size in its own process, writes the results and compares
+    them with the baseline. Returns 1 if anything regressed."""
+    args = parse_args(argv)
+    if args.size:
+        print(json.dumps(run_size(args.size, args.queries, args.cache)))
+        return 0
+
+    runs = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        command = [sys.executable, os.path.abspath(__file__),
+                   '--size', str(size), '--queries', str(args.queries)]
+        if args.cache:
+            command.append('--cache')
+        output = subprocess.run(command, check=True, capture_output=True,
+                                text=True, cwd=BENCHMARK_DIR).stdout
+        # The app prints while serving, the results are the last line
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+        print(json.dumps(runs[-1], indent=2))
+    results = {'python': sys.version.split()[0], 'queries': args.queries,
+               'runs': runs}
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+    else:
+        print('No baseline to compare with, run with --save-baseline')
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'Regression: {regression}')
+    if not regressions:
+        print('No regressions against the baseline.')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
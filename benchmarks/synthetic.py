@@ -0,0 +1,119 @@
+# Job Hunting AI Tool: synthetic.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# Generates synthetic job listings in the google_listings.json schema for
+# the benchmarks, at any size from a thousand to millions of listings.
+# Every listing is a random recombination of the parts of the real
+# listings in json_files/google_listings.json: titles, companies and
+# locations, description sentences, job highlight items, schedule types
+# and apply options. The vocabulary and lengths therefore look like real
+# scrapes, the cleaning heuristics fire as often as on real data, and the
+# same seed always gives the same listings. Large corpora can be streamed
+# to a JSON Lines file without holding them in memory.
+#
+# Source:
+# 1.) random Documentation: https://docs.python.org/3/library/random.html
+
+# Imports: argparse, json, os, random and re
+import argparse
+import json
+import os
+import random
+import re
+
+# The project root, which holds the json_files directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_PATH = os.path.join(ROOT_DIR, 'json_files', 'google_listings.json')
+
+# Descriptions are split into sentences, which are shuffled together
+SENTENCE = re.compile(r'(?<=[.!?\n])\s+')
+
+
+class ListingGenerator:
+    """Recombines the parts of a list of real listings into new ones."""
+
+    def __init__(self, seed_listings, seed=467):
+        self.random = random.Random(seed)
+        self.titles = [job['title'] for job in seed_listings]
+        self.companies = [job['company_name'] for job in seed_listings]
+        self.locations = [job.get('location', '') for job in seed_listings]
+        self.vias = [job.get('via', '') for job in seed_listings]
+        self.extensions = [job.get('detected_extensions', {})
+                           for job in seed_listings]
+        self.sentences = [sentence for job in seed_listings
+                          for sentence in SENTENCE.split(
+                              job.get('description', '')) if sentence]
+        self.lengths = [len(SENTENCE.split(job.get('description', '')))
+                        for job in seed_listings]
+        self.highlights = {}
+        for job in seed_listings:
+            for highlight in job.get('job_highlights', []):
+                self.highlights.setdefault(highlight['title'], []).extend(
+                    highlight.get('items', []))
+
+    def listing(self, number):
+        """Returns the number-th synthetic listing."""
+        choice = self.random.choice
+        description = ' '.join(self.random.choices(
+            self.sentences, k=max(1, choice(self.lengths))))
+        highlights = [
+            {'title': title,
+             'items': self.random.sample(items, min(len(items), 4))}
+            for title, items in self.highlights.items()
+            if self.random.random() < 0.8]
+        via = choice(self.vias)
+        detected = dict(choice(self.extensions))
+        return {
+            'title': choice(self.titles),
+            'company_name': choice(self.companies),
+            'location': choice(self.locations),
+            'via': via,
+            'extensions': [str(value) for value in detected.values()],
+            'detected_extensions': detected,
+            'description': description,
+            'job_highlights': highlights,
+            'apply_options': [{'title': via,
+                               'link': f'https://example.com/jobs/{number}'}],
+            'job_id': f'synthetic-{number}'}
+
+    def listings(self, count):
+        """Yields count synthetic listings."""
+        for number in range(count):
+            yield self.listing(number)
+
+
+def load_generator(seed=467, seed_path=SEED_PATH):
+    """Returns a ListingGenerator seeded with the real listings."""
+    with open(seed_path, 'r') as file:
+        return ListingGenerator(json.load(file), seed)
+
+
+def write_listings(path, listings):
+    """Writes listings as a JSON array, or one per line to a .jsonl path."""
+    with open(path, 'w') as file:
+        if path.endswith('.jsonl'):
+            for job in listings:
+                file.write(json.dumps(job) + '\n')
+        else:
+            json.dump(list(listings), file, indent=2)
+
+
+def main(argv=None):
+    """Writes a synthetic corpus of the requested size."""
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic listings like google_listings.json')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=467)
+    parser.add_argument('--output', default='synthetic_listings.jsonl',
+                        help='a .json or streamed .jsonl file')
+    args = parser.parse_args(argv)
+    write_listings(args.output,
+                   load_generator(args.seed).listings(args.count))
+    print(f'{args.count} synthetic listings written to {args.output}!')
+
+
+if __name__ == '__main__':
+    main()
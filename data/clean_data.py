@@ -11,14 +11,60 @@
 # cleaned_listings.json The purpose of this script is to prepare
 # the raw data for processing in our job recommender algorithm.
 #
+# With --incremental the script streams the raw listings (JSON Lines input
+# is read one line at a time) and keeps a cache of cleaned listings in a
+# small SQLite database, one row per input position, looked up by the hash
+# of the raw content. Listings whose raw content has not changed since the
+# last run are not cleaned again, only new or changed listings are
+# cleaned, and listings missing from the new scrape are dropped. Listings
+# that share a job_id are all kept, as in the full mode.
+# cleaned_listings.json is then streamed out of the cache, so a daily
+# scrape where few listings change costs little work and constant memory.
+#
+# After cleaning, the script also fits the recommender and writes its binary
+# index (recommender_index.bin) next to the output, so the app can memory
+# map it on startup instead of parsing and fitting. --no-index skips this,
+# and --hash-features N hashes the text fields into N columns instead of
+# keeping their vocabularies (the app must set INDEX_HASH_FEATURES to the
+# same N, or it fits the index again).
+#
+# The regex heuristics below are CPU-bound, so --workers N shards the
+# listings in chunks across a pool of N processes. The output keeps the
+# input order, and the throughput is reported in listings/sec.
+#
 # Source:
 # 1.) re Documentation: https://docs.python.org/3/library/re.html
+# 2.) sqlite3 Documentation: https://docs.python.org/3/library/sqlite3.html
+# 3.) concurrent.futures Documentation: https://docs.python.org/3/library/
+# concurrent.futures.html#processpoolexecutor
 
 
-# Imports: json os, and re for regex operations
+# Imports: argparse, hashlib, json, os, re for regex operations, sqlite3
+# for the incremental cache and time to measure throughput
+import argparse
+import hashlib
 import json
 import os
 import re
+import sqlite3
+import sys
+import time
+# Used to clean listings in parallel on several cores
+from concurrent.futures import ProcessPoolExecutor
+
+# The project root, which holds the json_files directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Allow the script to import model/ when it is run from the data directory
+sys.path.insert(0, ROOT_DIR)
+
+from model.recommender import (  # noqa: E402
+    default_index_path, fit_index)
+
+# The number of changed listings cleaned and written to the cache at once
+CHUNK_SIZE = 256
+# Bumped whenever the layout of the cache changes, so older caches are
+# dropped and rebuilt
+CACHE_VERSION = 2
 
 
 def load_data(path):
@@ -30,44 +76,420 @@ def load_data(path):
         print(f"Error loading '{path}' file due to: {error}")
 
 
+def iter_data(path):
+    """A generator that yields the raw listings one at a time. JSON Lines
+    files (.jsonl) are streamed line by line, a JSON array has to be
+    loaded in full first."""
+    if path.endswith('.jsonl'):
+        with open(path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from load_data(path) or []
+
+
+# Keywords for filter_arrangement(), matched as plain substrings
+REMOTE_WORDS = ('remote', 'work from home', 'work-from-home')
+REMOTE_LOCATION = ('anywhere',)
+HYBRID_WORDS = ('hybrid',)
+
+# Regex patterns for filter_experience(). Each one starts with \b or \s
+# followed by a literal word, which lets KeywordMatcher find them in a
+# single scan over the words of a text.
+ENTRY_LEVEL = [
+    r'\bentry level\b', r'\bentry-level\b', r'\binternship\b',
+    r'\bintern\b', r'\bintern\b', r'\bpursuing a bachelor\b',
+    r'\brecent graduate\b', r'\sde-1', r'\bSoftware Engineer I\b']
+JUNIOR_LEVEL = [
+    r'\bjunior\b', r'\b1-year\b', r'\b1 year\b', r'\b2-years\b',
+    r'\b2 years\b', r'\bbachelor\b', r"\bbachelor's\b",
+    r'\bbachelors\b']
+INT_LEVEL = [
+    r'\bintermediate level\b', r'\bintermediate-level\b',
+    r'\b3-year\b', r'\b3 year\b', r'\b4-year\b', r'\b4 year\b',
+    r'\sde-2', r'\bSoftware Engineer II\b']
+SENIOR_LEVEL = [
+    r'\sde-3', r'\bprincipal\b', r'\bsenior\b', r'\b5-year\b',
+    r'\b5 years\b', r'\b6-years\b', r'\b6 years\b', r'\b7-year\b',
+    r'\b7 years\b', r'\b8-years\b', r'\b8 years\b', r'\b9-years\b',
+    r'\b9 years\b', r'\b10-years\b', r'\b10 years\b', r'\bphd\b',
+    r'\bmasters\b', r'\bmasters degree\b', r'\bdoctorate\b',
+    r'\bph.d\b', r'\b5+\b', r'\b6+\b', r'\b7+\b',
+    r'\badvanced knowledge\b', r'\bSr\b', r'\bphd+\b', r'\bmasters+\b',
+    r'\btech lead\b', r'\bSenior\b', r'\bstaff software\b',
+    r'\bSoftware Engineer III\b']
+
+
+# Companies (and a few keywords) for filter_sector(), joined into one
+# case-insensitive regex per sector
+TECH_COMPANIES = ['Google', 'Microsoft', 'Apple', 'Amazon', 'Facebook',
+                  'Meta', 'IBM', 'Intel', 'Oracle',
+                  'Business Transformation Institute', 'robot',
+                  'Whisker Labs', 'T-Rex Solutions', 'Renewance',
+                  'VirtualVocations', 'Dice', 'Innovative Systems',
+                  'Daikin', 'Axiom Space', 'KBR', 'Motorola', 'NVIDIA',
+                  'Samsung', 'LG', 'Databento', 'Echo Global Logistics',
+                  'Sabanto', 'Wayve', 'Parallel Partners Inc', 'crypto',
+                  'Your Next Hire', 'Boeing', 'Clarivate', 'Garmin',
+                  'Leidos', 'Quora', 'Lambda', 'Palantir', 'Osaro, Inc',
+                  'Perpetual Solutions', 'Torii studio', 'H-E-B',
+                  'Tangerine Search', 'Katmai', 'TED Conference',
+                  'RAPS Consulting Inc', 'Lockheed Martin', 'Flexjobs',
+                  'Accelerated Connections', 'Naka Technologies',
+                  'Booz Allen Hamilton', 'HireTeq', 'nuArch', 'Boxed',
+                  'Elevate HR', 'RemoteWorker', 'Experis', 'Magna',
+                  'Tesla', 'BYD', 'Nio', 'Toyota', 'BMW', 'Honda', 'GM',
+                  'Chevrolet', 'Ford', 'WARNERMEDIA', 'Philips',
+                  'Tech Valley Talent', 'Coinbase', 'Block', 'Chewy',
+                  'Blockchain', 'Indium', 'Semgrep', 'Jesica.ai',
+                  'Jobot', 'Snowflake', 'Evolutyz', 'WATI',
+                  'IT TrailBlazers', 'ACS Consult', 'SpaceX',
+                  'Franklin Fitch', 'EROS Technologies Inc',
+                  'Azad, inc', 'Siemens', 'Wolters Kluwer',
+                  'Procom Consultants Group', 'ARCKIT', 'mindpal',
+                  'AditiStaffing', 'game', 'Sterling Engineering',
+                  'Activision Blizzard', 'Universal Orlando Resort',
+                  'QDStaff', 'ServiceNow', 'Universal Creative',
+                  'SambaNova Systems', 'WeWork', 'WEX', 'Bose',
+                  'NextPath', 'Nuro', 'Karkidi', 'BAE Systems',
+                  'Progression Inc.', 'Affiliated Engineers, Inc.',
+                  'Secunetics, inc.', 'Marriott FLEX', 'Taobao',
+                  'Department of Justice', 'bluestone', 'RTX',
+                  'Kavaliro', 'Fuel Talent', 'Insight Global',
+                  'V-Soft Consulting Group, Inc.', 'News Corp',
+                  'FL Innovation Connect', 'ALTTRIX CLOUD',
+                  'Crossroads Technologies', 'Disney', 'Adobe',
+                  'Solidus Labs', 'Yeah! Global', 'Fourier',
+                  'DoorDash', 'matchsource llc', 'Virtualitics',
+                  'American Traction Systems', 'Databricks',
+                  'Siri InfoSolutions Inc', 'Capgemini North America',
+                  '.ai', 'Openmesh Network', 'DecisionEngines',
+                  'Notion', 'The Job Network', 'Palo Alto Networks',
+                  r'\bAEG\b', 'Bosch', 'Synopsys', 'Autodesk',
+                  'Imperial Auto USA Corporation', 'Alibaba',
+                  'Keeper Security, Inc.', 'SDH Systems LLC',
+                  'Anywhere Real Estate', 'CPS Recruitment',
+                  'CrowdStrike', 'New York City', 'Infojini Inc',
+                  'NextPit GmbH', 'Conquest Technical Associates',
+                  'CEDENT',  'Eastridge', 'VANTA Partners, Inc',
+                  'Software People Inc.', 'AIYA TECHNOLOGY SYSTEM LLC',
+                  'Amentum', 'Month2Month.com', 'Airbnb', 'Fortinet',
+                  'Pacific Northwest National Laboratory', 'Fleetcor',
+                  'TikTok', 'Bytedance', 'Tencent', 'NASA', 'Dropbox',
+                  'Futronics', 'Accenture', 'Advanced Micro Devices',
+                  'Akamai Technologies', 'Amphenol', 'Analog Devices',
+                  'Ansys', 'Applied Materials', 'Arista Networks',
+                  'Autodesk', 'Automatic Data Processing', 'Corning',
+                  'Broadcom', 'Broadridge Financial Solutions',
+                  'Cadence Design Systems', 'CDW', 'Ceridian',
+                  'Cisco Systems', 'Citrix Systems', 'Enphase Energy',
+                  'Cognizant Technology Solutions', 'DXC Technology',
+                  'F5 Networks', 'Fiserv', 'Gartner', 'Global Payments',
+                  'Hewlett Packard Enterprise', 'Intuit', 'Xilinx',
+                  r'\bHP\b',  'Jack Henry & Associates', 'NetApp',
+                  'Juniper Networks', 'Keysight Technologies', 'NXP',
+                  'KLA Corporation', 'Lam Research', 'NortonLifeLock',
+                  'Microchip Technology', 'Micron Technology',
+                  'Monolithic Power Systems', 'IPG Photonics',
+                  r'\bPTC\b', 'Qorvo', 'Qualcomm', 'Zebra Technologies',
+                  'Salesforce', 'Seagate Technology', 'Teradyne',
+                  'Skyworks Solutions', 'Texas Instruments', 'Trimble',
+                  'TE Connectivity', 'Tyler Technologies', 'Verisign',
+                  'Western Digital']
+
+
+FIN_COMPANIES = ['Goldman Sachs', 'JPMorgan Chase', 'Morgan Stanley',
+                 'Stripe', 'Citibank', 'Wells Fargo', 'Robert Half',
+                 'Bank of America', 'BOA', 'Citadel', 'Jane Street',
+                 'Capital One', 'CSC', 'Countercyclical', 'Ramp',
+                 'Fidelity', 'State Street', 'ACL Digital', 'invest',
+                 'wall street', 'Esri', 'Geico', 'The Hartford',
+                 'Freddie Mac', 'Hartford Fire Ins. Co', 'Optiver',
+                 'BlackRock', 'Open Systems Technologies',
+                 'Mastercard', 'Visa', 'Selby Jennings', 'Cboe',
+                 'Early Warning', 'Kin Insurance', 'Valid8 Financial',
+                 'The D. E. Shaw Group', 'PDT Partners', 'Deshaw',
+                 'Paycom', 'Point72', 'RedShift', 'array',
+                 'Ejadah Management Consultancy', 'Allstate Corp',
+                 'Central Mutual Insurance Company', 'PayPal',
+                 'Cast & Crew', 'Cross River', 'financial',
+                 'Western Union', 'Aflac', 'Charles Schwab Corporation',
+                 'American Express', 'American International Group',
+                 'Ameriprise Financial', 'Aon', 'BNY Mellon',
+                 'Arthur J. Gallagher & Co.', 'Assurant',
+                 'Berkshire Hathaway',  'Cincinnati Financial',
+                 'Brown & Brown', 'Chubb', 'Citigroup', 'CME Group',
+                 'Citizens Financial Group', 'Discover Financial',
+                 'Comerica', 'Everest Re', 'Fifth Third Bancorp',
+                 'First Republic Bank', 'Franklin Resources',
+                 'Globe Life', 'Huntington Bancshares',
+                 'Intercontinental Exchange', 'Invesco',
+                 'KeyCorp', 'Willis Towers Watson', 'Marsh & McLennan',
+                 'Loews Corporation', 'M&T Bank', 'MarketAxess',
+                 'MetLife', "Moody's Corporation", 'Lincoln National',
+                 'Morgan Stanley', 'MSCI', 'Nasdaq', 'U.S. Bancorp',
+                 'Northern Trust', "People's United Financial",
+                 'PNC Financial Services', 'T. Rowe Price',
+                 'Principal Financial Group', 'SVB Financial',
+                 'Progressive Corporation', 'Prudential Financial',
+                 'Raymond James Financial', 'Zions Bancorp'
+                 'Regions Financial Corporation', 'S&P Global',
+                 'Synchrony Financial', 'W. R. Berkley Corporation',
+                 'The Travelers Companies', 'Truist Financial']
+
+
+HC_COMPANIES = ['Pfizer', 'Johnson & Johnson', 'Merck', 'Roche',
+                'med', 'Novartis' 'health', r'\bhealth\b',
+                'NYU Langone', 'Dana Farber', 'Anderson Cancer',
+                'Duke Cancer', 'Sidney Kimmel', 'MUFG',
+                'Emergent Holdings', 'Centene Corporation',
+                'bioscience', 'Veeva', 'pharm', 'WellSky',
+                'Akina', 'SmarterDx', 'MMIT', 'Healthcare',
+                'adonis',         'Abbott Laboratories',
+                'AbbVie', 'Abiomed', 'Agilent Technologies',
+                'Align Technology', 'AmerisourceBergen',
+                'Amgen', 'Anthem', 'Baxter International',
+                'Becton Dickinson', 'Bio-Rad Laboratories',
+                'Bio-Techne', 'Biogen', 'Boston Scientific',
+                'Bristol Myers Squibb', 'Cardinal Health',
+                'Catalent', 'Centene Corporation', 'Cerner',
+                'Charles River Laboratories', 'Cigna',
+                'CVS Health', 'Danaher Corporation',
+                'DaVita', 'Dentsply Sirona', 'DexCom',
+                'Edwards Lifesciences', 'Eli Lilly & Co',
+                'Gilead Sciences', 'HCA Healthcare',
+                'Henry Schein', 'Hologic', 'Humana',
+                'Idexx Laboratories', 'Illumina',
+                'Incyte', 'Intuitive Surgical', 'IQVIA',
+                'LabCorp', 'McKesson Corporation',
+                'Medtronic', 'Merck & Co.',
+                'Mettler Toledo', 'Moderna', 'Organon & Co.',
+                'PerkinElmer', 'Quest Diagnostics',
+                'Regeneron Pharmaceuticals', 'ResMed',
+                'Steris', 'Stryker Corporation', 'Teleflex',
+                'The Cooper Companies',
+                'Thermo Fisher Scientific', 'UnitedHealth Group',
+                'Universal Health Services',
+                'Vertex Pharmaceuticals', 'Viatris',
+                'Waters Corporation',
+                'West Pharmaceutical Services', 'Zimmer Biomet',
+                'Zoetis']
+
+HC_PHRASE = ['healthcare software']
+RE_COMPANIES = ['Walmart', 'Publix', 'Nordstrom', 'Target', 'Costco',
+                'Walgreens', "Lowe's", 'Aldi', 'Tesco', 'H&M',
+                'Best Buy', 'Adidas', 'Nike', 'IKEA',
+                'Estée Lauder', 'LVMH', 'Gucci', 'Burberry',
+                'Prada', 'General Mills', "Kellogg's", "Kimberly-Clark",
+                'Kraft Heinz', 'Kroger', 'Lamb Weston',
+                'McCormick & Company', 'Molson Coors',
+                'Mondelez International', 'Monster Beverage',
+                'Pepsi', 'Coca-Cola', 'Philip Morris',
+                'Procter & Gamble', 'P&G', 'P & G', 'Sysco',
+                'The Hershey Company', 'Tyson Foods', 'The Home Depot',
+                'JD.com', 'CVS Corporation', 'Aeon',
+                'Seven & I Holdings', 'Woolworths', 'Auchan',
+                "Macy's", 'Rite Aid', "Kohl's", 'Wayfair', 'The Gap',
+                'Decathlon', 'Coupang']
+
+EN_COMPANIES = ['ExxonMobil', 'Chevron', 'Shell', 'BP',
+                'ConocoPhillips', 'SLB', 'oxy', 'Valero Energy',
+                'Con Edison Company of New York',
+                'Universe Energy, Inc.', 'APA Corporation',
+                'Baker Hughes', 'Coterra', 'Devon Energy',
+                'Diamondback Energy', 'EOG Resources', 'Oneok',
+                'Halliburton', 'Hess Corporation', 'Phillips 66',
+                'Kinder Morgan', 'Marathon Oil', 'Schlumberger',
+                'Marathon Petroleum', 'Occidental Petroleum',
+                'Pioneer Natural Resources', 'Williams Companies']
+
+
+EDU_COMPANIES = ['Pearson', 'McGraw-Hill', 'Cengage', 'udacity',
+                 'Houghton Mifflin Harcourt', 'Coursera',
+                 'Synergistic IT', 'jobsbridge', 'Apollo Education',
+                 'Carnegie Mellon University', 'university',
+                 'udemy', '355Code', 'Skillshare', 'New Oriental',
+                 'Aspen Education', 'Kaplan', '360 Learning', '2U Inc',
+                 'Scholastic Corporation', 'Sylvan Learning',
+                 'Trump University', 'Skillsoft', 'Quizlet',
+                 'Amplify', 'Brainly', 'MasterClass', 'Wolfram',
+                 'Rosetta Stone', 'SynergisticIT']
+
+
 def check_word(filter_list, text):
     """A helper function to check for words in the filter methods below."""
     return any(word in text for word in filter_list)
 
 
-def check_experience(patterns, text):
-    """Helper function to check work experience in filter_experience."""
-    for pattern in patterns:
-        if re.search(pattern, text):
-            return True
-    return False
+def pattern_prefix(pattern):
+    """A helper function that returns the literal characters (at most two)
+    that every match of a KeywordMatcher pattern starts its first word
+    with, and where the match starts relative to that word: 0 after a word
+    boundary and -1 after a whitespace character."""
+    if pattern.startswith(r'\b'):
+        offset = 0
+    elif pattern.startswith(r'\s'):
+        offset = -1
+    else:
+        raise ValueError(f'Pattern must start with \\b or \\s: {pattern}')
+    body = pattern[2:]
+    prefix = ''
+    for i, char in enumerate(body[:2]):
+        if not (char.isalnum() or char == '_'):
+            break
+        quantifier = body[i + 1:i + 2]
+        if quantifier in ('*', '?', '{'):
+            break
+        prefix += char
+        if quantifier == '+':
+            break
+    if not prefix:
+        raise ValueError(f'Pattern must start with a literal word: {pattern}')
+    return prefix, offset
+
+
+class KeywordMatcher:
+    """Finds the highest priority label whose patterns match a text. The
+    patterns are compiled once and indexed by the first characters of the
+    word they start with, so a text is classified in one scan over its
+    words instead of one re.search() per pattern. The result is the same as
+    trying each label's patterns in priority order."""
+
+    def __init__(self, groups):
+        # groups is a list of (label, patterns) in priority order
+        self.labels = [label for label, _ in groups]
+        self.prefixes = {}
+        for priority, (_, patterns) in enumerate(groups):
+            for pattern in patterns:
+                prefix, offset = pattern_prefix(pattern)
+                self.prefixes.setdefault(prefix, []).append(
+                    (priority, re.compile(pattern), offset))
+        # Only whole words starting with one of the prefixes can start a
+        # match, so the scan skips every other word in C
+        self.words = re.compile(r'\b(?:' + '|'.join(
+            re.escape(prefix) for prefix in sorted(
+                self.prefixes, key=len, reverse=True)) + r')\w*')
+
+    def match(self, text):
+        """Returns the label of the best matching group, or None."""
+        best = len(self.labels)
+        prefixes = self.prefixes
+        for word in self.words.finditer(text):
+            token = word.group()
+            candidates = prefixes.get(token[0], ())
+            if len(token) > 1 and token[:2] in prefixes:
+                candidates = [*candidates, *prefixes[token[:2]]]
+            for priority, pattern, offset in candidates:
+                start = word.start() + offset
+                if priority < best and start >= 0 and pattern.match(
+                        text, start):
+                    best = priority
+                    if best == 0:
+                        return self.labels[0]
+        return self.labels[best] if best < len(self.labels) else None
+
+
+def sector_pattern(groups):
+    """A helper function that combines the sectors' company lists into one
+    case-insensitive pattern with a named group per sector. The pattern is
+    a lookahead, so finditer() tries it at every position and reports the
+    highest priority sector that starts there."""
+    return re.compile(
+        '(?=' + '|'.join(f'(?P<{name}>' + '|'.join(companies) + ')'
+                         for name, companies in groups) + ')',
+        re.IGNORECASE)
+
+
+class ListingClassifier:
+    """The filter heuristics of this script, built once at import with all
+    of their patterns precompiled. The priority order of every check is
+    the same as in the original filter functions."""
+
+    def __init__(self):
+        # Titles prioritize senior roles, descriptions entry level ones
+        self.title_levels = KeywordMatcher([
+            ('Senior-Level', SENIOR_LEVEL), ('Entry-Level', ENTRY_LEVEL),
+            ('Junior-Level', JUNIOR_LEVEL),
+            ('Intermediate-Level', INT_LEVEL)])
+        self.description_levels = KeywordMatcher([
+            ('Entry-Level', ENTRY_LEVEL), ('Junior-Level', JUNIOR_LEVEL),
+            ('Senior-Level', SENIOR_LEVEL),
+            ('Intermediate-Level', INT_LEVEL)])
+        # Company sectors in priority order; Healthcare is also assigned
+        # from the description right after the company Healthcare check
+        self.sector_labels = {
+            'tech': 'Technology', 'finance': 'Finance',
+            'healthcare': 'Healthcare', 'retail': 'Retail',
+            'energy': 'Energy', 'education': 'Education'}
+        self.company_sectors = sector_pattern([
+            ('tech', TECH_COMPANIES), ('finance', FIN_COMPANIES),
+            ('healthcare', HC_COMPANIES), ('retail', RE_COMPANIES),
+            ('energy', EN_COMPANIES), ('education', EDU_COMPANIES)])
+        self.sector_priority = list(self.sector_labels)
+        self.healthcare_phrase = re.compile('|'.join(HC_PHRASE),
+                                            re.IGNORECASE)
+
+    def arrangement(self, title, location, desc):
+        """Classifies the work arrangement: Remote, Hybrid or On-site."""
+        title_lower = title.lower()  # Assign all input json data to lowercase
+        location_lower = location.lower()
+        desc_lower = desc.lower()
+
+        # We prioritize iterating through titles, check for "anywhere"
+        if check_word(REMOTE_WORDS, title_lower) or check_word(
+                REMOTE_LOCATION, location_lower):
+            return 'Remote'
+        if check_word(HYBRID_WORDS, title_lower):
+            return 'Hybrid'
+
+        # We then iterate through the descriptions
+        if check_word(REMOTE_WORDS, desc_lower):
+            return 'Remote'
+        if check_word(HYBRID_WORDS, desc_lower):
+            return 'Hybrid'
+        # We can assume anything that is not remote or hybrid is on-site
+        return 'On-site'
+
+    def experience(self, title, description, job_highlights):
+        """Classifies the experience level from the title first and then
+        from the description and qualifications."""
+        # Combine the description and job highlights and make them lowercase
+        combined = (
+            f'{description}'
+            f"{' '.join(it for sec in job_highlights for it in sec['items'])}"
+            ).lower()
+        return (self.title_levels.match(title.lower())
+                or self.description_levels.match(combined)
+                or 'Not specified')
+
+    def sector(self, company_name, description):
+        """Classifies the sector from the company name in a single scan,
+        falling back to the healthcare phrase in the description."""
+        best = len(self.sector_priority)
+        for match in self.company_sectors.finditer(company_name):
+            best = min(best, self.sector_priority.index(match.lastgroup))
+            if best == 0:
+                break
+        # Tech, finance and healthcare companies win over the description
+        if best <= self.sector_priority.index('healthcare'):
+            return self.sector_labels[self.sector_priority[best]]
+        if self.healthcare_phrase.search(description):
+            return 'Healthcare'
+        if best < len(self.sector_priority):
+            return self.sector_labels[self.sector_priority[best]]
+        return 'Not specified'
+
+
+# Compile the classifier once, it is shared by every call below
+CLASSIFIER = ListingClassifier()
 
 
 # Function to filter for work arrangements: Remote, Hybrid, On-site
 def filter_arrangement(title, location, desc):
     """A function that iterates through job titles, locations, and
     descriptions to determine whether they are remote, on-site, or hybrid."""
-    remote_words = ['remote', 'work from home', 'work-from-home']
-    remote_location = ['anywhere']
-    hybrid_words = ['hybrid']
-    title_lower = title.lower()  # Assign all input json data to lowercase
-    location_lower = location.lower()
-    desc_lower = desc.lower()
-
-    # We prioritize iterating through titles, check for "anywhere"
-    if check_word(remote_words, title_lower) or check_word(remote_location,
-                                                           location_lower):
-        return 'Remote'
-    if check_word(hybrid_words, title_lower):
-        return 'Hybrid'
-
-    # We then iterate through the descriptions
-    if check_word(remote_words, desc_lower):
-        return 'Remote'
-    if check_word(hybrid_words, desc_lower):
-        return 'Hybrid'
-    # We can assume anything that is not remote or hybrid is on-site
-    return 'On-site'
+    return CLASSIFIER.arrangement(title, location, desc)
 
 
 # Function to Job Experience
@@ -75,280 +497,14 @@ def filter_experience(title, description, job_highlights):
     """A function that iterates through job titles, descriptions, and
     qualifications to determine whether they a job is entry, junior,
     intermediate, or senior level."""
-    entry_level = [
-        r'\bentry level\b', r'\bentry-level\b', r'\binternship\b',
-        r'\bintern\b', r'\bintern\b', r'\bpursuing a bachelor\b',
-        r'\brecent graduate\b', r'\sde-1', r'\bSoftware Engineer I\b']
-    junior_level = [
-        r'\bjunior\b', r'\b1-year\b', r'\b1 year\b', r'\b2-years\b',
-        r'\b2 years\b', r'\bbachelor\b', r"\bbachelor's\b",
-        r'\bbachelors\b']
-    int_level = [
-        r'\bintermediate level\b', r'\bintermediate-level\b',
-        r'\b3-year\b', r'\b3 year\b', r'\b4-year\b', r'\b4 year\b',
-        r'\sde-2', r'\bSoftware Engineer II\b']
-    senior_level = [
-        r'\sde-3', r'\bprincipal\b', r'\bsenior\b', r'\b5-year\b',
-        r'\b5 years\b', r'\b6-years\b', r'\b6 years\b', r'\b7-year\b',
-        r'\b7 years\b', r'\b8-years\b', r'\b8 years\b', r'\b9-years\b',
-        r'\b9 years\b', r'\b10-years\b', r'\b10 years\b', r'\bphd\b',
-        r'\bmasters\b', r'\bmasters degree\b', r'\bdoctorate\b',
-        r'\bph.d\b', r'\b5+\b', r'\b6+\b', r'\b7+\b',
-        r'\badvanced knowledge\b', r'\bSr\b', r'\bphd+\b', r'\bmasters+\b',
-        r'\btech lead\b', r'\bSenior\b', r'\bstaff software\b',
-        r'\bSoftware Engineer III\b']
-
-    title_lower = title.lower()
-    # Combine the description and job highlights and make them lowercase
-    combined = (
-        f'{description}'
-        f"{' '.join(it for sec in job_highlights for it in sec['items'])}"
-        ).lower()
-
-    # We again prioritize iterating through titles to categorize the data
-    if check_experience(senior_level, title_lower):
-        return 'Senior-Level'
-    if check_experience(entry_level, title_lower):
-        return 'Entry-Level'
-    if check_experience(junior_level, title_lower):
-        return 'Junior-Level'
-    if check_experience(int_level, title_lower):
-        return 'Intermediate-Level'
-
-    # Next, iterate through the combined descriptions and qualifications
-    if check_experience(entry_level, combined):
-        return 'Entry-Level'
-    if check_experience(junior_level, combined):
-        return 'Junior-Level'
-    if check_experience(senior_level, combined):
-        return 'Senior-Level'
-    if check_experience(int_level, combined):
-        return 'Intermediate-Level'
-
-    return 'Not specified'
+    return CLASSIFIER.experience(title, description, job_highlights)
 
 
 def filter_sector(company_name, description):
     """A function that iterates through company names in google_listings.json
     and checks them against the categorized databases that structured as
     lists: technology, finance, healthcare, retail, energy, & education."""
-    tech_companies = ['Google', 'Microsoft', 'Apple', 'Amazon', 'Facebook',
-                      'Meta', 'IBM', 'Intel', 'Oracle',
-                      'Business Transformation Institute', 'robot',
-                      'Whisker Labs', 'T-Rex Solutions', 'Renewance',
-                      'VirtualVocations', 'Dice', 'Innovative Systems',
-                      'Daikin', 'Axiom Space', 'KBR', 'Motorola', 'NVIDIA',
-                      'Samsung', 'LG', 'Databento', 'Echo Global Logistics',
-                      'Sabanto', 'Wayve', 'Parallel Partners Inc', 'crypto',
-                      'Your Next Hire', 'Boeing', 'Clarivate', 'Garmin',
-                      'Leidos', 'Quora', 'Lambda', 'Palantir', 'Osaro, Inc',
-                      'Perpetual Solutions', 'Torii studio', 'H-E-B',
-                      'Tangerine Search', 'Katmai', 'TED Conference',
-                      'RAPS Consulting Inc', 'Lockheed Martin', 'Flexjobs',
-                      'Accelerated Connections', 'Naka Technologies',
-                      'Booz Allen Hamilton', 'HireTeq', 'nuArch', 'Boxed',
-                      'Elevate HR', 'RemoteWorker', 'Experis', 'Magna',
-                      'Tesla', 'BYD', 'Nio', 'Toyota', 'BMW', 'Honda', 'GM',
-                      'Chevrolet', 'Ford', 'WARNERMEDIA', 'Philips',
-                      'Tech Valley Talent', 'Coinbase', 'Block', 'Chewy',
-                      'Blockchain', 'Indium', 'Semgrep', 'Jesica.ai',
-                      'Jobot', 'Snowflake', 'Evolutyz', 'WATI',
-                      'IT TrailBlazers', 'ACS Consult', 'SpaceX',
-                      'Franklin Fitch', 'EROS Technologies Inc',
-                      'Azad, inc', 'Siemens', 'Wolters Kluwer',
-                      'Procom Consultants Group', 'ARCKIT', 'mindpal',
-                      'AditiStaffing', 'game', 'Sterling Engineering',
-                      'Activision Blizzard', 'Universal Orlando Resort',
-                      'QDStaff', 'ServiceNow', 'Universal Creative',
-                      'SambaNova Systems', 'WeWork', 'WEX', 'Bose',
-                      'NextPath', 'Nuro', 'Karkidi', 'BAE Systems',
-                      'Progression Inc.', 'Affiliated Engineers, Inc.',
-                      'Secunetics, inc.', 'Marriott FLEX', 'Taobao',
-                      'Department of Justice', 'bluestone', 'RTX',
-                      'Kavaliro', 'Fuel Talent', 'Insight Global',
-                      'V-Soft Consulting Group, Inc.', 'News Corp',
-                      'FL Innovation Connect', 'ALTTRIX CLOUD',
-                      'Crossroads Technologies', 'Disney', 'Adobe',
-                      'Solidus Labs', 'Yeah! Global', 'Fourier',
-                      'DoorDash', 'matchsource llc', 'Virtualitics',
-                      'American Traction Systems', 'Databricks',
-                      'Siri InfoSolutions Inc', 'Capgemini North America',
-                      '.ai', 'Openmesh Network', 'DecisionEngines',
-                      'Notion', 'The Job Network', 'Palo Alto Networks',
-                      r'\bAEG\b', 'Bosch', 'Synopsys', 'Autodesk',
-                      'Imperial Auto USA Corporation', 'Alibaba',
-                      'Keeper Security, Inc.', 'SDH Systems LLC',
-                      'Anywhere Real Estate', 'CPS Recruitment',
-                      'CrowdStrike', 'New York City', 'Infojini Inc',
-                      'NextPit GmbH', 'Conquest Technical Associates',
-                      'CEDENT',  'Eastridge', 'VANTA Partners, Inc',
-                      'Software People Inc.', 'AIYA TECHNOLOGY SYSTEM LLC',
-                      'Amentum', 'Month2Month.com', 'Airbnb', 'Fortinet',
-                      'Pacific Northwest National Laboratory', 'Fleetcor',
-                      'TikTok', 'Bytedance', 'Tencent', 'NASA', 'Dropbox',
-                      'Futronics', 'Accenture', 'Advanced Micro Devices',
-                      'Akamai Technologies', 'Amphenol', 'Analog Devices',
-                      'Ansys', 'Applied Materials', 'Arista Networks',
-                      'Autodesk', 'Automatic Data Processing', 'Corning',
-                      'Broadcom', 'Broadridge Financial Solutions',
-                      'Cadence Design Systems', 'CDW', 'Ceridian',
-                      'Cisco Systems', 'Citrix Systems', 'Enphase Energy',
-                      'Cognizant Technology Solutions', 'DXC Technology',
-                      'F5 Networks', 'Fiserv', 'Gartner', 'Global Payments',
-                      'Hewlett Packard Enterprise', 'Intuit', 'Xilinx',
-                      r'\bHP\b',  'Jack Henry & Associates', 'NetApp',
-                      'Juniper Networks', 'Keysight Technologies', 'NXP',
-                      'KLA Corporation', 'Lam Research', 'NortonLifeLock',
-                      'Microchip Technology', 'Micron Technology',
-                      'Monolithic Power Systems', 'IPG Photonics',
-                      r'\bPTC\b', 'Qorvo', 'Qualcomm', 'Zebra Technologies',
-                      'Salesforce', 'Seagate Technology', 'Teradyne',
-                      'Skyworks Solutions', 'Texas Instruments', 'Trimble',
-                      'TE Connectivity', 'Tyler Technologies', 'Verisign',
-                      'Western Digital']
-
-    fin_companies = ['Goldman Sachs', 'JPMorgan Chase', 'Morgan Stanley',
-                     'Stripe', 'Citibank', 'Wells Fargo', 'Robert Half',
-                     'Bank of America', 'BOA', 'Citadel', 'Jane Street',
-                     'Capital One', 'CSC', 'Countercyclical', 'Ramp',
-                     'Fidelity', 'State Street', 'ACL Digital', 'invest',
-                     'wall street', 'Esri', 'Geico', 'The Hartford',
-                     'Freddie Mac', 'Hartford Fire Ins. Co', 'Optiver',
-                     'BlackRock', 'Open Systems Technologies',
-                     'Mastercard', 'Visa', 'Selby Jennings', 'Cboe',
-                     'Early Warning', 'Kin Insurance', 'Valid8 Financial',
-                     'The D. E. Shaw Group', 'PDT Partners', 'Deshaw',
-                     'Paycom', 'Point72', 'RedShift', 'array',
-                     'Ejadah Management Consultancy', 'Allstate Corp',
-                     'Central Mutual Insurance Company', 'PayPal',
-                     'Cast & Crew', 'Cross River', 'financial',
-                     'Western Union', 'Aflac', 'Charles Schwab Corporation',
-                     'American Express', 'American International Group',
-                     'Ameriprise Financial', 'Aon', 'BNY Mellon',
-                     'Arthur J. Gallagher & Co.', 'Assurant',
-                     'Berkshire Hathaway',  'Cincinnati Financial',
-                     'Brown & Brown', 'Chubb', 'Citigroup', 'CME Group',
-                     'Citizens Financial Group', 'Discover Financial',
-                     'Comerica', 'Everest Re', 'Fifth Third Bancorp',
-                     'First Republic Bank', 'Franklin Resources',
-                     'Globe Life', 'Huntington Bancshares',
-                     'Intercontinental Exchange', 'Invesco',
-                     'KeyCorp', 'Willis Towers Watson', 'Marsh & McLennan',
-                     'Loews Corporation', 'M&T Bank', 'MarketAxess',
-                     'MetLife', "Moody's Corporation", 'Lincoln National',
-                     'Morgan Stanley', 'MSCI', 'Nasdaq', 'U.S. Bancorp',
-                     'Northern Trust', "People's United Financial",
-                     'PNC Financial Services', 'T. Rowe Price',
-                     'Principal Financial Group', 'SVB Financial',
-                     'Progressive Corporation', 'Prudential Financial',
-                     'Raymond James Financial', 'Zions Bancorp'
-                     'Regions Financial Corporation', 'S&P Global',
-                     'Synchrony Financial', 'W. R. Berkley Corporation',
-                     'The Travelers Companies', 'Truist Financial']
-
-    hc_companies = ['Pfizer', 'Johnson & Johnson', 'Merck', 'Roche',
-                    'med', 'Novartis' 'health', r'\bhealth\b',
-                    'NYU Langone', 'Dana Farber', 'Anderson Cancer',
-                    'Duke Cancer', 'Sidney Kimmel', 'MUFG',
-                    'Emergent Holdings', 'Centene Corporation',
-                    'bioscience', 'Veeva', 'pharm', 'WellSky',
-                    'Akina', 'SmarterDx', 'MMIT', 'Healthcare',
-                    'adonis',         'Abbott Laboratories',
-                    'AbbVie', 'Abiomed', 'Agilent Technologies',
-                    'Align Technology', 'AmerisourceBergen',
-                    'Amgen', 'Anthem', 'Baxter International',
-                    'Becton Dickinson', 'Bio-Rad Laboratories',
-                    'Bio-Techne', 'Biogen', 'Boston Scientific',
-                    'Bristol Myers Squibb', 'Cardinal Health',
-                    'Catalent', 'Centene Corporation', 'Cerner',
-                    'Charles River Laboratories', 'Cigna',
-                    'CVS Health', 'Danaher Corporation',
-                    'DaVita', 'Dentsply Sirona', 'DexCom',
-                    'Edwards Lifesciences', 'Eli Lilly & Co',
-                    'Gilead Sciences', 'HCA Healthcare',
-                    'Henry Schein', 'Hologic', 'Humana',
-                    'Idexx Laboratories', 'Illumina',
-                    'Incyte', 'Intuitive Surgical', 'IQVIA',
-                    'LabCorp', 'McKesson Corporation',
-                    'Medtronic', 'Merck & Co.',
-                    'Mettler Toledo', 'Moderna', 'Organon & Co.',
-                    'PerkinElmer', 'Quest Diagnostics',
-                    'Regeneron Pharmaceuticals', 'ResMed',
-                    'Steris', 'Stryker Corporation', 'Teleflex',
-                    'The Cooper Companies',
-                    'Thermo Fisher Scientific', 'UnitedHealth Group',
-                    'Universal Health Services',
-                    'Vertex Pharmaceuticals', 'Viatris',
-                    'Waters Corporation',
-                    'West Pharmaceutical Services', 'Zimmer Biomet',
-                    'Zoetis']
-    hc_phrase = ['healthcare software']
-    re_companies = ['Walmart', 'Publix', 'Nordstrom', 'Target', 'Costco',
-                    'Walgreens', "Lowe's", 'Aldi', 'Tesco', 'H&M',
-                    'Best Buy', 'Adidas', 'Nike', 'IKEA',
-                    'Estée Lauder', 'LVMH', 'Gucci', 'Burberry',
-                    'Prada', 'General Mills', "Kellogg's", "Kimberly-Clark",
-                    'Kraft Heinz', 'Kroger', 'Lamb Weston',
-                    'McCormick & Company', 'Molson Coors',
-                    'Mondelez International', 'Monster Beverage',
-                    'Pepsi', 'Coca-Cola', 'Philip Morris',
-                    'Procter & Gamble', 'P&G', 'P & G', 'Sysco',
-                    'The Hershey Company', 'Tyson Foods', 'The Home Depot',
-                    'JD.com', 'CVS Corporation', 'Aeon',
-                    'Seven & I Holdings', 'Woolworths', 'Auchan',
-                    "Macy's", 'Rite Aid', "Kohl's", 'Wayfair', 'The Gap',
-                    'Decathlon', 'Coupang']
-    en_companies = ['ExxonMobil', 'Chevron', 'Shell', 'BP',
-                    'ConocoPhillips', 'SLB', 'oxy', 'Valero Energy',
-                    'Con Edison Company of New York',
-                    'Universe Energy, Inc.', 'APA Corporation',
-                    'Baker Hughes', 'Coterra', 'Devon Energy',
-                    'Diamondback Energy', 'EOG Resources', 'Oneok',
-                    'Halliburton', 'Hess Corporation', 'Phillips 66',
-                    'Kinder Morgan', 'Marathon Oil', 'Schlumberger',
-                    'Marathon Petroleum', 'Occidental Petroleum',
-                    'Pioneer Natural Resources', 'Williams Companies']
-
-    edu_companies = ['Pearson', 'McGraw-Hill', 'Cengage', 'udacity',
-                     'Houghton Mifflin Harcourt', 'Coursera',
-                     'Synergistic IT', 'jobsbridge', 'Apollo Education',
-                     'Carnegie Mellon University', 'university',
-                     'udemy', '355Code', 'Skillshare', 'New Oriental',
-                     'Aspen Education', 'Kaplan', '360 Learning', '2U Inc',
-                     'Scholastic Corporation', 'Sylvan Learning',
-                     'Trump University', 'Skillsoft', 'Quizlet',
-                     'Amplify', 'Brainly', 'MasterClass', 'Wolfram',
-                     'Rosetta Stone', 'SynergisticIT']
-
-    # Use re module to compile regex patterns while ignoring case size
-    tech_pattern = re.compile('|'.join(tech_companies), re.IGNORECASE)
-    finance_pattern = re.compile('|'.join(fin_companies), re.IGNORECASE)
-    healthcare_pattern = re.compile(
-        '|'.join(hc_companies), re.IGNORECASE)
-    healthcare_pattern2 = re.compile(
-        '|'.join(hc_phrase), re.IGNORECASE)
-    energy_pattern = re.compile('|'.join(en_companies), re.IGNORECASE)
-    retail_pattern = re.compile('|'.join(re_companies), re.IGNORECASE)
-    education_pattern = re.compile(
-        '|'.join(edu_companies), re.IGNORECASE)
-
-    # Again, we use the re module search() function to find matches
-    if tech_pattern.search(company_name):
-        return 'Technology'
-    elif finance_pattern.search(company_name):
-        return 'Finance'
-    elif healthcare_pattern.search(company_name):
-        return 'Healthcare'
-    elif healthcare_pattern2.search(description):
-        return 'Healthcare'
-    elif retail_pattern.search(company_name):
-        return 'Retail'
-    elif energy_pattern.search(company_name):
-        return 'Energy'
-    elif education_pattern.search(company_name):
-        return 'Education'
-    else:
-        return 'Not specified'
+    return CLASSIFIER.sector(company_name, description)
 
 
 def clean_job_listing(job):
@@ -384,45 +540,228 @@ def clean_job_listing(job):
         cleaned_job['url_site'] = f'[{title}]'
     else:
         cleaned_job['job_url'] = 'No link available'
+    # Keep the job_id so listings can be tracked between scrapes
+    if 'job_id' in job:
+        cleaned_job['job_id'] = job['job_id']
 
     return cleaned_job
 
 
-def clean_data(data):
+def pool_chunk_size(count, workers):
+    """A helper function that picks how many listings each worker gets at a
+    time: about four chunks per worker, and never more than CHUNK_SIZE."""
+    return max(1, min(CHUNK_SIZE, -(-count // (workers * 4))))
+
+
+def clean_data(data, workers=1, pool=None):
     """This function is called in main and triggers the above
     clean_job_listings method to return the cleaned_data that is ulimately
-    written to cleaned_listings.json."""
-    cleaned_data = [clean_job_listing(job) for job in data]
-    return cleaned_data
+    written to cleaned_listings.json. With more than one worker the
+    listings are cleaned in chunks across a process pool (a new one unless
+    pool is given), and pool.map() keeps them in input order."""
+    if workers <= 1:
+        return [clean_job_listing(job) for job in data]
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return clean_data(data, workers, pool)
+    data = list(data)
+    return list(pool.map(clean_job_listing, data,
+                         chunksize=pool_chunk_size(len(data), workers)))
 
 
 def save_cleaned_data(path, data):
     """This function is called in main and writes the cleaned data to the
-    output file cleaned_listings.json"""
+    output file cleaned_listings.json. The data is written to a temporary
+    file first and then renamed over the old one, so the running app never
+    reads a half written file."""
+    temp_path = f'{path}.tmp'
     try:
-        with open(path, 'w') as file:
+        with open(temp_path, 'w') as file:
             json.dump(data, file, indent=2)
+        os.replace(temp_path, path)
     except IOError as error:
         print(f"Error writing to '{path}' file due to: {error}")
 
 
-def main():
+def raw_hash(job):
+    """A helper function that hashes the raw content of a listing, so an
+    unchanged listing can be recognized on the next run."""
+    content = json.dumps(job, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def open_cache(path):
+    """Opens (and creates if needed) the SQLite cache of cleaned listings
+    that the incremental mode keeps between runs."""
+    connection = sqlite3.connect(path)
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    if version != CACHE_VERSION:
+        connection.execute('DROP TABLE IF EXISTS listings')
+        connection.execute(f'PRAGMA user_version = {CACHE_VERSION}')
+    # job_id is not unique, so every run keys its rows by input position
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS listings ('
+        'run INTEGER NOT NULL, position INTEGER NOT NULL, job_id TEXT, '
+        'raw_hash TEXT NOT NULL, cleaned TEXT NOT NULL, '
+        'PRIMARY KEY (run, position))')
+    connection.execute(
+        'CREATE INDEX IF NOT EXISTS listings_raw_hash ON listings (raw_hash)')
+    return connection
+
+
+def clean_chunk(jobs):
+    """Cleans one chunk of raw listings. This is the unit of work the
+    incremental mode hands to clean_job_listing()."""
+    return [clean_job_listing(job) for job in jobs]
+
+
+def write_cleaned_rows(path, rows):
+    """Streams the cleaned listings (as JSON strings) into a JSON array that
+    matches what json.dump(data, file, indent=2) writes, going through a
+    temporary file like save_cleaned_data()."""
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as file:
+        file.write('[')
+        count = 0
+        for row in rows:
+            text = json.dumps(json.loads(row), indent=2)
+            file.write(',\n  ' if count else '\n  ')
+            file.write(text.replace('\n', '\n  '))
+            count += 1
+        file.write('\n]' if count else ']')
+    os.replace(temp_path, path)
+    return count
+
+
+def clean_data_incremental(records, cache_path, output_path,
+                           cleaner=clean_chunk, chunk_size=CHUNK_SIZE):
+    """Cleans only the new or changed raw listings from the records
+    iterable, reusing the cleaned listings in the cache at cache_path whose
+    raw content is unchanged, and writes the current listings to
+    output_path in input order. Returns a dictionary of counts: cleaned,
+    unchanged and removed listings, and the total."""
+    stats = {'cleaned': 0, 'unchanged': 0, 'removed': 0, 'total': 0}
+    connection = open_cache(cache_path)
+    try:
+        with connection:
+            run = connection.execute(
+                'SELECT COALESCE(MAX(run), 0) + 1 FROM listings').fetchone()[0]
+            pending = []
+
+            def flush():
+                # Clean the changed listings and add them to this run
+                cleaned = cleaner([job for _, _, _, job in pending])
+                connection.executemany(
+                    'INSERT INTO listings VALUES (?, ?, ?, ?, ?)',
+                    [(run, position, job_id, digest, json.dumps(cleaned_job))
+                     for (position, job_id, digest, _), cleaned_job
+                     in zip(pending, cleaned)])
+                stats['cleaned'] += len(pending)
+                pending.clear()
+
+            for position, job in enumerate(records):
+                digest = raw_hash(job)
+                # Listings without a job_id are keyed by their content
+                job_id = str(job.get('job_id') or digest)
+                # Reuse the cleaned listing of any run with the same content
+                reused = connection.execute(
+                    'INSERT INTO listings SELECT ?, ?, job_id, raw_hash, '
+                    'cleaned FROM listings WHERE raw_hash = ? LIMIT 1',
+                    (run, position, digest)).rowcount
+                if reused:
+                    stats['unchanged'] += 1
+                else:
+                    pending.append((position, job_id, digest, job))
+                    if len(pending) >= chunk_size:
+                        flush()
+            if pending:
+                flush()
+            # Listings missing from this scrape have expired
+            stats['removed'] = connection.execute(
+                'SELECT COUNT(*) FROM listings WHERE run != ? AND job_id '
+                'NOT IN (SELECT job_id FROM listings WHERE run = ?)',
+                (run, run)).fetchone()[0]
+            connection.execute('DELETE FROM listings WHERE run != ?', (run,))
+        rows = (row for row, in connection.execute(
+            'SELECT cleaned FROM listings ORDER BY position'))
+        stats['total'] = write_cleaned_rows(output_path, rows)
+    finally:
+        connection.close()
+    return stats
+
+
+def parse_args(argv=None):
+    """Reads the command line options of the script."""
+    json_dir = os.path.join(ROOT_DIR, 'json_files')
+    parser = argparse.ArgumentParser(
+        description='Clean google_listings.json into cleaned_listings.json')
+    parser.add_argument(
+        '--input', default=os.path.join(json_dir, 'google_listings.json'),
+        help='raw listings, a JSON array or JSON Lines (.jsonl) file')
+    parser.add_argument(
+        '--output', default=os.path.join(json_dir, 'cleaned_listings.json'),
+        help='where the cleaned listings are written')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='only clean listings that changed since the last run')
+    parser.add_argument(
+        '--cache', default=os.path.join(json_dir, 'clean_cache.sqlite3'),
+        help='the cleaned listings cache used by --incremental')
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='number of processes used to clean listings (default: 1)')
+    parser.add_argument(
+        '--no-index', action='store_true',
+        help='do not write the binary recommender index')
+    parser.add_argument(
+        '--hash-features', type=int, default=0,
+        help='hash the text fields of the index into this many columns')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """This is our driver function which calls the methods: load_data(),
     clean_data(), and saved_clean_data() to effective perform the data
     preparation which involves cleaning the data and writing storing it
-    in an external file."""
+    in an external file. With --incremental it calls
+    clean_data_incremental() instead."""
     # Use the os module to create portable paths for our JSON files
-    input_path = os.path.join(os.path.dirname(__file__),
-                              'json_files', 'google_listings.json')
-    output_path = os.path.join(os.path.dirname(__file__),
-                               'json_files', 'cleaned_listings.json')
-
-    # Call the load_data, cleaned_data and saved_clean_data methods here
-    data = load_data(input_path)
-    cleaned_data = clean_data(data)
-    save_cleaned_data(output_path, cleaned_data)
+    args = parse_args(argv)
+    workers = max(1, args.workers)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    start = time.perf_counter()
+
+    try:
+        if args.incremental:
+            stats = clean_data_incremental(
+                iter_data(args.input), args.cache, args.output,
+                lambda jobs: clean_data(jobs, workers, pool),
+                CHUNK_SIZE * workers)
+            count = stats['cleaned']
+            print(f"{stats['cleaned']} listings cleaned, "
+                  f"{stats['unchanged']} unchanged and "
+                  f"{stats['removed']} removed.")
+        else:
+            # Call the load_data, cleaned_data and saved_clean_data methods
+            data = load_data(args.input)
+            cleaned_data = clean_data(data, workers, pool)
+            save_cleaned_data(args.output, cleaned_data)
+            count = len(cleaned_data)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    elapsed = time.perf_counter() - start
+    print(f'Cleaned {count} listings in {elapsed:.2f}s with {workers} '
+          f'worker(s): {count / elapsed if elapsed else 0:.0f} listings/sec')
     # Print the success message
     print('Data formatted and written to cleaned_listings.json!')
+    if not args.no_index:
+        index_path = default_index_path(args.output)
+        start = time.perf_counter()
+        fit_index(args.output,
+                  hash_features=args.hash_features).save(index_path)
+        print(f'Recommender index written to {os.path.basename(index_path)} '
+              f'in {time.perf_counter() - start:.2f}s!')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,236 @@
+# Job Hunting AI Tool: dedupe.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# This is a standalone Python script that runs between fetch_jobs.py and
+# clean_data.py. The 25 queries in fetch_jobs.py overlap ('Software
+# Engineer', 'Software Developer', 'Remote', 'Intern', ...), so the same
+# listing is often returned more than once, and companies repost jobs with
+# slightly edited descriptions. Duplicates inflate the TF-IDF corpus and
+# crowd the recommendations with copies of the same job.
+#
+# Listings are first deduplicated exactly on job_id. Near duplicates are
+# then found with MinHash and locality-sensitive hashing: each description
+# is split into word shingles, summarized by a MinHash signature, and the
+# signatures are cut into bands so only listings of the same company
+# sharing a band are compared. Descriptions too short to tell jobs apart
+# are left out before hashing, so boilerplate such as 'Apply on the site'
+# never fills one huge bucket. Candidate pairs are confirmed with their
+# exact Jaccard similarity, and confirmed pairs are grouped with a
+# union-find. Each group keeps its first listing as the canonical record,
+# with the apply_options of all of its copies merged in.
+#
+# Source:
+# 1.) Mining of Massive Datasets, Chapter 3 - http://www.mmds.org/
+# 2.) NumPy Documentation: https://numpy.org/doc/stable/reference/random/
+# generator.html
+
+# Imports: argparse, json, os, re and zlib to hash the shingles, plus numpy
+# for the MinHash signatures
+import argparse
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+# The project root, which holds the json_files directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Descriptions are compared as sets of overlapping five word shingles
+SHINGLE_SIZE = 5
+# 128 MinHash values in 16 bands of 8 rows catch pairs above about 0.7
+# Jaccard similarity with high probability
+NUM_HASHES = 128
+BANDS = 16
+# Candidate pairs must have at least this exact Jaccard similarity
+THRESHOLD = 0.8
+# Shorter descriptions are boilerplate ('Apply on the site') rather than
+# evidence of the same job, so they are only deduplicated on job_id
+MIN_SHINGLES = 20
+# A Mersenne prime, large enough for the 32-bit shingle hashes
+PRIME = (1 << 31) - 1
+SEED = 467
+
+WORD = re.compile(r'\w+')
+
+
+def load_listings(path):
+    """A function to load the raw listings from a JSON array or a JSON
+    Lines (.jsonl) file."""
+    try:
+        with open(path, 'r') as file:
+            if path.endswith('.jsonl'):
+                return [json.loads(line) for line in file if line.strip()]
+            return json.load(file)
+    except IOError as error:
+        print(f"Error loading '{path}' file due to: {error}")
+        return []
+
+
+def shingles(text):
+    """A helper function that returns the hashes of the distinct word
+    shingles of a description. Descriptions shorter than one shingle are
+    kept as a single shingle of all their words."""
+    words = WORD.findall((text or '').lower())
+    count = max(1, len(words) - SHINGLE_SIZE + 1)
+    return np.unique(np.fromiter(
+        (zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode())
+         for i in range(count)), dtype=np.int64, count=count))
+
+
+def minhash(shingle_sets, num_hashes=NUM_HASHES, seed=SEED):
+    """Returns the N x num_hashes MinHash signatures of the shingle sets,
+    using the universal hashes (a * x + b) mod PRIME."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, PRIME, num_hashes, dtype=np.int64)
+    b = rng.integers(0, PRIME, num_hashes, dtype=np.int64)
+    signatures = np.empty((len(shingle_sets), num_hashes), dtype=np.int64)
+    for row, values in enumerate(shingle_sets):
+        # Reducing first keeps a * x below 2^62, so int64 cannot overflow
+        values = values % PRIME
+        signatures[row] = ((np.outer(values, a) + b) % PRIME).min(axis=0)
+    return signatures
+
+
+def candidate_pairs(signatures, groups=None, bands=BANDS):
+    """Yields the (i, j) pairs with i < j whose signatures agree on every
+    row of at least one band. Given groups (e.g. the company of every
+    row), only rows of the same group are paired."""
+    rows = signatures.shape[1] // bands
+    if groups is None:
+        groups = [None] * len(signatures)
+    seen = set()
+    for band in range(bands):
+        buckets = {}
+        block = signatures[:, band * rows:(band + 1) * rows]
+        for i, key in enumerate(map(bytes, block)):
+            buckets.setdefault((groups[i], key), []).append(i)
+        for members in buckets.values():
+            for x, i in enumerate(members):
+                for j in members[x + 1:]:
+                    if (i, j) not in seen:
+                        seen.add((i, j))
+                        yield i, j
+
+
+def jaccard(first, second):
+    """Returns the exact Jaccard similarity of two sorted shingle arrays."""
+    union = len(np.union1d(first, second))
+    return len(np.intersect1d(first, second, assume_unique=True)) / union
+
+
+def find(parents, i):
+    """The find of a union-find, with path halving."""
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def merge_apply_options(canonical, copies):
+    """Returns a copy of the canonical listing with the apply_options of
+    its copies appended, skipping links it already has."""
+    merged = dict(canonical)
+    options = list(canonical.get('apply_options', []))
+    links = {option.get('link') for option in options}
+    for copy in copies:
+        for option in copy.get('apply_options', []):
+            if option.get('link') not in links:
+                links.add(option.get('link'))
+                options.append(option)
+    if options:
+        merged['apply_options'] = options
+    return merged
+
+
+def dedupe_listings(listings, threshold=THRESHOLD):
+    """Removes exact (same job_id) and near duplicate (same company and
+    similar description) listings. Returns the canonical listings in their
+    original order along with the number of exact and near duplicates."""
+    # Exact duplicates: group the listings by job_id
+    groups, by_id = [], {}
+    for job in listings:
+        job_id = job.get('job_id')
+        if job_id is not None and job_id in by_id:
+            groups[by_id[job_id]].append(job)
+            continue
+        if job_id is not None:
+            by_id[job_id] = len(groups)
+        groups.append([job])
+    exact = len(listings) - len(groups)
+
+    # Near duplicates among the remaining canonical listings
+    canonical = [group[0] for group in groups]
+    shingle_sets = [shingles(job.get('description')) for job in canonical]
+    parents = list(range(len(canonical)))
+    # Only descriptions long enough to identify a job are hashed
+    hashed = [i for i, values in enumerate(shingle_sets)
+              if len(values) >= MIN_SHINGLES]
+    if hashed:
+        signatures = minhash([shingle_sets[i] for i in hashed])
+        companies = [canonical[i].get('company_name') for i in hashed]
+        for x, y in candidate_pairs(signatures, companies):
+            i, j = hashed[x], hashed[y]
+            if jaccard(shingle_sets[i], shingle_sets[j]) >= threshold:
+                # Keep the earliest listing as the root of each group
+                root_i, root_j = find(parents, i), find(parents, j)
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+    clusters = {}
+    for i in range(len(canonical)):
+        clusters.setdefault(find(parents, i), []).append(i)
+    deduped = []
+    for root in sorted(clusters):
+        copies = [job for i in clusters[root] for job in groups[i]]
+        deduped.append(merge_apply_options(copies[0], copies[1:]))
+    near = len(canonical) - len(deduped)
+    return deduped, exact, near
+
+
+def save_listings(path, data):
+    """A function that writes the deduplicated listings to a JSON file (or
+    a JSON Lines file for a .jsonl path), through a temporary file so a
+    failed write never truncates it."""
+    temp_path = f'{path}.tmp'
+    try:
+        with open(temp_path, 'w') as file:
+            if path.endswith('.jsonl'):
+                file.writelines(json.dumps(job) + '\n' for job in data)
+            else:
+                json.dump(data, file, indent=2)
+        os.replace(temp_path, path)
+    except IOError as error:
+        print(f"Error writing to file '{path}' due to: {error}")
+
+
+def parse_args(argv=None):
+    """Reads the command line options of the script."""
+    raw_path = os.path.join(ROOT_DIR, 'json_files', 'google_listings.json')
+    parser = argparse.ArgumentParser(
+        description='Remove duplicate raw job listings')
+    parser.add_argument('--input', default=raw_path,
+                        help='raw listings written by fetch_jobs.py, a '
+                        'JSON array or JSON Lines (.jsonl) file')
+    parser.add_argument('--output', default=raw_path,
+                        help='where the deduplicated listings are written')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='Jaccard similarity of near duplicates')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """The driver function: loads the raw listings, removes duplicates and
+    writes the canonical listings back for clean_data.py."""
+    args = parse_args(argv)
+    listings = load_listings(args.input)
+    deduped, exact, near = dedupe_listings(listings, args.threshold)
+    save_listings(args.output, deduped)
+    print(f'{len(deduped)} listings kept: {exact} exact and {near} near '
+          f'duplicates removed.')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,79 +10,282 @@
 # google_listings.json. # Built in collaboration with Alex, from his
 # file: scrape_googlejobs.py.
 #
+# All requests go through one JobFetcher, which shares a connection-pooled
+# requests.Session between the worker threads. It limits how many requests
+# run against a host at once, spaces them out with a token bucket, and
+# retries 429 and 5xx responses (and connection errors, broken or
+# undecodable bodies and bodies that are not valid JSON) with exponential
+# backoff and jitter. Each query follows SerpApi's next_page_token until it
+# reaches its target number of listings. A query that still fails after
+# all retries is reported instead of being silently dropped, and the
+# base URL can point at a local stub server for testing.
+#
 # Source:
 # 1.) SerpApi Documentation - https://pypi.org/project/serpapi/
+# 2.) SerpApi Google Jobs pagination - https://serpapi.com/google-jobs-api
+# 3.) Exponential Backoff And Jitter - https://aws.amazon.com/blogs/
+# architecture/exponential-backoff-and-jitter/
 
-# Imports: requests, json, os, and concurrent futures
-import requests
+# Imports: argparse, requests, json, os, random, sys, threading and time
+import argparse
 import json
 import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # Used to fetch jobs in parallel to reduce probability of rate limiting
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables from a .env file
 load_dotenv()
 
+# The project root, which holds the json_files directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERPAPI_URL = 'https://serpapi.com/search'
+
+# Responses worth retrying: rate limited or a server side error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Request errors worth retrying: the connection failed or timed out, or the
+# body was cut off or could not be decoded
+RETRY_ERRORS = (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ContentDecodingError)
+
+
+class FetchError(Exception):
+    """Raised when a request still fails after all of its retries."""
+
+
+class TokenBucket:
+    """A thread-safe token bucket: acquire() blocks until a token is free.
+    Tokens refill at rate per second, up to capacity for short bursts."""
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, waiting for the bucket to refill if needed."""
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens
+                                  + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class JobFetcher:
+    """Fetches job listings from SerpApi (or any server with the same
+    interface at base_url) with a shared session, per-host concurrency
+    limits, rate limiting, retries and pagination."""
 
-def fetch_job_query(api_key, job_type, num_listings):
+    def __init__(self, api_key, base_url=SERPAPI_URL, rate=2.0, burst=5,
+                 max_per_host=4, max_retries=5, backoff=1.0,
+                 max_backoff=60.0, timeout=30, sleep=time.sleep):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.sleep = sleep
+        self.bucket = TokenBucket(rate, burst, sleep=sleep)
+        self.max_per_host = max_per_host
+        self.host_limits = {}
+        self.host_lock = threading.Lock()
+        # One pooled session for every thread, sized for the host limit
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_per_host,
+                              pool_maxsize=max_per_host)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def host_limit(self, url):
+        """Returns the semaphore that caps concurrent requests to a host."""
+        host = urlsplit(url).netloc
+        with self.host_lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+            return self.host_limits[host]
+
+    def retry_delay(self, attempt, response=None):
+        """Returns how long to wait before the next attempt: the server's
+        Retry-After if it sent one, otherwise exponential backoff with full
+        jitter."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _send(self, params):
+        """Sends one GET request and returns the response with the error to
+        retry it for, which is None on success. The response is None when
+        no response arrived. Raises FetchError for failures that will not
+        get better by retrying."""
+        self.bucket.acquire()
+        try:
+            with self.host_limit(self.base_url):
+                response = self.session.get(self.base_url, params=params,
+                                            timeout=self.timeout)
+        except RETRY_ERRORS as error:
+            return None, error
+        except requests.exceptions.RequestException as bad:
+            # e.g. an invalid URL, which will not get better by retrying
+            raise FetchError(f'{params.get("q")}: {bad}') from bad
+        if response.status_code in RETRY_STATUSES:
+            return response, f'HTTP {response.status_code}'
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError as bad:
+            # Other client errors will not get better by retrying
+            raise FetchError(f'{params.get("q")}: {bad}') from bad
+        return response, None
+
+    def _decode(self, response):
+        """Returns the decoded JSON body of a response with the error to
+        retry it for, which is None on success. A body cut short by a proxy
+        or the server may be whole on the next attempt."""
+        try:
+            return response.json(), None
+        except ValueError as bad:
+            return None, f'invalid JSON: {bad}'
+
+    def get(self, params):
+        """Sends one GET request and returns the decoded JSON, retrying
+        rate limited, failed and timed out requests and broken bodies.
+        Raises FetchError for any request that cannot be fetched."""
+        error, response = None, None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.sleep(self.retry_delay(attempt - 1, response))
+            response, error = self._send(params)
+            if error is None:
+                data, error = self._decode(response)
+                if error is None:
+                    return data
+        raise FetchError(f'{params.get("q")}: giving up after '
+                         f'{self.max_retries + 1} attempts ({error})')
+
+    def fetch_query(self, job_type, num_listings):
+        """Fetches up to num_listings results for one query, following
+        next_page_token from page to page."""
+        # From the SerpApi documentation, we use google_jobs for the engine
+        params = {'api_key': self.api_key, 'engine': 'google_jobs',
+                  'q': f'{job_type}'}
+        results = []
+        while len(results) < num_listings:
+            data = self.get(params)
+            jobs = data.get('jobs_results', [])
+            results.extend(jobs)
+            token = data.get('serpapi_pagination', {}).get('next_page_token')
+            if not jobs or not token:
+                break
+            params = dict(params, next_page_token=token)
+        return results[:num_listings]
+
+
+def fetch_job_query(api_key, job_type, num_listings, fetcher=None):
     """A helper method used to fetch job listings. It takes in the api_key,
-    the query, and the desired number of listings."""
-    query_string = f'{job_type}'  # Defined in the main function below
-    # From the SerpApi documentation, we use google_jobs for the engine
-    params = {
-        'api_key': api_key, 'engine': 'google_jobs', 'q': query_string,
-        'num': num_listings}
-
-    # Implement try / catch to follow best practices in case of rejection
-    try:
-        # Set the response using HTTP requests
-        response = requests.get('https://serpapi.com/search',
-                                params=params)
-        response.raise_for_status()
-        return response.json().get('jobs_results', [])
-    # Catch any request-related exceptions and print error message
-    except requests.exceptions.RequestException as error:
-        print(f'Error fetching data due to: {error}')
-        return []
-
-
-def fetch_job_listings(api_key, job_types, num_listings):
+    the query, and the desired number of listings. Failed requests are
+    retried, and a FetchError is raised if the query cannot be fetched."""
+    if fetcher is None:
+        fetcher = JobFetcher(api_key)
+    return fetcher.fetch_query(job_type, num_listings)
+
+
+def fetch_job_listings(api_key, job_types, num_listings, fetcher=None,
+                       max_workers=10):
     """The main function to fetch job listings which takes in the api_key,
     query, and num_listings. It calls the fetch_job_query helper method.
     It uses threading to handle multiple request and returns the listings
-    as "job_list."""
+    as "job_list" in query order, along with a dictionary of the queries
+    that failed and why."""
+    if fetcher is None:
+        fetcher = JobFetcher(api_key)
     job_list = []
+    failures = {}
     # Use threading for multiple concurrent requests; call fetch_job_query
-    # Max workers set to 10 for now to reduce frequent context switching
-    with ThreadPoolExecutor(max_workers=10) as pool:
-        threads = [pool.submit(fetch_job_query, api_key, job_type,
-                               num_listings) for job_type in job_types]
-        for threads in as_completed(threads):
-            job_list.extend(threads.result())
-    return job_list
+    # The fetcher's host limit and token bucket keep us under the API limits
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        threads = [(job_type, pool.submit(fetch_job_query, api_key,
+                                          job_type, num_listings, fetcher))
+                   for job_type in job_types]
+        for job_type, thread in threads:
+            try:
+                job_list.extend(thread.result())
+            except FetchError as error:
+                print(f'Error fetching data due to: {error}')
+                failures[job_type] = str(error)
+    return job_list, failures
 
 
 def save_results_to_json(path, data):
     """A simple method to store the results of fetch_job_listings to a
-    JSON file. It uses the os module for directory creation if is DNE."""
+    JSON file, or one listing per line for a JSON Lines (.jsonl) path. It
+    uses the os module for directory creation if is DNE."""
     directory = os.path.dirname(path)
-    if not os.path.exists(directory):
+    if directory and not os.path.exists(directory):
         os.makedirs(directory)
 
     # Implement try / except block in data fails to write
     try:
         with open(path, 'w') as file:
-            json.dump(data, file, indent=2)
+            if path.endswith('.jsonl'):
+                file.writelines(json.dumps(job) + '\n' for job in data)
+            else:
+                json.dump(data, file, indent=2)
     except IOError as error:
         print(f"Error writing to file '{path}' due to: {error}")
 
 
-def main():
+def parse_args(argv=None):
+    """Reads the command line options of the script."""
+    parser = argparse.ArgumentParser(
+        description='Fetch job listings from SerpApi Google Jobs')
+    parser.add_argument(
+        '--output', default=os.path.join(ROOT_DIR, 'json_files',
+                                         'google_listings.json'),
+        help='where the raw listings are written (.json or .jsonl)')
+    parser.add_argument('--per-query', type=int, default=40,
+                        help='target number of listings per query')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='requests per second across all threads')
+    parser.add_argument('--base-url', default=SERPAPI_URL,
+                        help='search endpoint, e.g. a local stub server')
+    parser.add_argument('--allow-partial', action='store_true',
+                        help='save the results even if some queries failed')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """The main method which calls each of the methods above to store the
-    results of fetch_job_listings in google_listings.json. It attempts
-    to pull 1000 jobs, but may pull less due to rate limiting."""
+    results of fetch_job_listings in google_listings.json. It pages through
+    each query until it has 40 jobs (1000 in total). If a query fails after
+    all retries nothing is saved, unless --allow-partial is given."""
+    args = parse_args(argv)
     # Set API key
     api_key = os.getenv('API_KEY')
     if not api_key:
@@ -98,16 +301,20 @@ def main():
         'Embedded Systems Engineer', 'Robotics Engineer', 'Data Engineer',
         'UX Designer', 'Intern', 'Bioinformatics', 'Remote', 'Hybrid'
     ]
-    # Set the number of jobs listings to fetch to 40 * 25 = 1000
-    num_listings = 40
+    fetcher = JobFetcher(api_key, base_url=args.base_url, rate=args.rate)
     # Assign the results of fetch_job_listings to job_listings
-    job_listings = fetch_job_listings(api_key, job_types, num_listings)
-    # Define the path
-    path = 'json_files/google_listings.json'
-    save_results_to_json(path, job_listings)
+    job_listings, failures = fetch_job_listings(
+        api_key, job_types, args.per_query, fetcher)
+    if failures and not args.allow_partial:
+        print(f'{len(failures)} queries failed, results were not saved: '
+              f'{", ".join(failures)}')
+        return 1
+    save_results_to_json(args.output, job_listings)
     # Print a success message to the console
-    print('Job results updated in google_listings.json!')
+    print(f'{len(job_listings)} job results updated in '
+          f'{os.path.basename(args.output)}!')
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# Job Hunting AI Tool: gunicorn.conf.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# The production serving configuration for app.py, used by the Dockerfile:
+#     gunicorn --config gunicorn.conf.py app:app
+# Each worker process serves requests from several threads (gthread), and
+# every thread shares the worker's read-only recommender index and result
+# cache. The app is loaded once before the workers are forked, so the
+# workers also share the memory mapped index file. The port, worker count
+# and thread count are read from the environment. If the corpus is still
+# loading in the background when the workers are forked, each worker
+# resumes the load itself (post_fork). The scoring processes of
+# SCORING_SHARDS are started from a forkserver, never forked from these
+# multi-threaded workers (see model/sharding.py).
+#
+# Source:
+# 1.) Gunicorn Settings: https://docs.gunicorn.org/en/stable/settings.html
+
+# Import os to read the environment
+import os
+
+# Cloud Run tells the container which port to listen on through PORT
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# One worker per core by default, each serving requests from a few threads
+workers = int(os.getenv('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+
+# Import the app and load the corpus once in the master process before
+# forking the workers
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    """Restarts the corpus load in the worker if it was not done when the
+    worker was forked, since the master's loading thread is not copied."""
+    from app import corpus_cache
+    corpus_cache.resume()
@@ -0,0 +1,148 @@
+# Job Hunting AI Tool: ann.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# An approximate nearest neighbor index for the "ann" retrieval engine of
+# the recommender. The TF-IDF matrix of the combined listing text is
+# projected into a small dense space with latent semantic analysis (a
+# truncated SVD), so listings that share related terms end up close even
+# when they do not share the exact words. The listing vectors are then
+# grouped into about sqrt(N) clusters with spherical k-means, an inverted
+# file (IVF) index: a query is compared with the cluster centroids and only
+# the listings in its closest clusters are compared with the query. The
+# work per query therefore grows with sqrt(N) instead of N, and the
+# recommender re-ranks the candidates with its usual weighted formula.
+#
+# Everything is fitted offline when the index is built. Searching only
+# needs NumPy and the arrays saved in the binary index. The projection only
+# keeps the term columns that some listing uses, which matters for hashed
+# fields where most of the columns are empty.
+#
+# Source:
+# 1.) Scikit-learn: https://scikit-learn.org/stable/modules/
+# decomposition.html#lsa
+# 2.) Jegou et al., Product Quantization for Nearest Neighbor Search
+# (the IVF index): https://ieeexplore.ieee.org/document/5432202
+
+# Import numpy for the dense vectors and scipy for the query rows
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# The number of LSA dimensions of the listing vectors
+DIMENSIONS = 128
+# The minimum number of clusters probed per query
+PROBES = 8
+# The number of k-means iterations used to fit the clusters
+ITERATIONS = 10
+# The number of rows compared with the centroids at once while fitting
+CHUNK_SIZE = 4096
+SEED = 467
+
+
+def normalize_rows(matrix):
+    """A helper function that scales every row to unit length, leaving
+    all-zero rows as they are."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def nearest_centroids(vectors, centroids):
+    """A helper function that returns the closest centroid of every vector,
+    working through the vectors in chunks to bound memory."""
+    return np.concatenate([
+        np.argmax(vectors[start:start + CHUNK_SIZE] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), CHUNK_SIZE)])
+
+
+class AnnIndex:
+    """An LSA projection plus an IVF index over the listing vectors. The
+    listings of cluster c are list_rows[list_offsets[c]:list_offsets[c+1]],
+    in ascending order. The components cover the sorted term columns in
+    columns."""
+
+    def __init__(self, components, vectors, centroids, list_rows,
+                 list_offsets, columns):
+        self.components = components
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_rows = list_rows
+        self.list_offsets = list_offsets
+        self.columns = columns
+
+    @classmethod
+    def build(cls, matrix, dimensions=DIMENSIONS, seed=SEED):
+        """Fits the projection and the clusters for a TF-IDF matrix, or
+        returns None when the corpus is too small to project."""
+        # Imported here so that only building an index needs scikit-learn
+        from sklearn.decomposition import TruncatedSVD
+        columns = np.unique(matrix.indices).astype(np.int32)
+        matrix = matrix[:, columns]
+        dimensions = min(dimensions, matrix.shape[0] - 1,
+                         matrix.shape[1] - 1)
+        if dimensions < 1:
+            return None
+        svd = TruncatedSVD(dimensions, random_state=seed).fit(matrix)
+        components = svd.components_.astype(np.float32)
+        vectors = normalize_rows(
+            np.asarray(matrix @ components.T, dtype=np.float32))
+        # Spherical k-means with about sqrt(N) clusters
+        clusters = max(1, int(round(np.sqrt(len(vectors)))))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), clusters,
+                                       replace=False)]
+        for _ in range(ITERATIONS):
+            assignment = nearest_centroids(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            counts = np.bincount(assignment, minlength=clusters)
+            # Clusters that lost all of their listings keep their centroid
+            sums[counts == 0] = centroids[counts == 0]
+            centroids = normalize_rows(sums)
+        assignment = nearest_centroids(vectors, centroids)
+        list_rows = np.argsort(assignment, kind='stable').astype(np.int32)
+        list_offsets = np.zeros(clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=clusters),
+                  out=list_offsets[1:])
+        return cls(components, vectors, centroids, list_rows, list_offsets,
+                   columns)
+
+    def project(self, query_matrix):
+        """Projects sparse TF-IDF query rows into the normalized dense
+        space of the listing vectors."""
+        # Move the query's terms to the projected columns, dropping any
+        # term that no listing uses
+        positions = np.minimum(
+            np.searchsorted(self.columns, query_matrix.indices),
+            len(self.columns) - 1)
+        known = self.columns[positions] == query_matrix.indices
+        query = csr_matrix(
+            (query_matrix.data * known, positions, query_matrix.indptr),
+            shape=(query_matrix.shape[0], len(self.columns)))
+        return normalize_rows(np.asarray(
+            query @ self.components.T, dtype=np.float32))
+
+    def similarity(self, query_matrix, rows):
+        """Returns the cosine similarity in the projected space between the
+        single query row and the listings at rows."""
+        return self.vectors[rows] @ self.project(query_matrix)[0]
+
+    def search(self, query_matrix, count, probes=PROBES):
+        """Returns the sorted positions of up to count listings closest to
+        the single query row. The closest clusters are probed until at least
+        probes clusters and count listings have been seen."""
+        query = self.project(query_matrix)[0]
+        order = np.argsort(-(self.centroids @ query), kind='stable')
+        sizes = np.diff(self.list_offsets)[order]
+        # Probe the fewest closest clusters that hold count listings
+        enough = np.searchsorted(np.cumsum(sizes), count) + 1
+        probed = order[:max(probes, enough)]
+        rows = np.concatenate(
+            [self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]]
+             for c in probed])
+        if len(rows) > count:
+            similarity = self.vectors[rows] @ query
+            rows = rows[np.argpartition(-similarity, count - 1)[:count]]
+        return np.sort(rows)
@@ -0,0 +1,123 @@
+# Job Hunting AI Tool: artifact.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# A compact binary file format for the recommender index. The file starts
+# with a magic number and a small JSON manifest, followed by raw NumPy
+# arrays, each aligned to 64 bytes: the string columns as one UTF-8 blob
+# plus an offsets array, the category codes, and the data, indices and
+# indptr arrays of the sparse TF-IDF matrices. read_arrays() memory maps
+# the file read-only and returns zero-copy views into it, so loading takes
+# milliseconds instead of parsing JSON and refitting, and every worker
+# process on a host shares the same pages of the page cache.
+#
+# Files are written to a temporary path and renamed into place, so a
+# process that already mapped the old file keeps reading it safely.
+#
+# Source:
+# 1.) mmap Documentation: https://docs.python.org/3/library/mmap.html
+# 2.) NumPy Documentation: https://numpy.org/doc/stable/reference/
+# generated/numpy.frombuffer.html
+
+# Imports: json for the manifest, mmap, os and struct for the file itself
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'JHAIIDX1'
+# The magic number is followed by the manifest length as a uint64
+HEADER = struct.Struct('<8sQ')
+ALIGNMENT = 64
+
+
+def aligned(offset):
+    """A helper function that rounds an offset up to the next ALIGNMENT."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def string_table(values):
+    """Encodes a list of strings (or bytes) as a UTF-8 blob and the int64
+    offsets of each string in it, so that string i is
+    blob[offsets[i]:offsets[i+1]]."""
+    encoded = [value.encode('utf-8') if isinstance(value, str) else value
+               for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class StringColumn:
+    """A read-only column of strings backed by a blob and its offsets, which
+    can stand in for an object array in the ListingStore. Strings are only
+    decoded when they are read."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.encoded(i).decode('utf-8')
+
+    def encoded(self, i):
+        """Returns string i as UTF-8 bytes without decoding it."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def write_arrays(path, manifest, arrays):
+    """Writes the manifest and the named arrays to path atomically."""
+    arrays = {name: np.ascontiguousarray(array)
+              for name, array in arrays.items()}
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str,
+                        'shape': list(array.shape)}
+        offset = aligned(offset + array.nbytes)
+    header = json.dumps(dict(manifest, arrays=layout)).encode('utf-8')
+    start = aligned(HEADER.size + len(header))
+    temp_path = f'{path}.tmp{os.getpid()}'
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(header)))
+            file.write(header)
+            for name, array in arrays.items():
+                file.seek(start + layout[name]['offset'])
+                file.write(array.tobytes())
+            file.truncate(start + offset)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def read_arrays(path):
+    """Memory maps a file written by write_arrays() and returns its
+    manifest and a dict of read-only arrays that point into the map."""
+    with open(path, 'rb') as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a recommender index file")
+        length = HEADER.unpack(header)[1]
+        manifest = json.loads(file.read(length))
+        # The map stays open for as long as any of the arrays use it
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    start = aligned(HEADER.size + length)
+    arrays = {}
+    for name, spec in manifest.pop('arrays').items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        arrays[name] = np.frombuffer(
+            buffer, dtype=dtype, count=count,
+            offset=start + spec['offset']).reshape(spec['shape'])
+    return manifest, arrays
@@ -0,0 +1,152 @@
+# Job Hunting AI Tool: categorical.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# Scores the single-label fields produced by clean_data.py: sector,
+# arrangement, jobType and experience. These only take a handful of
+# values ('Remote', 'Hybrid', 'On-site', 'Entry-Level', ...), so instead of
+# fitting a TfidfVectorizer for each of them (where stop words and min_df
+# could drop labels such as 'Intermediate-Level' or 'Part-time' entirely)
+# every label is split into atoms once, e.g. 'Full-time and Contractor'
+# becomes {'fulltime', 'contractor'}. For each user we compute one small
+# lookup table with the score of every distinct label, and the score of
+# each listing is then a NumPy gather of that table by the listing's
+# category code. The score is the cosine similarity between the user's
+# selected atoms and the listing's atoms, with optional partial credit
+# between neighbouring labels such as Entry-Level and Junior-Level.
+#
+# Each field also keeps an inverted index from every atom to the sorted
+# positions of the listings that carry it. In strict mode the recommender
+# intersects these posting lists first and only scores the listings that
+# match every field the user filled in.
+#
+# Source:
+# 1.) NumPy Documentation: https://numpy.org/doc/stable/user/
+# basics.indexing.html#integer-array-indexing
+
+# Import re to split labels and numpy for the lookup tables
+import re
+
+import numpy as np
+
+# Labels like 'Full-time, Contractor, and Internship' list several values
+ATOM_SPLIT = re.compile(r',|\band\b')
+# Case, spaces and dashes are ignored, so 'On-site' matches 'Onsite'
+ATOM_STRIP = re.compile(r'[^a-z0-9]')
+
+# Partial credit between neighbouring labels of a field, e.g. a
+# Junior-Level listing is still a fair match for an Entry-Level user
+PARTIAL_MATCHES = {
+    'experience': {('entrylevel', 'juniorlevel'): 0.5,
+                   ('juniorlevel', 'intermediatelevel'): 0.5,
+                   ('intermediatelevel', 'seniorlevel'): 0.5}}
+
+
+def label_atoms(label):
+    """A helper function that splits a label into its normalized atoms."""
+    atoms = []
+    for part in ATOM_SPLIT.split((label or '').lower()):
+        atom = ATOM_STRIP.sub('', part)
+        if atom and atom not in atoms:
+            atoms.append(atom)
+    return atoms
+
+
+def selected_atoms(values):
+    """A helper function that returns the distinct atoms of the labels a
+    user selected, which may be a single string or a list of strings."""
+    if not isinstance(values, list):
+        values = [values]
+    atoms = []
+    for value in values:
+        for atom in label_atoms(value):
+            if atom not in atoms:
+                atoms.append(atom)
+    return atoms
+
+
+class CategoricalField:
+    """Scores one single-label field. It holds the field's distinct labels
+    as rows of a small normalized label x atom matrix and the category
+    code of every listing, shared with the ListingStore."""
+
+    def __init__(self, name, labels, codes):
+        self.name = name
+        self.labels = labels
+        self.codes = codes
+        # Collect the atoms of every label in first-seen order
+        label_atom_lists = [label_atoms(label) for label in labels]
+        self.atoms = {}
+        for atoms in label_atom_lists:
+            for atom in atoms:
+                self.atoms.setdefault(atom, len(self.atoms))
+        # Each label row is L2 normalized, like a TF-IDF row would be
+        self.label_matrix = np.zeros((len(labels), len(self.atoms)))
+        for row, atoms in enumerate(label_atom_lists):
+            for atom in atoms:
+                self.label_matrix[row, self.atoms[atom]] = 1 / np.sqrt(
+                    len(atoms))
+        # Build the inverted index: atom -> sorted listing positions
+        order = np.argsort(codes, kind='stable')
+        bounds = np.cumsum(np.bincount(codes, minlength=len(labels)))
+        label_rows = np.split(order, bounds[:-1]) if len(labels) else []
+        postings = {}
+        for rows, atoms in zip(label_rows, label_atom_lists):
+            for atom in atoms:
+                postings.setdefault(atom, []).append(rows)
+        self.postings = {atom: np.sort(np.concatenate(rows)).astype(np.int32)
+                         for atom, rows in postings.items()}
+        # Spread the partial matches over the atoms this field has seen
+        self.affinity = {}
+        for (first, second), weight in PARTIAL_MATCHES.get(name, {}).items():
+            self.affinity.setdefault(first, {})[second] = weight
+            self.affinity.setdefault(second, {})[first] = weight
+
+    def query_matrix(self, user_values):
+        """Returns an M x A matrix with one row per user, holding the
+        weight of every atom for that user's selected labels."""
+        queries = np.zeros((len(user_values), len(self.atoms)))
+        for row, values in enumerate(user_values):
+            atoms = selected_atoms(values)
+            for atom in atoms:
+                for match, weight in self.affinity.get(atom, {}).items():
+                    if match in self.atoms:
+                        column = self.atoms[match]
+                        queries[row, column] = max(queries[row, column],
+                                                   weight)
+            for atom in atoms:
+                if atom in self.atoms:
+                    queries[row, self.atoms[atom]] = 1.0
+            if atoms:
+                queries[row] /= np.sqrt(len(atoms))
+        return queries
+
+    def candidates(self, values):
+        """Returns the sorted positions of the listings that carry any of
+        the user's selected labels exactly, or None when the user left the
+        field empty and it should not filter anything."""
+        atoms = selected_atoms(values)
+        if not atoms:
+            return None
+        rows = [self.postings[atom] for atom in atoms
+                if atom in self.postings]
+        if not rows:
+            return np.empty(0, dtype=np.int32)
+        if len(rows) == 1:
+            return rows[0]
+        return np.unique(np.concatenate(rows))
+
+    def label_scores(self, user_values):
+        """Returns the M x L lookup table with the score of every label for
+        every user."""
+        table = self.query_matrix(user_values) @ self.label_matrix.T
+        return np.minimum(table, 1.0)
+
+    def score_batch(self, user_values, rows=None):
+        """Returns the M x N scores of every listing (or only the listings
+        at rows) for every user, by gathering each user's label table with
+        the listings' codes."""
+        codes = self.codes if rows is None else self.codes[rows]
+        return self.label_scores(user_values)[:, codes]
@@ -0,0 +1,197 @@
+# Job Hunting AI Tool: corpus_cache.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# A process-wide cache of the job listings corpus and its fitted
+# recommender index. app.py loads cleaned_listings.json once through this
+# cache instead of parsing it on every request. The cache cheaply checks
+# the file's modification time and size at most once per check interval,
+# and when clean_data.py writes a new version it loads and fits the new
+# corpus on a background thread. The new snapshot is then swapped in with
+# a single assignment, so requests that already hold the old snapshot keep
+# reading it until they finish. Callbacks registered with on_reload (such
+# as clearing the result cache) run after every swap.
+#
+# Given an updater (update_index() in segments.py), a changed corpus is
+# first served by updating the current index with a delta segment, which
+# takes a fraction of a full fit. When the updated index reports that it
+# needs compaction, the same background thread then loads the fully
+# refitted index and swaps it in as well.
+#
+# With background=True even the first load runs on a background thread,
+# so the server can start listening right away (a cold start on Cloud Run
+# only waits for the imports). ready tells when the corpus is loaded, and
+# snapshot() waits up to ready_timeout seconds for it before raising
+# CorpusNotReady.
+#
+# Source:
+# 1.) threading Documentation: https://docs.python.org/3/library/
+# threading.html
+
+# Imports: os, threading and time for the file checks and reloads
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from model.recommender import file_fingerprint, load_index
+
+logger = logging.getLogger(__name__)
+
+# An immutable view of the corpus: the fitted index (which holds the
+# listings), the SHA-256 version of the file it was built from, the
+# (mtime, size) signature of that file and when it was loaded
+CorpusSnapshot = namedtuple(
+    'CorpusSnapshot', ['index', 'version', 'signature', 'loaded_at'])
+
+
+class CorpusNotReady(RuntimeError):
+    """Raised when a request needs the corpus before its first load is
+    done."""
+
+
+def file_signature(path):
+    """A helper function that returns the cheap (mtime, size) signature
+    used to notice that cleaned_listings.json has been rewritten."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class CorpusCache:
+    """Holds the current CorpusSnapshot for cleaned_listings.json and
+    rebuilds it in the background whenever the file changes."""
+
+    def __init__(self, clean_path, check_interval=2.0, loader=load_index,
+                 on_reload=(), updater=None, background=False,
+                 ready_timeout=10.0):
+        self.clean_path = clean_path
+        self.check_interval = check_interval
+        self.loader = loader
+        self.on_reload = list(on_reload)
+        self.updater = updater
+        self.reloads = 0
+        self.compactions = 0
+        self.ready_timeout = ready_timeout
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._ready = threading.Event()
+        self._snapshot = None
+        if background:
+            # Check for the file now, and load it on a background thread
+            self._last_check = -float('inf')
+            self.check()
+        else:
+            # The first load is synchronous so the app never serves
+            # without data
+            self._last_check = time.monotonic()
+            self._snapshot = self._load(file_signature(clean_path))
+            self._ready.set()
+
+    @property
+    def ready(self):
+        """Whether the first load of the corpus is done."""
+        return self._ready.is_set()
+
+    def resume(self):
+        """Restarts an unfinished first load in a forked process (e.g. a
+        gunicorn worker), since threads are not copied by fork()."""
+        if not self.ready:
+            self._lock = threading.Lock()
+            self._reloading = False
+            self._last_check = -float('inf')
+            self.check()
+
+    def _load(self, signature, current=None):
+        """Loads the index for the file and wraps it in a new snapshot. With
+        an updater, the current index is updated instead."""
+        if current is not None and self.updater is not None:
+            index = self.updater(current.index, self.clean_path)
+        else:
+            index = self.loader(self.clean_path)
+        return CorpusSnapshot(index, index.fingerprint, signature,
+                              time.time())
+
+    def _swap(self, snapshot):
+        """Makes snapshot the current one and runs the callbacks."""
+        # Replacing the reference is atomic, in-flight requests keep the
+        # snapshot they already hold
+        self._snapshot = snapshot
+        self.reloads += 1
+        for callback in self.on_reload:
+            callback(snapshot)
+        logger.info('Corpus reloaded: %d listings (version %s)',
+                    len(snapshot.index), snapshot.version[:12])
+
+    def snapshot(self):
+        """Returns the current snapshot. A request should call this once
+        and use the same snapshot until it is done. Raises CorpusNotReady
+        if the first load is not done within ready_timeout seconds."""
+        self.check()
+        if not self._ready.wait(self.ready_timeout):
+            raise CorpusNotReady(
+                f"'{self.clean_path}' has not been loaded yet")
+        return self._snapshot
+
+    def check(self, wait=False):
+        """Starts a background reload if the file's signature changed since
+        the current snapshot. Checks are throttled to one per interval
+        unless wait is True, which also blocks until the reload is done."""
+        now = time.monotonic()
+        if not wait and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            signature = file_signature(self.clean_path)
+        except OSError as error:
+            # Keep serving the old snapshot while the file is missing
+            logger.warning("Error checking '%s' due to: %s", self.clean_path,
+                           error)
+            return
+        if self._snapshot is not None and (
+                signature == self._snapshot.signature):
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        if wait:
+            self._reload(signature)
+        else:
+            threading.Thread(target=self._reload, args=(signature,),
+                             daemon=True).start()
+
+    def _reload(self, signature):
+        """Rebuilds the snapshot for the new file and swaps it in."""
+        try:
+            current = self._snapshot
+            if current is None:
+                # The first load, which is not a reload
+                self._snapshot = self._load(signature)
+                self._ready.set()
+                logger.info('Corpus loaded: %d listings (version %s)',
+                            len(self._snapshot.index),
+                            self._snapshot.version[:12])
+                return
+            if file_fingerprint(self.clean_path) == current.version:
+                # Only the mtime changed, so the fitted index is still valid
+                self._snapshot = current._replace(signature=signature)
+                return
+            snapshot = self._load(signature, current)
+            self._swap(snapshot)
+            if getattr(snapshot.index, 'needs_compaction', False):
+                # Refit the whole corpus to merge the segments
+                compacted = self._load(signature)
+                if compacted.version == snapshot.version:
+                    self.compactions += 1
+                    self._swap(compacted)
+        except (IOError, ValueError) as error:
+            # A half written or invalid file (or a failed first load) is
+            # retried on the next check
+            logger.warning("Error reloading '%s' due to: %s",
+                           self.clean_path, error)
+        finally:
+            with self._lock:
+                self._reloading = False
@@ -0,0 +1,134 @@
+# Job Hunting AI Tool: listing_store.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# A compact, columnar store for the job listings in cleaned_listings.json.
+# Instead of keeping one Python dict per listing, each field is kept as one
+# contiguous column: free text fields (title, company, description, ...)
+# are NumPy object arrays, and the low-cardinality fields produced by
+# clean_data.py (arrangement, jobType, sector and experience) are stored as
+# small integer category codes plus one shared list of labels. The
+# recommender builds its combined text feature from these columns once,
+# and results are returned by index lookups into the columns.
+#
+# Source:
+# 1.) NumPy Documentation: https://numpy.org/doc/stable/reference/
+# arrays.dtypes.html
+
+# Import json for the encoded listings and numpy for the column arrays
+import json
+
+import numpy as np
+
+# The fields clean_data.py fills from a small closed set of labels
+CATEGORICAL_COLUMNS = ('arrangement', 'jobType', 'sector', 'experience')
+# The number of description characters kept in summary payloads
+SUMMARY_LENGTH = 300
+
+
+def summarize(text, length=SUMMARY_LENGTH):
+    """A helper function that cuts a text at the last space before length
+    characters and marks the cut with an ellipsis."""
+    if not isinstance(text, str) or len(text) <= length:
+        return text
+    cut = text[:length]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + '\u2026'
+
+
+class ListingStore:
+    """Holds the job listings column by column. Columns missing from some
+    listings keep a boolean mask so records come back exactly as loaded."""
+
+    def __init__(self, names, columns, labels, codes, present):
+        self.names = names
+        self.columns = columns
+        self.labels = labels
+        self.codes = codes
+        self.present = present
+
+    @classmethod
+    def from_listings(cls, job_listings):
+        """Splits a list of listing dicts into columns. Column order follows
+        the order the keys are first seen in, which is the order
+        clean_data.py writes them."""
+        names = []
+        for job in job_listings:
+            for name in job:
+                if name not in names:
+                    names.append(name)
+        columns, labels, codes, present = {}, {}, {}, {}
+        for name in names:
+            mask = np.fromiter((name in job for job in job_listings),
+                               dtype=bool, count=len(job_listings))
+            if not mask.all():
+                present[name] = mask
+            values = [job.get(name) for job in job_listings]
+            if name in CATEGORICAL_COLUMNS:
+                # Assign each distinct label a code in first-seen order
+                lookup = {}
+                column_codes = [lookup.setdefault(value, len(lookup))
+                                for value in values]
+                labels[name] = list(lookup)
+                codes[name] = np.array(
+                    column_codes,
+                    dtype=np.min_scalar_type(max(len(lookup) - 1, 0)))
+            else:
+                columns[name] = np.empty(len(values), dtype=object)
+                columns[name][:] = values
+        return cls(names, columns, labels, codes, present)
+
+    def __len__(self):
+        if self.codes:
+            return len(next(iter(self.codes.values())))
+        if self.columns:
+            return len(next(iter(self.columns.values())))
+        return 0
+
+    def column(self, name, default=''):
+        """Returns a whole column as a list of values, with default in place
+        of any listing that does not have the field."""
+        if name in self.codes:
+            labels = self.labels[name]
+            values = [labels[code] for code in self.codes[name]]
+        elif name in self.columns:
+            values = list(self.columns[name])
+        else:
+            return [default] * len(self)
+        mask = self.present.get(name)
+        if mask is not None:
+            values = [value if has_value else default
+                      for value, has_value in zip(values, mask)]
+        return values
+
+    def value(self, name, i):
+        """Returns a single field of the i-th listing."""
+        if name in self.codes:
+            return self.labels[name][self.codes[name][i]]
+        return self.columns[name][i]
+
+    def record(self, i):
+        """Rebuilds the i-th listing as a dict in its original key order."""
+        return {name: self.value(name, i) for name in self.names
+                if name not in self.present or self.present[name][i]}
+
+    def records(self, indices):
+        """Rebuilds the listings at the given positions."""
+        return [self.record(i) for i in indices]
+
+    def encode(self, summary=False):
+        """Returns the UTF-8 JSON encoding of every listing, so responses
+        can be assembled from these fragments without encoding them again.
+        Summary fragments hold a shortened description."""
+        payloads = []
+        for i in range(len(self)):
+            record = self.record(i)
+            if summary and 'description' in record:
+                record['description'] = summarize(record['description'])
+            payloads.append(json.dumps(
+                record, ensure_ascii=False,
+                separators=(',', ':')).encode('utf-8'))
+        return payloads
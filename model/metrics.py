@@ -0,0 +1,162 @@
+# Job Hunting AI Tool: metrics.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# Lightweight instrumentation for the request path, exported in the
+# Prometheus text format on /metrics without any extra dependency. A
+# RequestTimer is made current for each request (through a context
+# variable, so threads do not mix up their requests) and every hot stage
+# wraps itself in stage(name): parsing the JSON, taking the corpus
+# snapshot, vectorizing the input, the similarity product that scores
+# every field, top-k selection, building the records and serializing the
+# response. When no timer is current, stage() costs a single lookup. At
+# the end of the request the stage durations go into histograms, and can
+# be returned to the caller in a Server-Timing header.
+#
+# Source:
+# 1.) Prometheus exposition format: https://prometheus.io/docs/
+# instrumenting/exposition_formats/
+# 2.) Server-Timing: https://www.w3.org/TR/server-timing/
+
+# Imports: threading and time for the metrics, contextvars for the timer
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# Histogram buckets in seconds, fine enough for sub-millisecond stages
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The RequestTimer of the request being served by this thread, if any
+current_timer = ContextVar('current_timer', default=None)
+_NO_TIMER = nullcontext()
+
+
+def format_labels(labels):
+    """A helper function that formats a label dict as {name="value"}."""
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+class Histogram:
+    """A Prometheus histogram with optional labels."""
+
+    def __init__(self, name, description, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Records one observation for the given label values."""
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(
+                key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Returns the histogram in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted(self._series.items())
+            for key, (counts, total, count) in series:
+                for bound, bucket in zip(self.buckets, counts):
+                    labels = format_labels(key + (('le', repr(bound)),))
+                    lines.append(f'{self.name}_bucket{labels} {bucket}')
+                labels = format_labels(key + (('le', '+Inf'),))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                lines.append(f'{self.name}_sum{format_labels(key)} {total}')
+                lines.append(f'{self.name}_count{format_labels(key)} {count}')
+        return lines
+
+
+class Sampled:
+    """A counter or gauge whose value is read from a function when the
+    metrics are rendered, e.g. the result cache's hit counter."""
+
+    def __init__(self, name, description, kind, function):
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.function = function
+
+    def render(self):
+        """Returns the current value in the Prometheus text format."""
+        return [f'# HELP {self.name} {self.description}',
+                f'# TYPE {self.name} {self.kind}',
+                f'{self.name} {self.function()}']
+
+
+class Registry:
+    """The set of metrics rendered on /metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def histogram(self, name, description, labelnames=()):
+        """Creates and registers a histogram."""
+        metric = Histogram(name, description, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def sampled(self, name, description, kind, function):
+        """Registers a counter or gauge read from function."""
+        self.metrics.append(Sampled(name, description, kind, function))
+
+    def render(self):
+        """Returns every metric in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimer:
+    """Adds up the time spent in each named stage of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Times the body of the with statement as the named stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (self.stages.get(name, 0.0)
+                                 + time.perf_counter() - start)
+
+    def total(self):
+        """Returns the seconds since the request started."""
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Returns the stages as a Server-Timing header value in ms."""
+        entries = [f'{name};dur={1000 * seconds:.3f}'
+                   for name, seconds in self.stages.items()]
+        entries.append(f'total;dur={1000 * self.total():.3f}')
+        return ', '.join(entries)
+
+
+def stage(name):
+    """Times a stage of the current request, or does nothing when the code
+    is not running inside a timed request."""
+    timer = current_timer.get()
+    if timer is None:
+        return _NO_TIMER
+    return timer.stage(name)
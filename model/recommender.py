@@ -17,8 +17,30 @@
 # vectors. This metric can range from -1 (completely dissimilar)
 # to 1 (completely identical). Our model frames user input vectors
 # against their corresponding variables in the job listings matrx.
-# We then assign a similarity score, and return the top 5 items based
-# on ranking.
+# We then assign a similarity score, and return the top 5 items (or the
+# requested page of k items) based on ranking. The single-label fields
+# (sector, experience, jobType and arrangement) are not vectorized with
+# TF-IDF; they are scored with the label lookup tables in categorical.py.
+#
+# The job listings only change when clean_data.py is re-run, so the
+# vectorizers and their matrices are fitted once into a RecommenderIndex,
+# next to a columnar ListingStore of the listings themselves.
+# The index is kept in memory by app.py and saved next to
+# cleaned_listings.json. Every field is stored side by side in one fused
+# CSR matrix: the L2 normalized TF-IDF rows of the free text fields next to
+# the one-hot label codes of the single-label fields. A user's query is
+# laid out the same way (the TF-IDF rows of their input next to the score
+# of every label), with every field scaled by its weight, so the weighted
+# score of every listing is a single sparse matrix-vector product and the
+# weights can change per request without touching the matrix. The
+# product is taken as matrix @ query, in the matrix's dtype, so SciPy
+# never converts or copies the listing matrix. The saved index is the
+# binary file format of artifact.py: loading it memory maps the string
+# columns, category codes and CSR matrices instead of parsing and fitting,
+# and the fitted vectorizers are kept as numpy-only QueryVectorizers.
+# scikit-learn is only imported when an index is fitted, so serving a
+# saved index needs nothing but NumPy and SciPy, and the app starts
+# without paying for the scikit-learn (and pandas) imports.
 #
 # Sources:
 # 1.) Scikit-learn: https://scikit-learn.org/stable/modules/generated/
@@ -31,101 +53,805 @@
 # 3.) Capital One: https://www.capitalone.com/tech/machine-learning/
 # understanding-tf-idf/
 
-# Import sklearn module for TfidfVectorizer and cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-# Import pandas the create the matrix using pandas dataframe
-import pandas as pd
+# Imports: hashlib, json and os to fingerprint and persist the index,
+# logging for errors on the request path
+import hashlib
+import json
+import logging
+import os
+# Import numpy and scipy for the score matrices
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+from model.ann import AnnIndex
+from model.artifact import (
+    StringColumn, read_arrays, string_table, write_arrays)
+from model.categorical import CategoricalField
+from model.listing_store import ListingStore
+from model.metrics import stage
+from model.result_cache import canonical_profile
+from model.vectorizer import HashedVectorizer, QueryVectorizer
+
+logger = logging.getLogger(__name__)
+
+# The name of the saved index, which lives next to cleaned_listings.json
+INDEX_FILE = 'recommender_index.bin'
+
+# Bumped whenever the layout of a saved index changes, so that older saved
+# indexes are refitted instead of being loaded
+INDEX_VERSION = 9
+
+# The pre-encoded JSON payloads kept for every listing: the full listing,
+# and a summary with a shortened description for the summary response mode
+PAYLOADS = ('full', 'summary')
+
+# The number of users scored together by recommend_batch()
+BATCH_SIZE = 256
+
+# The number of ranked listings kept per cached profile, so that the first
+# pages of results are served from one cache entry
+RESULT_WINDOW = 50
+
+# The retrieval engines: "exact" scores every listing, "ann" only re-ranks
+# a few candidates. The single-label fields carry most of the weight, so the
+# candidates are the listings of the label combinations that score best for
+# the user, and when those hold too many listings, the ones whose label
+# score plus their similarity to the user's input in the LSA space of the
+# combined text field (ann.py) is highest. There are at least
+# ANN_CANDIDATES candidates, or ANN_CANDIDATE_FACTOR times the number of
+# results requested. At most ANN_SCAN_LIMIT listings, the closest ones found
+# by the ANN index, are compared with the user's input
+ENGINES = ('exact', 'ann')
+ANN_FIELD = 'text'
+ANN_CANDIDATES = 200
+ANN_CANDIDATE_FACTOR = 4
+ANN_SCAN_LIMIT = 20000
+# The arrays of an AnnIndex, in the order of its constructor
+ANN_ARRAYS = ('components', 'vectors', 'centroids', 'list_rows',
+              'list_offsets', 'columns')
+
+# The single-label fields from clean_data.py, which are scored by the
+# label lookup tables in categorical.py instead of TF-IDF
+CATEGORICAL_FIELDS = ['sector', 'experience', 'jobType', 'arrangement']
+
+# Feature Engineering:
+# Each free text field is (name, listing column, user input key,
+# vectorizer options). stop_words = 'english' removes common words with
+# little meaning from our calculation. max_df removes words that appear
+# more than 85% and min_df removes that appear less than 1%. The
+# description field is matched against the user's experience, and the
+# text field matches any free text input across the combined listing.
+FIELDS = [
+    ('description', 'description', 'experience',
+     {'stop_words': 'english', 'max_df': 0.85, 'min_df': 0.01}),
+    ('text', 'combined', 'textInput', {'stop_words': 'english'})]
+
+# How the TF-IDF matrices are stored: their dtype, the most terms kept per
+# free text field (the most frequent ones, None keeps all of them) and, when
+# hash_features is not 0, the number of columns of the HashedVectorizer used
+# instead of a vocabulary. float32 halves the size of the matrices, and a
+# hashed field needs no vocabulary in memory at all
+DEFAULT_OPTIONS = {'dtype': 'float32',
+                   'max_features': {'description': 50000, 'text': 200000},
+                   'hash_features': 0}
+
+# Assign cosine similarity: sector: 0.3, experience: 0.25, jobType: 0.1,
+# arrangement: 0.175, description: 0.1, text: 0.075 (might change). A
+# request may override any of them (see field_weights())
+WEIGHTS = {'sector': 0.3, 'experience': 0.25, 'jobType': 0.1,
+           'arrangement': 0.175, 'description': 0.1, 'text': 0.075}
+
+# The order of the fields' columns in the fused listing matrix
+FUSED_FIELDS = [name for name, _, _, _ in FIELDS] + CATEGORICAL_FIELDS
+
+# The number of matching terms listed per free text field by explain()
+TOP_TERMS = 5
+
+# The listing columns concatenated into the combined text feature
+COMBINED_COLUMNS = ['jobType', 'arrangement', 'sector', 'experience',
+                    'description', 'title', 'company', 'location']
+
+
+def combine_columns(store):
+    """A helper function that concatenates the jobType, arrangement, sector,
+    experience, description, title, company, and location columns of the
+    listing store into the combined text feature of every listing."""
+    return [' '.join(parts) for parts in zip(
+        *(store.column(column) for column in COMBINED_COLUMNS))]
+
+
+def build_user_features(user_data):
+    """A helper function that joins each of the user's selections into one
+    string per input key. The user_data dict is left untouched."""
+    features = {}
+    for key in ('jobType', 'arrangement', 'sector', 'experience',
+                'textInput'):
+        value = user_data.get(key, [])
+        # Ensure the model recognizes all incoming data in array format
+        if not isinstance(value, list):
+            value = [value]
+        features[key] = ', '.join(value)
+    return features
+
+
+def file_fingerprint(path):
+    """A helper function that returns the SHA-256 digest of a file, which is
+    used to tell whether a saved index matches cleaned_listings.json."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_listings(clean_path):
+    """Reads cleaned_listings.json once and returns the job listings along
+    with the fingerprint of exactly the bytes that were parsed."""
+    with open(clean_path, 'rb') as job_file:
+        content = job_file.read()
+    return json.loads(content), hashlib.sha256(content).hexdigest()
+
+
+def index_options(**options):
+    """A helper function that fills in the DEFAULT_OPTIONS missing from
+    options and rejects any unknown option."""
+    unknown = set(options) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise TypeError(f'Unknown index options: {", ".join(sorted(unknown))}')
+    return dict(DEFAULT_OPTIONS, **options)
+
+
+def field_weights(weights=None):
+    """A helper function that fills in the WEIGHTS missing from a
+    request's weights and rejects unknown fields and weights that are not
+    non-negative numbers."""
+    weights = weights or {}
+    unknown = set(weights) - set(WEIGHTS)
+    if unknown:
+        raise ValueError(f'Unknown weights: {", ".join(sorted(unknown))}')
+    for name, weight in weights.items():
+        if isinstance(weight, bool) or not isinstance(
+                weight, (int, float)) or not 0 <= weight < float('inf'):
+            raise ValueError(f'The weight of {name} must be a number >= 0')
+    return dict(WEIGHTS, **weights)
+
+
+def field_spans(vectorizers, categorical):
+    """A helper function that returns the (start, end) columns of every
+    field in the fused listing matrix, in FUSED_FIELDS order: one column
+    per term (or hashed column) of a free text field, one per label of a
+    single-label field."""
+    spans, start = {}, 0
+    for name in FUSED_FIELDS:
+        if name in vectorizers:
+            width = len(vectorizers[name].idf)
+        else:
+            width = len(categorical[name].labels)
+        spans[name] = (start, start + width)
+        start += width
+    return spans
+
+
+def fuse_matrices(matrices, categorical, dtype):
+    """A helper function that stacks the TF-IDF matrix of every free
+    text field and the one-hot label codes of every single-label field
+    side by side into the fused listing matrix."""
+    blocks = [matrices[name] for name, _, _, _ in FIELDS]
+    for name in CATEGORICAL_FIELDS:
+        codes = categorical[name].codes
+        blocks.append(csr_matrix(
+            (np.ones(len(codes)), codes, np.arange(len(codes) + 1)),
+            shape=(len(codes), len(categorical[name].labels))))
+    return hstack(blocks, format='csr', dtype=dtype)
+
+
+def label_combinations(categorical):
+    """A helper function that groups the listings by their combination of
+    single-label field codes. Returns the codes of every combination by
+    field, the combination of every listing, and the listings of every
+    combination c as rows[offsets[c]:offsets[c + 1]]."""
+    fields = [categorical[name] for name in CATEGORICAL_FIELDS]
+    keys = np.ravel_multi_index(
+        [field.codes.astype(np.int64) for field in fields],
+        [len(field.labels) for field in fields])
+    unique, inverse = np.unique(keys, return_inverse=True)
+    codes = dict(zip(CATEGORICAL_FIELDS, np.unravel_index(
+        unique, [len(field.labels) for field in fields])))
+    rows = np.argsort(inverse, kind='stable').astype(np.int32)
+    offsets = np.zeros(len(unique) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inverse, minlength=len(unique)), out=offsets[1:])
+    return codes, inverse.astype(np.int32), rows, offsets
+
+
+def row_block(matrix, start, end):
+    """A helper function that returns the rows start to end of a CSR
+    matrix as views of its arrays. SciPy copies a slice of rows, and its
+    constructor copies views of much larger arrays, so the block's arrays
+    are set directly."""
+    first, last = matrix.indptr[start], matrix.indptr[end]
+    block = csr_matrix((end - start, matrix.shape[1]), dtype=matrix.dtype)
+    block.data = matrix.data[first:last]
+    block.indices = matrix.indices[first:last]
+    block.indptr = matrix.indptr[start:end + 1] - first
+    return block
+
+
+def categorical_fields(store):
+    """A helper function that builds the CategoricalField of every
+    single-label field from the store's labels and category codes."""
+    categorical = {}
+    for name in CATEGORICAL_FIELDS:
+        if name in store.codes:
+            categorical[name] = CategoricalField(
+                name, store.labels[name], store.codes[name])
+        else:
+            # Every listing is missing the field, so nothing matches
+            categorical[name] = CategoricalField(
+                name, [''], np.zeros(len(store), dtype=np.uint8))
+    return categorical
+
+
+class RecommenderIndex:
+    """The fitted recommender model. It holds the job listings in a
+    columnar ListingStore, one CategoricalField per single-label field, one
+    fitted QueryVectorizer per free text field and the fused listing
+    matrix of every field, whose columns spans maps by field, so that
+    scoring a user only needs a few table lookups, transform() and a
+    single sparse product."""
 
+    def __init__(self, store, categorical, vectorizers, matrix,
+                 fingerprint=None, ann=None, payloads=None, options=None):
+        self.store = store
+        self.categorical = categorical
+        self.vectorizers = vectorizers
+        self.matrix = matrix
+        self.spans = field_spans(vectorizers, categorical)
+        if matrix.shape != (len(store), self.spans[FUSED_FIELDS[-1]][1]):
+            raise ValueError('The matrix does not match the fields')
+        self.fingerprint = fingerprint
+        self.ann = ann
+        # Every listing is encoded to JSON once, when the index is built
+        if payloads is None:
+            payloads = {kind: StringColumn(*string_table(
+                store.encode(summary=kind == 'summary')))
+                for kind in PAYLOADS}
+        self.payloads = payloads
+        self.options = index_options(**(options or {}))
+        self.version = INDEX_VERSION
+        # The file the index was loaded from, which shard workers map
+        self.path = None
+        self._positions = None
+        self._combinations = None
 
-def job_recommender(user_data, job_listings):
+    def __len__(self):
+        return len(self.store)
+
+    @classmethod
+    def build(cls, job_listings, fingerprint=None, vectorizers=None,
+              **options):
+        """Encodes the single-label fields and fits one vectorizer and
+        listing matrix per free text field from the structured data in
+        cleaned_listings.json, stored as set by options (see
+        DEFAULT_OPTIONS). Given the vectorizers of another index, the
+        listings are transformed with its frozen vocabularies and idf
+        weights instead, as for the delta segments of segments.py."""
+        options = index_options(**options)
+        store = ListingStore.from_listings(job_listings)
+        categorical = categorical_fields(store)
+        # Build the combined text feature once for every listing
+        columns = {'combined': combine_columns(store)}
+        matrices = {}
+        fitted = vectorizers is None
+        if fitted:
+            vectorizers = {}
+        for name, column, _, field_options in FIELDS:
+            if column not in columns:
+                columns[column] = store.column(column)
+            if not fitted:
+                matrix = vectorizers[name].transform(columns[column])
+            elif options['hash_features']:
+                vectorizers[name], matrix = HashedVectorizer.fit(
+                    columns[column], options['hash_features'],
+                    **field_options)
+            else:
+                # Imported here so that only fitting needs scikit-learn, and
+                # delta segments are transformed without it
+                from sklearn.feature_extraction.text import TfidfVectorizer
+                vectorizer = TfidfVectorizer(
+                    max_features=options['max_features'].get(name),
+                    **field_options)
+                matrix = vectorizer.fit_transform(columns[column])
+                # Only the query side of the fitted vectorizer is kept
+                vectorizers[name] = QueryVectorizer.from_tfidf(vectorizer)
+            matrices[name] = matrix.astype(options['dtype'])
+        # Project the combined text for the approximate "ann" engine
+        ann = AnnIndex.build(matrices[ANN_FIELD]) if fitted else None
+        matrix = fuse_matrices(matrices, categorical, options['dtype'])
+        return cls(store, categorical, vectorizers, matrix, fingerprint,
+                   ann, options=options)
+
+    def save(self, path):
+        """Writes the fitted index to disk in the binary format of
+        artifact.py. Every column of the store must hold strings."""
+        store = self.store
+        arrays = {}
+        for name, column in store.columns.items():
+            if not all(isinstance(value, str) for value in column):
+                raise TypeError(f"Column '{name}' does not hold strings")
+            arrays[f'column/{name}/blob'], arrays[
+                f'column/{name}/offsets'] = string_table(column)
+        for name, codes in store.codes.items():
+            arrays[f'codes/{name}'] = codes
+        for name, mask in store.present.items():
+            arrays[f'present/{name}'] = mask
+        arrays['matrix/data'] = self.matrix.data
+        arrays['matrix/indices'] = self.matrix.indices
+        arrays['matrix/indptr'] = self.matrix.indptr
+        fields = {}
+        for name, vectorizer in self.vectorizers.items():
+            hashed = isinstance(vectorizer, HashedVectorizer)
+            if not hashed:
+                arrays[f'{name}/terms/blob'], arrays[
+                    f'{name}/terms/offsets'] = string_table(vectorizer.terms)
+            arrays[f'{name}/idf'] = vectorizer.idf
+            fields[name] = {'stop_words': sorted(vectorizer.stop_words),
+                            'token_pattern': vectorizer.token_pattern,
+                            'lowercase': vectorizer.lowercase,
+                            'hashed': hashed}
+        for kind, column in self.payloads.items():
+            arrays[f'payload/{kind}/blob'] = column.blob
+            arrays[f'payload/{kind}/offsets'] = column.offsets
+        if self.ann is not None:
+            for name in ANN_ARRAYS:
+                arrays[f'ann/{name}'] = getattr(self.ann, name)
+        manifest = {'version': self.version, 'fingerprint': self.fingerprint,
+                    'names': store.names, 'labels': store.labels,
+                    'fields': fields, 'shape': list(self.matrix.shape),
+                    'options': self.options}
+        write_arrays(path, manifest, arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Memory maps an index previously written by save(). The columns,
+        codes and the fused matrix are read-only views into the file."""
+        manifest, arrays = read_arrays(path)
+        if manifest.get('version') != INDEX_VERSION:
+            raise TypeError(f"'{path}' was saved by an older version")
+        names, labels = manifest['names'], manifest['labels']
+        columns = {name: StringColumn(arrays[f'column/{name}/blob'],
+                                      arrays[f'column/{name}/offsets'])
+                   for name in names if name not in labels}
+        codes = {name: arrays[f'codes/{name}'] for name in labels}
+        present = {name: arrays[f'present/{name}'] for name in names
+                   if f'present/{name}' in arrays}
+        store = ListingStore(names, columns, labels, codes, present)
+        vectorizers = {}
+        for name, field in manifest['fields'].items():
+            settings = (field['stop_words'], field['token_pattern'],
+                        field['lowercase'])
+            if field['hashed']:
+                vectorizers[name] = HashedVectorizer(
+                    arrays[f'{name}/idf'], *settings)
+            else:
+                terms = StringColumn(arrays[f'{name}/terms/blob'],
+                                     arrays[f'{name}/terms/offsets'])
+                vectorizers[name] = QueryVectorizer(
+                    list(terms), arrays[f'{name}/idf'], *settings)
+        matrix = csr_matrix((arrays['matrix/data'], arrays['matrix/indices'],
+                             arrays['matrix/indptr']),
+                            shape=manifest['shape'])
+        ann = None
+        if 'ann/vectors' in arrays:
+            ann = AnnIndex(*(arrays[f'ann/{name}'] for name in ANN_ARRAYS))
+        payloads = {kind: StringColumn(arrays[f'payload/{kind}/blob'],
+                                       arrays[f'payload/{kind}/offsets'])
+                    for kind in PAYLOADS}
+        index = cls(store, categorical_fields(store), vectorizers, matrix,
+                    manifest['fingerprint'], ann, payloads,
+                    manifest['options'])
+        index.path = path
+        return index
+
+    def nbytes(self):
+        """Returns the bytes taken by each free text field: the entries of
+        its columns in the fused matrix, its vocabulary and idf weights as
+        saved in the index and, for ANN_FIELD, the arrays of the ANN
+        index."""
+        report = {}
+        indices = self.matrix.indices
+        entry = self.matrix.data.itemsize + indices.itemsize
+        for name, vectorizer in self.vectorizers.items():
+            start, end = self.spans[name]
+            blob, offsets = string_table(vectorizer.terms)
+            report[name] = {
+                'matrix': entry * int(np.count_nonzero(
+                    (indices >= start) & (indices < end))),
+                'vocabulary': blob.nbytes + offsets.nbytes,
+                'idf': vectorizer.idf.nbytes}
+        if self.ann is not None:
+            report[ANN_FIELD]['ann'] = sum(
+                getattr(self.ann, name).nbytes for name in ANN_ARRAYS)
+        return report
+
+    def score(self, user_data, weights=None):
+        """Returns the weighted cosine similarity of every listing against
+        the user's input as a 1D array."""
+        return self.score_batch([user_data], weights=weights)[0]
+
+    def queries(self, users, weights=None):
+        """Returns the M x C query matrix of the users, laid out like the
+        columns of the fused matrix: the TF-IDF row of the user's input for
+        every free text field and the score of every label for every
+        single-label field, each scaled by the field's weight."""
+        weights = field_weights(weights)
+        features = [build_user_features(user_data) for user_data in users]
+        blocks = []
+        for name, _, key, _ in FIELDS:
+            blocks.append(weights[name] * self.vectorizers[name].transform(
+                [feature[key] for feature in features]))
+        for name in CATEGORICAL_FIELDS:
+            # The user's lookup table holds the score of every label
+            blocks.append(csr_matrix(
+                weights[name] * self.categorical[name].label_scores(
+                    [user_data.get(name, []) for user_data in users])))
+        return hstack(blocks, format='csr', dtype=self.matrix.dtype)
+
+    def score_batch(self, users, rows=None, weights=None):
+        """Returns the weighted cosine similarity of every listing (or only
+        the listings at rows) against each user as an M x N array. The
+        TF-IDF rows are already L2 normalized and the label columns are
+        one-hot, so every field's score is a term of a single product of
+        the fused matrix with the users' queries. A slice of rows is
+        scored in place, without copying its part of the matrix."""
+        if rows is None:
+            matrix = self.matrix
+        elif isinstance(rows, slice):
+            matrix = row_block(self.matrix, rows.start, rows.stop)
+        else:
+            matrix = self.matrix[rows]
+        with stage('vectorize'):
+            queries = self.queries(users, weights)
+        with stage('similarity'):
+            if len(users) == 1:
+                # One matrix-vector product into one output array
+                return (matrix @ queries.toarray()[0])[np.newaxis]
+            return (matrix @ queries.T).toarray().T
+
+    def explain(self, user_data, rows, weights=None):
+        """Explains the scores of the listings at rows, which should be the
+        few winners of a ranking. Returns one dict per listing with its
+        combined score, the weighted contribution of every field and, for
+        each free text field, the TOP_TERMS terms of the user's input that
+        contributed most, with their weighted share of the score. Only the
+        winners' rows are touched, so this costs little next to ranking."""
+        weights = field_weights(weights)
+        rows = np.asarray(rows, dtype=np.intp)
+        fields = {name: weights[name] * field.score_batch(
+                      [user_data.get(name, [])], rows)[0]
+                  for name, field in self.categorical.items()}
+        features = build_user_features(user_data)
+        matrix = self.matrix
+        terms = {}
+        for name, _, key, _ in FIELDS:
+            vectorizer = self.vectorizers[name]
+            query = vectorizer.transform([features[key]])
+            names = vectorizer.names(features[key])
+            first, last = self.spans[name]
+            term_weights = np.zeros(last - first)
+            term_weights[query.indices] = weights[name] * query.data
+            fields[name] = np.zeros(len(rows))
+            terms[name] = []
+            for i, row in enumerate(rows):
+                # The overlap of the query with the field's columns of the
+                # listing's sparse row
+                start, end = matrix.indptr[row], matrix.indptr[row + 1]
+                columns = matrix.indices[start:end]
+                within = (columns >= first) & (columns < last)
+                columns = columns[within] - first
+                shares = matrix.data[start:end][within] * term_weights[
+                    columns]
+                fields[name][i] = shares.sum()
+                best = np.lexsort((columns, -shares))[:TOP_TERMS]
+                terms[name].append([
+                    [names[columns[j]], float(shares[j])]
+                    for j in best if shares[j] > 0])
+        return [{'score': float(sum(values[i] for values in fields.values())),
+                 'fields': {name: float(values[i])
+                            for name, values in fields.items()},
+                 'terms': {name: matches[i]
+                           for name, matches in terms.items()}}
+                for i in range(len(rows))]
+
+    def records(self, user_data, rows, explain=False, weights=None):
+        """Returns the listings at rows, each with an "explanation" of its
+        score (see explain()) when explain is True."""
+        with stage('records'):
+            records = self.store.records(rows)
+        if explain:
+            with stage('explain'):
+                for record, explanation in zip(
+                        records, self.explain(user_data, rows, weights)):
+                    record['explanation'] = explanation
+        return records
+
+    def fragments(self, user_data, rows, explain=False, summary=False,
+                  weights=None):
+        """Returns the pre-encoded JSON of the listings at rows (or of their
+        summaries), with the explanation of each score spliced into the
+        object when explain is True."""
+        column = self.payloads['summary' if summary else 'full']
+        with stage('records'):
+            fragments = [column.encoded(row) for row in rows]
+        if explain:
+            with stage('explain'):
+                fragments = [
+                    splice(fragment, 'explanation', explanation)
+                    for fragment, explanation in zip(
+                        fragments, self.explain(user_data, rows, weights))]
+        return fragments
+
+    def find(self, job_id):
+        """Returns the position of the listing with job_id, or None."""
+        if self._positions is None:
+            positions = {}
+            for row, value in enumerate(self.store.column('job_id')):
+                positions.setdefault(value, row)
+            self._positions = positions
+        return self._positions.get(job_id)
+
+    def candidate_rows(self, user_data):
+        """Returns the sorted positions of the listings that match every
+        single-label field the user filled in, by intersecting the fields'
+        inverted indexes, or None if the user left them all empty."""
+        rows = None
+        for name, field in self.categorical.items():
+            matches = field.candidates(user_data.get(name, []))
+            if matches is None:
+                continue
+            rows = matches if rows is None else np.intersect1d(
+                rows, matches, assume_unique=True)
+        return rows
+
+    def ann_rows(self, user_data, count, weights=None):
+        """Returns the sorted positions of the candidate listings for the
+        "ann" engine, at least ANN_CANDIDATES of them. Only the label
+        combinations whose score is within the weight of the free text
+        fields of the combinations holding the count best label scores can
+        reach the top count, so every other listing is left out. When more
+        listings are left than the candidates needed, they are estimated by
+        their label score plus their ANN similarity to all of the user's
+        input joined together."""
+        weights = field_weights(weights)
+        if not len(self):
+            return np.empty(0, dtype=np.int32)
+        if self._combinations is None:
+            self._combinations = label_combinations(self.categorical)
+        codes, combination, rows, offsets = self._combinations
+        scores = sum(
+            weights[name] * field.label_scores(
+                [user_data.get(name, [])])[0][codes[name]]
+            for name, field in self.categorical.items())
+        # The most the free text fields can add to a label score
+        text_weight = sum(weights[name] for name, _, _, _ in FIELDS)
+        order = np.argsort(-scores, kind='stable')
+        reached = np.searchsorted(
+            np.cumsum(np.diff(offsets)[order]), count)
+        floor = scores[order[min(reached, len(order) - 1)]] - text_weight
+        candidates = np.concatenate(
+            [rows[offsets[c]:offsets[c + 1]] for c in order
+             if scores[c] >= floor])
+        needed = max(ANN_CANDIDATES, ANN_CANDIDATE_FACTOR * count)
+        if len(candidates) > needed and self.ann is not None:
+            query = self.vectorizers[ANN_FIELD].transform(
+                [' '.join(build_user_features(user_data).values())])
+            if len(candidates) > ANN_SCAN_LIMIT:
+                candidates = np.intersect1d(
+                    candidates, self.ann.search(query, ANN_SCAN_LIMIT))
+            estimate = scores[combination[candidates]] + (
+                text_weight * np.maximum(
+                    self.ann.similarity(query, candidates), 0))
+            if len(candidates) > needed:
+                candidates = candidates[
+                    np.argpartition(-estimate, needed - 1)[:needed]]
+        return np.sort(candidates)
+
+    def rank(self, user_data, count, strict=False, engine='exact',
+             shards=None, weights=None):
+        """Returns the positions of the count best listings for the user's
+        input, best first. In strict mode only listings matching the user's
+        sector, experience, jobType and arrangement selections are scored
+        and returned, so there may be fewer than count. The "exact" engine
+        scores every listing, the "ann" engine only re-ranks the candidates
+        of ann_rows(). Given a ShardPool (sharding.py), an index loaded from
+        disk is scored shard by shard in parallel, with the same result.
+        weights overrides the WEIGHTS of some fields."""
+        return self.rank_scores(user_data, count, strict, engine, shards,
+                                weights)[0]
+
+    def rank_scores(self, user_data, count, strict=False, engine='exact',
+                    shards=None, weights=None):
+        """Returns the positions of the listings rank() returns along with
+        their scores, as two arrays."""
+        if engine not in ENGINES:
+            raise ValueError(f'engine must be one of {", ".join(ENGINES)}')
+        if shards is not None and self.path is not None and (
+                engine == 'exact'):
+            try:
+                return shards.rank(self, user_data, count, strict, weights)
+            except (ValueError, RuntimeError) as error:
+                # The file was replaced or a worker died, so score here
+                logger.warning('Error scoring shards due to: %s', error)
+        rows = self.candidate_rows(user_data) if strict else None
+        if engine == 'ann':
+            candidates = self.ann_rows(user_data, count, weights)
+            rows = candidates if rows is None else np.intersect1d(
+                rows, candidates, assume_unique=True)
+        scores = self.score_batch([user_data], rows, weights)[0]
+        with stage('top_k'):
+            best = top_k_indices(scores, count)
+        return best if rows is None else rows[best], scores[best]
+
+    def recommend(self, user_data, k=5, offset=0, strict=False,
+                  engine='exact', shards=None, explain=False, weights=None):
+        """Returns k job listings for the user's input, starting at the
+        offset-th best match so the frontend can page through results."""
+        rows = self.rank(user_data, k + offset, strict, engine, shards,
+                         weights)
+        return self.records(user_data, rows[offset:], explain, weights)
+
+    def recommend_batch(self, users, k=5, offset=0, batch_size=BATCH_SIZE,
+                        weights=None):
+        """Returns k job listings for each user, starting at the offset-th
+        best match. Users are scored batch_size at a time to bound the size
+        of the score matrix."""
+        results = []
+        for start in range(0, len(users), batch_size):
+            scores = self.score_batch(users[start:start + batch_size],
+                                      weights=weights)
+            results.extend(self.store.records(top_k_indices(row, k, offset))
+                           for row in scores)
+        return results
+
+
+def splice(fragment, key, value):
+    """A helper function that adds a key to a JSON object that is already
+    encoded, without decoding it."""
+    separator = b',' if fragment != b'{}' else b''
+    return b''.join((fragment[:-1], separator, json.dumps(key).encode(),
+                     b':', json.dumps(value).encode(), b'}'))
+
+
+def json_array(fragments):
+    """A helper function that joins encoded JSON values into an array."""
+    return b'[' + b','.join(fragments) + b']'
+
+
+def top_k_indices(scores, k, offset=0):
+    """Returns the indices of the best scores from rank offset to offset + k,
+    best first. Only the k + offset winners are sorted: np.partition finds
+    the score of the last winner in O(N), and ties are broken by listing
+    position so the same input always gives the same ranking."""
+    needed = min(k + offset, len(scores))
+    if offset >= needed:
+        return np.empty(0, dtype=np.intp)
+    # The needed-th highest score; fewer than needed scores are above it
+    threshold = np.partition(scores, len(scores) - needed)[-needed]
+    above = np.flatnonzero(scores > threshold)
+    above = above[np.lexsort((above, -scores[above]))]
+    # flatnonzero() is ordered by position, so ties keep the lowest indices
+    tied = np.flatnonzero(scores == threshold)[:needed - len(above)]
+    return np.concatenate((above, tied))[offset:]
+
+
+def default_index_path(clean_path):
+    """Returns the path of the saved index next to cleaned_listings.json."""
+    return os.path.join(os.path.dirname(clean_path), INDEX_FILE)
+
+
+def fit_index(clean_path, **options):
+    """Fits a new index from the job listings in cleaned_listings.json."""
+    job_listings, fingerprint = read_listings(clean_path)
+    return RecommenderIndex.build(job_listings, fingerprint, **options)
+
+
+def load_index(clean_path, index_path=None, **options):
+    """Loads the saved index if it was built from the current version of
+    cleaned_listings.json with the same options, otherwise it is fitted and
+    saved again."""
+    if index_path is None:
+        index_path = default_index_path(clean_path)
+    try:
+        index = RecommenderIndex.load(index_path)
+        if index.fingerprint == file_fingerprint(clean_path) and (
+                index.options == index_options(**options)):
+            return index
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
+    # The saved index is missing or stale, so fit it again
+    index = fit_index(clean_path, **options)
+    try:
+        index.save(index_path)
+        # Serve from the mapped file so worker processes share its pages
+        return RecommenderIndex.load(index_path)
+    except (IOError, TypeError) as error:
+        # Read-only deployments can still serve from memory
+        logger.warning("Error saving '%s' file due to: %s", index_path,
+                       error)
+    return index
+
+
+def job_recommender(user_data, job_listings=None, index=None, k=5,
+                    offset=0, strict=False, cache=None, engine='exact',
+                    shards=None, explain=False, weights=None):
     """This function is called in the submit() method of app.py and it
-    takes in user input as the vector and the structured data from
-    cleaned_listings.json, as the matrix (a Pandas dataframe), then
-    calculates a cosine similarity score, which returns a ranking
-    of the top 5 best matches according to the user's requirements."""
-
-    # Ensure the model recognizes all incoming data in array format
-    if not isinstance(user_data['experience'], list):
-        user_data['experience'] = [user_data['experience']]
-    if not isinstance(user_data['textInput'], list):
-        user_data['textInput'] = [user_data['textInput']]
-
-    # Create our features based off user input:
-    job_types = ', '.join(user_data['jobType'])
-    arrangements = ', '.join(user_data['arrangement'])
-    sectors = ', '.join(user_data['sector'])
-    experience = ', '.join(user_data['experience'])
-    text_input = ', '.join(user_data['textInput'])
-
-    # Convert job listings into a Pandas DataFrame
-    corpus_df = pd.DataFrame(job_listings)
-
-    # Concantenate the data into a matrix that comprised of the jobType,
-    # arrangement, sector, experience, description, title, company, and
-    # location as features from the cleaned_listing.json file. axis=1,
-    # represents the columns
-    corpus_df['combined'] = corpus_df.apply(
-        lambda row: ' '.join(
-            [row['jobType'], row['arrangement'], row['sector'],
-             row['experience'], row['description'], row['title'],
-             row['company'], row['location']]), axis=1)
-
-    # Feature Engineering:
-    # Use TF-IDF Vectorizer to transform text data to feature vectors
-    # stop_words = 'english' removes common words with little meaning from
-    # our calculation. max_df removes words that appear more than 90%
-    # and min_df removes that appear less than 1%
-    vec_sector = TfidfVectorizer(stop_words='english',
-                                 max_df=0.9, min_df=0.01)
-    vec_exp = TfidfVectorizer(stop_words='english',
-                              max_df=0.9, min_df=0.01)
-    vec_jt = TfidfVectorizer(stop_words='english',
-                             max_df=0.9, min_df=0.01)
-    vec_arr = TfidfVectorizer(stop_words='english',
-                              max_df=0.9, min_df=0.01)
-    vec_desc = TfidfVectorizer(stop_words='english',
-                               max_df=0.85, min_df=0.01)
-    vec_text = TfidfVectorizer(stop_words='english')
-
-    # Fit and transform user input with data from cleaned_listing.json
-    mtx_sector = vec_sector.fit_transform(corpus_df['sector'])
-    mtx_exp = vec_exp.fit_transform(corpus_df['experience'])
-    mtx_jt = vec_jt.fit_transform(corpus_df['jobType'])
-    mtx_arr = vec_arr.fit_transform(corpus_df['arrangement'])
-    mtx_desc = vec_desc.fit_transform(corpus_df['description'])
-    mtx_text = vec_text.fit_transform(corpus_df['combined'])
-
-    # Next we call transform() on the above vectors with user input
-    # These all correspond except for experience vs. job descriptions
-    input_vec_sec = vec_sector.transform([sectors])
-    input_vec_exp = vec_exp.transform([experience])
-    input_vec_jt = vec_jt.transform([job_types])
-    input_vec_arr = vec_arr.transform([arrangements])
-    # Here we vectorize input experience against the job listings description
-    input_vec_desc = vec_desc.transform([experience])
-    # We vectorize any potential text input across the entire corpus
-    input_vec_text = vec_text.transform([text_input])
-
-    # Calculate cosine similarity between user vectors and job matrices
-    # .flatten() converts the 2D array into a 1D array with CS scores
-    cs_sector = cosine_similarity(input_vec_sec, mtx_sector).flatten()
-    cs_exp = cosine_similarity(input_vec_exp, mtx_exp).flatten()
-    cs_jt = cosine_similarity(input_vec_jt, mtx_jt).flatten()
-    cs_arr = cosine_similarity(input_vec_arr, mtx_arr).flatten()
-    cs_desc = cosine_similarity(input_vec_desc, mtx_desc).flatten()
-    cs_text = cosine_similarity(input_vec_text, mtx_text).flatten()
-
-    # Assign cosine similarity: sector: 0.3, experience: 0.25, jobType: 0.1,
-    # arrangement: 0.175, description: 0.1, cs_text: 0.075 (might change)
-    cs_combined = (0.3 * cs_sector + 0.25 * cs_exp + 0.1 * cs_jt + 0.175
-                   * cs_arr + 0.1 * cs_desc + 0.075 * cs_text)
-
-    # Use index slicing to get the top 5 recommended lists
-    top_indices = cs_combined.argsort()[-5:][::-1]
-
-    # Return the top 5 job listings
-    top_jobs = corpus_df.iloc[top_indices]
-    # Convert the top 5 job listings from corpus_df to dictionary with
-    # parameter orient = 'records" so each row represents a dictionary entry
-    return top_jobs.to_dict(orient='records')
+    takes in user input as the vector and either a prebuilt
+    RecommenderIndex or the structured data from cleaned_listings.json
+    as the matrix, then calculates a cosine similarity score, which
+    returns a ranking of the top 5 (or k, starting at offset) best matches
+    according to the user's requirements. With strict=True only listings
+    matching all of the user's checkbox selections are considered. With
+    engine='ann' only the best candidates by label and by the approximate
+    nearest neighbors of the user's input are ranked. When a ResultCache
+    is given, the ranking of an identical profile is reused, and with a
+    ShardPool the listings are scored across its worker processes. With
+    explain=True every listing also holds an "explanation" of its score,
+    and weights overrides the WEIGHTS of some fields for this request."""
+    if index is None:
+        index = RecommenderIndex.build(job_listings)
+    rows = ranked_rows(user_data, index, k, offset, strict, cache, engine,
+                       shards, weights)
+    return index.records(user_data, rows, explain, weights)
+
+
+def job_recommender_json(user_data, index, k=5, offset=0, strict=False,
+                         cache=None, engine='exact', shards=None,
+                         explain=False, summary=False, weights=None):
+    """The same ranking as job_recommender(), returned as the bytes of a
+    JSON array assembled from the listings' pre-encoded payloads, so the
+    listings are not encoded again for every request. With summary=True
+    the descriptions are shortened."""
+    rows = ranked_rows(user_data, index, k, offset, strict, cache, engine,
+                       shards, weights)
+    return json_array(index.fragments(user_data, rows, explain, summary,
+                                      weights))
+
+
+def ranked_rows(user_data, index, k, offset, strict, cache, engine, shards,
+                weights=None):
+    """A helper function that returns the positions of the k listings
+    from the offset-th best match, reusing the ranking of an identical
+    profile (with the same weights) when a ResultCache is given."""
+    if cache is None:
+        return index.rank(user_data, k + offset, strict, engine, shards,
+                          weights)[offset:]
+    with stage('cache'):
+        key = (index.fingerprint, strict, engine,
+               tuple(field_weights(weights).values()),
+               canonical_profile(user_data))
+        entry = cache.get(key)
+    # An entry is (ranked positions, whether the ranking is complete)
+    if entry is None or (not entry[1] and len(entry[0]) < k + offset):
+        count = max(k + offset, RESULT_WINDOW)
+        rows = index.rank(user_data, count, strict, engine, shards, weights)
+        entry = (rows, len(rows) < count)
+        cache.put(key, entry)
+    return entry[0][offset:offset + k]
+
+
+def job_recommender_batch(users, job_listings=None, index=None, k=5,
+                          offset=0, weights=None):
+    """The batch version of job_recommender(). It takes in a list of user
+    inputs and returns the top k job listings for each of them, scoring
+    all users with a few sparse matrix multiplies."""
+    if index is None:
+        index = RecommenderIndex.build(job_listings)
+    return index.recommend_batch(users, k, offset, weights=weights)
+
+
+if __name__ == '__main__':
+    # Prebuild the index, e.g. right after running clean_data.py
+    clean_path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'json_files', 'cleaned_listings.json')
+    fit_index(clean_path).save(default_index_path(clean_path))
+    print(f'Recommender index written to json_files/{INDEX_FILE}!')
@@ -0,0 +1,102 @@
+# Job Hunting AI Tool: result_cache.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# A bounded LRU cache with an optional time-to-live for recommendation
+# results. Many users submit the same checkbox selections with an empty
+# textInput, so app.py looks their ranking up here before scoring. The key
+# is a canonical form of the profile: the values of each input are
+# lowercased, their whitespace collapsed and the lists sorted, which does
+# not change the scores since the fields are matched as bags of words and
+# label atoms. The key also holds the corpus version, and the cache is
+# cleared whenever the corpus reloads. Each entry is the ranked window of
+# listing positions, so paging through results is a slice of the same
+# entry.
+#
+# Source:
+# 1.) collections.OrderedDict Documentation: https://docs.python.org/3/
+# library/collections.html#collections.OrderedDict
+
+# Imports: threading and time for the lock and the time-to-live
+import threading
+import time
+from collections import OrderedDict
+
+# The user inputs that affect the ranking
+PROFILE_KEYS = ('jobType', 'arrangement', 'sector', 'experience',
+                'textInput')
+
+
+def normalize_text(value):
+    """A helper function that lowercases a value and collapses its
+    whitespace. Values that are not strings are left as they are."""
+    if isinstance(value, str):
+        return ' '.join(value.lower().split())
+    return value
+
+
+def canonical_profile(user_data):
+    """Returns a hashable form of the user's input in which the order of
+    selections, case and extra whitespace do not matter."""
+    profile = []
+    for key in PROFILE_KEYS:
+        value = user_data.get(key, [])
+        if not isinstance(value, list):
+            value = [value]
+        values = [normalize_text(item) for item in value]
+        profile.append(tuple(sorted(values, key=repr)))
+    return tuple(profile)
+
+
+class ResultCache:
+    """A thread-safe LRU cache holding at most max_size entries, each for at
+    most ttl seconds (or forever when ttl is None)."""
+
+    def __init__(self, max_size=4096, ttl=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value for key, or None if it is missing or has
+        expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None
+                                      or self.clock() < entry[1]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Stores value under key, evicting the least recently used entry
+        when the cache is full."""
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry, e.g. when the corpus has been reloaded."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the size and hit/miss counters of the cache."""
+        return {'size': len(self._entries), 'max_size': self.max_size,
+                'hits': self.hits, 'misses': self.misses}
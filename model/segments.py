@@ -0,0 +1,254 @@
+# Job Hunting AI Tool: segments.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# A recommender index made of segments, so that a new cleaned_listings.json
+# is served within seconds instead of after refitting every vocabulary.
+# The first segment is the fully fitted base index. When the file changes,
+# update_index() compares its listings with the live ones by job_id:
+# listings that are new or changed go into a small delta segment, which is
+# transformed with the base segment's frozen vocabularies and idf weights
+# (so serving workers never import scikit-learn for it), and listings that
+# were removed or changed are masked with tombstones.
+# Terms of the new listings that the frozen vocabulary does not know are
+# counted, since they cannot be matched until the index is refitted.
+#
+# Every segment is ranked on its own and the winners are merged like the
+# shards of sharding.py. Once the share of delta and tombstoned listings,
+# or of new terms, crosses DRIFT_THRESHOLD (or there are too many
+# segments), needs_compaction is set and the corpus cache refits the whole
+# index in the background, which merges the segments and refreshes the idf
+# weights. Only that refit imports scikit-learn.
+#
+# Source:
+# 1.) Lucene's segment merging: https://lucene.apache.org/core/
+# 9_0_0/core/org/apache/lucene/index/TieredMergePolicy.html
+
+# Import Counter for the unknown terms and numpy for the tombstone masks
+# and global positions
+from collections import Counter
+
+import numpy as np
+
+from model.recommender import (
+    ANN_FIELD, BATCH_SIZE, ENGINES, RecommenderIndex, combine_columns,
+    read_listings, top_k_indices)
+from model.sharding import merge_shards
+
+# The share of changed listings or unknown terms that triggers compaction
+DRIFT_THRESHOLD = 0.1
+# The most segments kept before compaction
+MAX_SEGMENTS = 8
+
+
+class SegmentedIndex:
+    """A base RecommenderIndex plus delta segments fitted with its frozen
+    vocabularies. Listing positions are global: the rows of segment s start
+    at offsets[s]. live[s] is None when none of the rows of segment s are
+    tombstoned, else a boolean mask of the rows still served. Updates
+    return a new SegmentedIndex, so snapshots held by requests in flight
+    never change."""
+
+    def __init__(self, segments, live, fingerprint=None,
+                 unknown_terms=None):
+        self.segments = segments
+        self.live = live
+        self.fingerprint = fingerprint
+        self.unknown_terms = unknown_terms or Counter()
+        self.offsets = np.cumsum([0] + [len(segment)
+                                        for segment in segments])
+        self.path = None
+        self._positions = None
+
+    @classmethod
+    def from_index(cls, index):
+        """Wraps a fully fitted index as the base segment."""
+        return cls([index], [None], index.fingerprint)
+
+    def __len__(self):
+        return sum(len(segment) if live is None else int(live.sum())
+                   for segment, live in zip(self.segments, self.live))
+
+    @property
+    def base(self):
+        return self.segments[0]
+
+    def drift(self):
+        """Returns how far the index drifted from its base: the larger of
+        the share of delta and tombstoned listings and the share of new
+        terms next to the base vocabulary."""
+        base_rows = max(len(self.base), 1)
+        changed = sum(len(segment) for segment in self.segments[1:])
+        changed += sum(int((~live).sum()) for live in self.live
+                       if live is not None)
+        base_terms = max(self.base.vectorizers[ANN_FIELD].vocabulary_size, 1)
+        return max(changed / base_rows, len(self.unknown_terms) / base_terms)
+
+    @property
+    def needs_compaction(self):
+        return (self.drift() >= DRIFT_THRESHOLD
+                or len(self.segments) > MAX_SEGMENTS)
+
+    def locate(self, rows):
+        """Returns the segment of each global position."""
+        return np.searchsorted(self.offsets, rows, side='right') - 1
+
+    def record(self, row):
+        """Rebuilds the listing at a global position."""
+        segment = self.locate(row)
+        return self.segments[segment].store.record(
+            row - self.offsets[segment])
+
+    def positions(self):
+        """Returns the global position of every live listing by job_id."""
+        positions = {}
+        for s, (segment, live) in enumerate(zip(self.segments, self.live)):
+            for row, job_id in enumerate(segment.store.column('job_id')):
+                if job_id and (live is None or live[row]):
+                    positions[job_id] = self.offsets[s] + row
+        return positions
+
+    def update(self, job_listings, fingerprint=None):
+        """Returns a new index serving job_listings: unchanged listings stay
+        where they are, removed and changed ones are tombstoned and new and
+        changed ones are added in a delta segment."""
+        positions = self.positions()
+        kept, added = set(), []
+        for job in job_listings:
+            row = positions.get(job.get('job_id'))
+            if row is not None and row not in kept and (
+                    self.record(row) == job):
+                kept.add(row)
+            else:
+                added.append(job)
+        live = []
+        for s, segment in enumerate(self.segments):
+            rows = np.arange(self.offsets[s], self.offsets[s + 1])
+            mask = np.isin(rows, list(kept))
+            if self.live[s] is None and mask.all():
+                live.append(None)
+            else:
+                live.append(mask)
+        segments = list(self.segments)
+        unknown_terms = Counter(self.unknown_terms)
+        if added:
+            delta = RecommenderIndex.build(
+                added, vectorizers=self.base.vectorizers,
+                **self.base.options)
+            segments.append(delta)
+            live.append(None)
+            unknown, _ = self.base.vectorizers[ANN_FIELD].unknown_terms(
+                combine_columns(delta.store))
+            unknown_terms.update(unknown)
+        # Drop the segments whose listings were all removed
+        keep = [s for s, mask in enumerate(live)
+                if s == 0 or mask is None or mask.any()]
+        return SegmentedIndex([segments[s] for s in keep],
+                              [live[s] for s in keep], fingerprint,
+                              unknown_terms)
+
+    def score_batch(self, users, weights=None):
+        """Returns the M x N scores of every listing against each user, with
+        -inf for the tombstoned listings."""
+        blocks = []
+        for segment, live in zip(self.segments, self.live):
+            scores = segment.score_batch(users, weights=weights)
+            if live is not None:
+                scores[:, ~live] = -np.inf
+            blocks.append(scores)
+        return np.hstack(blocks)
+
+    def score(self, user_data, weights=None):
+        """Returns the scores of every listing against the user's input."""
+        return self.score_batch([user_data], weights)[0]
+
+    def rank(self, user_data, count, strict=False, engine='exact',
+             shards=None, weights=None):
+        """Returns the global positions of the count best live listings,
+        best first. Each segment ranks enough listings to make up for its
+        tombstones, and the winners are merged by score and position."""
+        return self.rank_scores(user_data, count, strict, engine, shards,
+                                weights)[0]
+
+    def rank_scores(self, user_data, count, strict=False, engine='exact',
+                    shards=None, weights=None):
+        """Returns the global positions of the listings rank() returns
+        along with the scores their segments ranked them by."""
+        if engine not in ENGINES:
+            raise ValueError(f'engine must be one of {", ".join(ENGINES)}')
+        results = []
+        for s, (segment, live) in enumerate(zip(self.segments, self.live)):
+            dead = 0 if live is None else int((~live).sum())
+            rows, scores = segment.rank_scores(
+                user_data, count + dead, strict, engine, shards, weights)
+            if live is not None:
+                kept = live[rows]
+                rows, scores = rows[kept][:count], scores[kept][:count]
+            results.append((rows + self.offsets[s], scores))
+        return merge_shards(results, count)
+
+    def by_segment(self, method, user_data, rows, *args):
+        """A helper method that calls a RecommenderIndex method on the rows
+        of every segment and returns the results in the order of rows."""
+        rows = np.asarray(rows, dtype=np.intp)
+        located = self.locate(rows)
+        results = [None] * len(rows)
+        for s in np.unique(located):
+            at = np.flatnonzero(located == s)
+            for i, result in zip(at, getattr(self.segments[s], method)(
+                    user_data, rows[at] - self.offsets[s], *args)):
+                results[i] = result
+        return results
+
+    def records(self, user_data, rows, explain=False, weights=None):
+        """Returns the listings at the global positions rows, each with an
+        "explanation" of its score when explain is True."""
+        return self.by_segment('records', user_data, rows, explain, weights)
+
+    def fragments(self, user_data, rows, explain=False, summary=False,
+                  weights=None):
+        """Returns the pre-encoded JSON of the listings at the global
+        positions rows, as RecommenderIndex.fragments() does."""
+        return self.by_segment('fragments', user_data, rows, explain,
+                               summary, weights)
+
+    def find(self, job_id):
+        """Returns the global position of the live listing with job_id, or
+        None."""
+        if self._positions is None:
+            self._positions = self.positions()
+        return self._positions.get(job_id)
+
+    def recommend(self, user_data, k=5, offset=0, strict=False,
+                  engine='exact', shards=None, explain=False, weights=None):
+        """Returns k job listings for the user's input, starting at the
+        offset-th best match."""
+        rows = self.rank(user_data, k + offset, strict, engine, shards,
+                         weights)
+        return self.records(user_data, rows[offset:], explain, weights)
+
+    def recommend_batch(self, users, k=5, offset=0, batch_size=BATCH_SIZE,
+                        weights=None):
+        """Returns k job listings for each user, starting at the offset-th
+        best match, scoring batch_size users at a time."""
+        results = []
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            for user_data, row in zip(batch, self.score_batch(batch,
+                                                              weights)):
+                # Tombstoned listings are never among the winners
+                best = top_k_indices(row, k, offset)
+                best = best[np.isfinite(row[best])]
+                results.append(self.records(user_data, best))
+        return results
+
+
+def update_index(index, clean_path):
+    """Updates a corpus index to the current cleaned_listings.json with a
+    delta segment and tombstones instead of refitting it."""
+    job_listings, fingerprint = read_listings(clean_path)
+    if not isinstance(index, SegmentedIndex):
+        index = SegmentedIndex.from_index(index)
+    return index.update(job_listings, fingerprint)
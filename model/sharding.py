@@ -0,0 +1,143 @@
+# Job Hunting AI Tool: sharding.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# Sharded scoring for very large corpora. A single ranking is one sparse
+# matrix-vector product over all N listings, which runs on one core.
+# A ShardPool splits the listings into contiguous shards and scores them
+# in parallel in a pool of worker processes. Every worker memory maps the
+# same saved index file, so the shards share one copy of the matrices in
+# the page cache. Each shard returns its local top count listings with
+# their scores, and the coordinator merges them into the global top count.
+#
+# The merge gives exactly the single-process ranking: every global winner
+# is among the local winners of its shard, each listing's score does not
+# depend on which shard computed it, and ties are broken by listing
+# position on both paths.
+#
+# The app's workers serve requests from several threads, and forking a
+# multi-threaded process can copy a lock held by another thread into the
+# child. The shard workers are therefore started from a forkserver (a
+# fresh single-threaded process that already imported this module), or
+# spawned where forkserver is not available.
+#
+# Source:
+# 1.) concurrent.futures Documentation: https://docs.python.org/3/library/
+# concurrent.futures.html#processpoolexecutor
+
+# Import os for the core count, multiprocessing for the start method,
+# threading for the lock and numpy for the merge
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from model.recommender import RecommenderIndex, top_k_indices
+
+# The indexes loaded by this worker process, by path
+_indexes = {}
+
+# How the shard workers are started: never by forking a threaded process
+START_METHOD = ('forkserver' if 'forkserver' in
+                multiprocessing.get_all_start_methods() else 'spawn')
+
+
+def shard_bounds(length, shards):
+    """A helper function that splits range(length) into at most shards
+    contiguous (start, end) ranges of nearly equal size."""
+    shards = max(1, min(shards, length))
+    edges = np.linspace(0, length, shards + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def shard_index(path, fingerprint):
+    """Returns this worker's mapped index for path, loading it again when
+    the file has been replaced by another version since."""
+    index = _indexes.get(path)
+    if index is None or index.fingerprint != fingerprint:
+        index = RecommenderIndex.load(path)
+        _indexes[path] = index
+    if index.fingerprint != fingerprint:
+        raise ValueError(f"'{path}' no longer holds version {fingerprint}")
+    return index
+
+
+def score_shard(path, fingerprint, start, end, user_data, count, strict,
+                weights=None):
+    """Scores the listings from start to end in a worker process and
+    returns the global positions and scores of its count best listings.
+    Unless strict mode leaves only a few candidates, the shard's rows of
+    the mapped matrix are scored in place."""
+    index = shard_index(path, fingerprint)
+    rows = slice(start, end)
+    if strict:
+        candidates = index.candidate_rows(user_data)
+        if candidates is not None:
+            rows = candidates[(candidates >= start) & (candidates < end)]
+    scores = index.score_batch([user_data], rows, weights)[0]
+    best = top_k_indices(scores, count)
+    if isinstance(rows, slice):
+        return best + start, scores[best]
+    return rows[best], scores[best]
+
+
+def merge_shards(results, count):
+    """Merges the local winners of every shard into the global top count,
+    best first, breaking ties by listing position. Returns their positions
+    and scores."""
+    rows = np.concatenate([shard_rows for shard_rows, _ in results])
+    scores = np.concatenate([shard_scores for _, shard_scores in results])
+    order = np.lexsort((rows, -scores))[:count]
+    return rows[order], scores[order]
+
+
+class ShardPool:
+    """A pool of worker processes that ranks the listings of a saved index
+    shard by shard. The processes are started on first use, separately in
+    every process that uses the pool, so it is safe to create before
+    gunicorn forks its workers."""
+
+    def __init__(self, shards=None):
+        self.shards = shards or os.cpu_count() or 1
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        """Returns this process's pool of shard workers."""
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                context = multiprocessing.get_context(START_METHOD)
+                if START_METHOD == 'forkserver':
+                    context.set_forkserver_preload([__name__])
+                self._pool = ProcessPoolExecutor(max_workers=self.shards,
+                                                 mp_context=context)
+                self._pid = os.getpid()
+            return self._pool
+
+    def rank(self, index, user_data, count, strict=False, weights=None):
+        """Returns the positions and scores of the count best listings of
+        an index loaded from disk, the same as index.rank_scores() would."""
+        pool = self.executor()
+        futures = [pool.submit(score_shard, index.path, index.fingerprint,
+                               start, end, user_data, count, strict,
+                               weights)
+                   for start, end in shard_bounds(len(index), self.shards)]
+        return merge_shards([future.result() for future in futures], count)
+
+    def close(self):
+        """Shuts the worker processes down."""
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,175 @@
+# Job Hunting AI Tool: vectorizer.py
+# Members: Masaki Nishi, Christian McKinnon, Susan Joh, and Alexander Wong
+# Project Partner: Professor Gates
+# CS 467 Portfolio Project
+#
+# Description:
+# The query side of a fitted TfidfVectorizer. Fitting needs scikit-learn,
+# but turning a user's input into a TF-IDF row only needs the fitted
+# vocabulary, the idf weights, the stop words and the token pattern. A
+# QueryVectorizer keeps just those, so it can be saved into the binary
+# index and used by the app without scikit-learn, and it produces the same
+# L2 normalized rows as TfidfVectorizer.transform().
+#
+# A HashedVectorizer is the memory-lean alternative for very large corpora
+# (the hashing trick): every term is mapped to one of a fixed number of
+# columns by its CRC-32, so there is no vocabulary to store or look up,
+# only one idf weight per column. Columns that no listing uses (or that
+# min_df and max_df filter out) have an idf of 0 and are dropped, like
+# unknown terms are by a QueryVectorizer.
+#
+# Source:
+# 1.) Scikit-learn: https://scikit-learn.org/stable/modules/
+# feature_extraction.html#tfidf-term-weighting
+# 2.) Scikit-learn: https://scikit-learn.org/stable/modules/
+# feature_extraction.html#vectorizing-a-large-text-corpus-with-the-
+# hashing-trick
+
+# Import re and zlib for the tokenizer and the hashing trick, numpy and
+# scipy for the sparse rows
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# The default number of columns of a HashedVectorizer
+HASH_FEATURES = 2 ** 16
+
+
+class QueryVectorizer:
+    """Transforms text into L2 normalized TF-IDF rows with a fixed
+    vocabulary (a list of terms, one per column) and idf weights."""
+
+    def __init__(self, terms, idf, stop_words=(), token_pattern=None,
+                 lowercase=True):
+        self.terms = terms
+        self.idf = idf
+        self.stop_words = frozenset(stop_words)
+        self.token_pattern = token_pattern or r'(?u)\b\w\w+\b'
+        self.lowercase = lowercase
+        self.vocabulary = {term: column for column, term in enumerate(terms)}
+        self._tokenize = re.compile(self.token_pattern).findall
+
+    @classmethod
+    def from_tfidf(cls, vectorizer):
+        """Copies what transform() needs out of a fitted TfidfVectorizer."""
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, column in vectorizer.vocabulary_.items():
+            terms[column] = term
+        return cls(terms, np.asarray(vectorizer.idf_, dtype=np.float64),
+                   vectorizer.get_stop_words() or (),
+                   vectorizer.token_pattern, vectorizer.lowercase)
+
+    @property
+    def vocabulary_size(self):
+        """The number of distinct terms the vectorizer can match."""
+        return len(self.terms)
+
+    def tokens(self, document):
+        """Returns the terms of a document, without its stop words."""
+        if self.lowercase:
+            document = document.lower()
+        return [token for token in self._tokenize(document)
+                if token not in self.stop_words]
+
+    def lookup(self, token):
+        """Returns the column of a term, or None if it is unknown."""
+        return self.vocabulary.get(token)
+
+    def names(self, document):
+        """Returns the known terms of a document by their column."""
+        names = {}
+        for token in self.tokens(document):
+            column = self.lookup(token)
+            if column is not None:
+                names.setdefault(column, token)
+        return names
+
+    def unknown_terms(self, documents):
+        """Counts the terms of the documents that are missing from the
+        fitted vocabulary (and are not stop words), along with the total
+        number of terms, to measure how far new text drifted from it."""
+        unknown, total = Counter(), 0
+        for document in documents:
+            for token in self.tokens(document):
+                total += 1
+                if self.lookup(token) is None:
+                    unknown[token] += 1
+        return unknown, total
+
+    def counts(self, documents):
+        """Returns the term counts of every document as a sparse matrix."""
+        rows, columns = [], []
+        for row, document in enumerate(documents):
+            for token in self.tokens(document):
+                column = self.lookup(token)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+        # Duplicate (row, column) pairs are summed into term counts
+        matrix = csr_matrix(
+            (np.ones(len(columns)), (rows, columns)),
+            shape=(len(documents), len(self.idf)))
+        matrix.sum_duplicates()
+        return matrix
+
+    def weigh(self, matrix):
+        """Scales term counts by the idf weights and L2 normalizes every
+        row, in place."""
+        matrix.data *= self.idf[matrix.indices]
+        matrix.eliminate_zeros()
+        rows = matrix.shape[0]
+        row_ids = np.repeat(np.arange(rows), np.diff(matrix.indptr))
+        norms = np.sqrt(np.bincount(row_ids, weights=matrix.data ** 2,
+                                    minlength=rows))
+        norms[norms == 0] = 1.0
+        matrix.data /= norms[row_ids]
+        return matrix
+
+    def transform(self, documents):
+        """Returns one TF-IDF row per document as a sparse CSR matrix."""
+        return self.weigh(self.counts(documents))
+
+
+class HashedVectorizer(QueryVectorizer):
+    """A vectorizer without a vocabulary: term t is counted in column
+    crc32(t) % len(idf). Columns with an idf of 0 are never matched."""
+
+    def __init__(self, idf, stop_words=(), token_pattern=None,
+                 lowercase=True):
+        super().__init__([], idf, stop_words, token_pattern, lowercase)
+
+    @classmethod
+    def fit(cls, documents, n_features=HASH_FEATURES, stop_words=None,
+            max_df=1.0, min_df=1, token_pattern=None, lowercase=True):
+        """Fits the idf weights of every column to the documents, with the
+        same smoothed idf and the same max_df and min_df rules as
+        TfidfVectorizer, and returns the vectorizer with the documents'
+        TF-IDF matrix."""
+        if stop_words == 'english':
+            # Imported here so that only fitting needs scikit-learn
+            from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+            stop_words = ENGLISH_STOP_WORDS
+        vectorizer = cls(np.ones(n_features), stop_words or (),
+                         token_pattern, lowercase)
+        counts = vectorizer.counts(documents)
+        frequency = np.bincount(counts.indices, minlength=n_features)
+        size = len(documents)
+        high = max_df if isinstance(max_df, int) else max_df * size
+        low = min_df if isinstance(min_df, int) else min_df * size
+        keep = (frequency >= max(low, 1)) & (frequency <= high)
+        vectorizer.idf = np.where(
+            keep, np.log((1 + size) / (1 + frequency)) + 1,
+            0.0).astype(np.float32)
+        return vectorizer, vectorizer.weigh(counts)
+
+    @property
+    def vocabulary_size(self):
+        """The number of columns that any listing uses."""
+        return int(np.count_nonzero(self.idf))
+
+    def lookup(self, token):
+        column = zlib.crc32(token.encode('utf-8')) % len(self.idf)
+        return column if self.idf[column] else None
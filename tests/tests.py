@@ -1,4 +1,68 @@
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+# Allow the tests to import app.py, model/ and data/ from the project root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.memory import memory_report  # noqa: E402
+from benchmarks.run import (  # noqa: E402
+    cold_start, compare, latency_summary, random_profiles)
+from benchmarks.synthetic import ListingGenerator  # noqa: E402
+from data import clean_data as cleaner  # noqa: E402
+from data.clean_data import (  # noqa: E402
+    clean_data, clean_data_incremental, iter_data, save_cleaned_data)
+from data.dedupe import (  # noqa: E402
+    candidate_pairs, dedupe_listings, main as dedupe_main, minhash,
+    shingles)
+from data.fetch_jobs import (  # noqa: E402
+    FetchError, JobFetcher, TokenBucket, fetch_job_listings)
+from model.artifact import read_arrays, write_arrays  # noqa: E402
+from model.categorical import CategoricalField, label_atoms  # noqa: E402
+from model.corpus_cache import CorpusCache, CorpusNotReady  # noqa: E402
+from model.listing_store import (  # noqa: E402
+    SUMMARY_LENGTH, ListingStore)
+from model.metrics import (  # noqa: E402
+    Histogram, RequestTimer, current_timer)
+from model.result_cache import ResultCache, canonical_profile  # noqa: E402
+from model.segments import SegmentedIndex, update_index  # noqa: E402
+from model.sharding import ShardPool, shard_bounds  # noqa: E402
+from model.vectorizer import HashedVectorizer, QueryVectorizer  # noqa: E402,E501
+from model.recommender import (  # noqa: E402
+    ANN_CANDIDATES, CATEGORICAL_FIELDS, COMBINED_COLUMNS, FIELDS, WEIGHTS,
+    RecommenderIndex, build_user_features, field_weights, job_recommender,
+    job_recommender_batch, job_recommender_json, load_index, row_block,
+    splice, top_k_indices)
+
+CLEAN_PATH = os.path.join(ROOT_DIR, 'json_files', 'cleaned_listings.json')
+RAW_PATH = os.path.join(ROOT_DIR, 'json_files', 'google_listings.json')
+
+with open(CLEAN_PATH, 'r') as job_file:
+    JOB_LISTINGS = json.load(job_file)
+
+USER_DATA = {'jobType': ['Full-time'], 'arrangement': ['Remote'],
+             'sector': ['Technology'], 'experience': 'Entry-Level',
+             'textInput': 'python machine learning'}
+
+OTHER_USERS = [
+    {'jobType': ['Internship'], 'arrangement': ['Hybrid', 'On-site'],
+     'sector': ['Finance'], 'experience': ['Junior-Level'],
+     'textInput': ''},
+    {'jobType': ['Contractor'], 'arrangement': ['On-site'],
+     'sector': ['Healthcare', 'Education'], 'experience': 'Senior-Level',
+     'textInput': 'react frontend typescript'}]
 
 
 class TestCase(unittest.TestCase):
@@ -6,5 +70,1353 @@ class TestCase(unittest.TestCase):
         self.assertTrue(True)
 
 
+class TestRecommenderIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = RecommenderIndex.build(JOB_LISTINGS)
+
+    def test_recommend_returns_top_five_listings(self):
+        results = job_recommender(USER_DATA, index=self.index)
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertIn(result, JOB_LISTINGS)
+
+    def test_index_matches_refitting_per_request(self):
+        # A reference fit per request, as the model did before the index:
+        # TfidfVectorizer and cosine_similarity for the free text fields
+        # and the label tables of categorical.py for the other fields
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.metrics.pairwise import cosine_similarity
+        columns = {column: [job.get(column, '') for job in JOB_LISTINGS]
+                   for column in COMBINED_COLUMNS}
+        columns['combined'] = [' '.join(parts) for parts in zip(
+            *(columns[column] for column in COMBINED_COLUMNS))]
+        for user in [USER_DATA] + OTHER_USERS:
+            features = build_user_features(user)
+            scores = np.zeros(len(JOB_LISTINGS))
+            for name, column, key, options in FIELDS:
+                vectorizer = TfidfVectorizer(**options)
+                matrix = vectorizer.fit_transform(columns[column])
+                scores += WEIGHTS[name] * cosine_similarity(
+                    vectorizer.transform([features[key]]), matrix)[0]
+            for name in CATEGORICAL_FIELDS:
+                labels = sorted(set(columns[name]))
+                field = CategoricalField(name, labels, np.array(
+                    [labels.index(label) for label in columns[name]]))
+                scores += WEIGHTS[name] * field.score_batch(
+                    [user.get(name, [])])[0]
+            best = np.lexsort((np.arange(len(scores)), -scores))[:5]
+            results = job_recommender(user, index=self.index)
+            self.assertEqual([job['job_id'] for job in results],
+                             [JOB_LISTINGS[row]['job_id'] for row in best])
+            _, index_scores = self.index.rank_scores(user, 5)
+            np.testing.assert_allclose(index_scores, scores[best],
+                                       atol=1e-5)
+
+    def test_user_data_is_not_mutated(self):
+        user_data = dict(USER_DATA)
+        job_recommender(user_data, index=self.index)
+        self.assertEqual(user_data, USER_DATA)
+
+    def test_batch_matches_one_user_at_a_time(self):
+        users = [USER_DATA] + OTHER_USERS
+        expected = [job_recommender(user, index=self.index)
+                    for user in users]
+        self.assertEqual(
+            job_recommender_batch(users, index=self.index), expected)
+        self.assertEqual(
+            self.index.recommend_batch(users, batch_size=2), expected)
+
+    def test_saved_index_is_reused_until_listings_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            clean_path = os.path.join(tmp, 'cleaned_listings.json')
+            with open(clean_path, 'w') as job_file:
+                json.dump(JOB_LISTINGS, job_file)
+            first = load_index(clean_path)
+            self.assertEqual(load_index(clean_path).fingerprint,
+                             first.fingerprint)
+            with open(clean_path, 'w') as job_file:
+                json.dump(JOB_LISTINGS[:50], job_file)
+            second = load_index(clean_path)
+            self.assertNotEqual(second.fingerprint, first.fingerprint)
+            self.assertEqual(len(second), 50)
+
+    def test_strict_mode_only_returns_matching_listings(self):
+        user_data = dict(USER_DATA, jobType=['Internship', 'Contractor'])
+        matches = [job for job in JOB_LISTINGS
+                   if job['arrangement'] == 'Remote'
+                   and job['sector'] == 'Technology'
+                   and job['experience'] == 'Entry-Level'
+                   and ('Internship' in job['jobType']
+                        or 'Contractor' in job['jobType'])]
+        results = job_recommender(user_data, index=self.index, k=50,
+                                  strict=True)
+        self.assertCountEqual(results, matches)
+        # The strict results keep the order of the full ranking
+        ranking = job_recommender(user_data, index=self.index,
+                                  k=len(JOB_LISTINGS))
+        self.assertEqual(results, [job for job in ranking if job in matches])
+
+    def test_strict_mode_without_selections_scores_everything(self):
+        user_data = {'textInput': 'python'}
+        self.assertEqual(
+            job_recommender(user_data, index=self.index, strict=True),
+            job_recommender(user_data, index=self.index))
+
+    def test_offset_pages_through_the_ranking(self):
+        first = job_recommender(USER_DATA, index=self.index, k=10)
+        second = job_recommender(USER_DATA, index=self.index, k=5, offset=5)
+        self.assertEqual(second, first[5:])
+
+
+class TestFusedMatrix(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = RecommenderIndex.build(JOB_LISTINGS, dtype='float64')
+
+    def field_scores(self, user_data):
+        """Scores every field on its own, as separate cosine similarities
+        and label lookups."""
+        index, scores = self.index, {}
+        features = build_user_features(user_data)
+        for name, _, key, _ in FIELDS:
+            start, end = index.spans[name]
+            query = index.vectorizers[name].transform([features[key]])
+            scores[name] = (index.matrix[:, start:end] @ query.T).toarray()[
+                :, 0]
+        for name, field in index.categorical.items():
+            scores[name] = field.score_batch([user_data.get(name, [])])[0]
+        return scores
+
+    def test_one_product_matches_the_weighted_fields(self):
+        for user in [USER_DATA] + OTHER_USERS:
+            scores = self.field_scores(user)
+            np.testing.assert_allclose(
+                self.index.score(user),
+                sum(WEIGHTS[name] * scores[name] for name in WEIGHTS),
+                atol=1e-12)
+            weights = {'sector': 1.0, 'text': 0.5, 'experience': 0}
+            np.testing.assert_allclose(
+                self.index.score(user, weights),
+                sum(field_weights(weights)[name] * scores[name]
+                    for name in WEIGHTS), atol=1e-12)
+
+    def test_batch_matches_single_users(self):
+        users = [USER_DATA] + OTHER_USERS
+        batch = self.index.score_batch(users, weights={'text': 1.0})
+        for user, row in zip(users, batch):
+            np.testing.assert_allclose(
+                row, self.index.score(user, {'text': 1.0}), atol=1e-12)
+
+    def test_weights_leave_the_matrix_alone(self):
+        data = self.index.matrix.data.copy()
+        ranked = self.index.rank(USER_DATA, 10)
+        only_text = self.index.rank(
+            USER_DATA, 10, weights={name: 0 for name in CATEGORICAL_FIELDS})
+        self.assertFalse(np.array_equal(ranked, only_text))
+        np.testing.assert_array_equal(self.index.matrix.data, data)
+        np.testing.assert_array_equal(self.index.rank(USER_DATA, 10), ranked)
+
+    def test_invalid_weights(self):
+        for weights in ({'salary': 1}, {'text': -1}, {'text': '1'},
+                        {'text': float('nan')}, {'text': True}):
+            with self.assertRaises(ValueError):
+                self.index.score(USER_DATA, weights)
+
+
+class TestStorageOptions(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = RecommenderIndex.build(JOB_LISTINGS)
+        cls.float64 = RecommenderIndex.build(JOB_LISTINGS, dtype='float64')
+
+    def test_matrices_are_float32_by_default(self):
+        self.assertEqual(self.index.matrix.dtype, np.float32)
+        for user in [USER_DATA] + OTHER_USERS:
+            np.testing.assert_allclose(self.index.score(user),
+                                       self.float64.score(user), atol=1e-6)
+
+    def test_vocabularies_are_capped(self):
+        index = RecommenderIndex.build(
+            JOB_LISTINGS, max_features={'description': 50, 'text': 100})
+        self.assertEqual(index.vectorizers['description'].vocabulary_size,
+                         50)
+        self.assertEqual(index.vectorizers['text'].vocabulary_size, 100)
+        self.assertLess(index.nbytes()['text']['matrix'],
+                        self.index.nbytes()['text']['matrix'])
+        with self.assertRaises(TypeError):
+            RecommenderIndex.build(JOB_LISTINGS, max_terms=10)
+
+    def test_hashed_vectorizer_matches_tfidf(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        documents = ['Python developer, remote', 'Java developer on-site',
+                     'Python and SQL data analyst', 'Registered nurse']
+        tfidf = TfidfVectorizer(stop_words='english')
+        expected = tfidf.fit_transform(documents)
+        hashed, matrix = HashedVectorizer.fit(documents, 2 ** 20,
+                                              stop_words='english')
+        query = 'python data nurse unknownterm'
+        terms = tfidf.get_feature_names_out()
+        for row, document in enumerate(documents + [query]):
+            names = hashed.names(document)
+            if row < len(documents):
+                got = matrix[row]
+                want = expected[row]
+            else:
+                got = hashed.transform([query])
+                want = tfidf.transform([query])
+            weights = {names[column]: value
+                       for column, value in zip(got.indices, got.data)}
+            self.assertEqual(weights.keys(), {terms[column]
+                                              for column in want.indices})
+            for column, value in zip(want.indices, want.data):
+                self.assertAlmostEqual(weights[terms[column]], value)
+        self.assertEqual(hashed.unknown_terms([query])[0],
+                         {'unknownterm': 1})
+
+    def test_hashed_index_round_trip(self):
+        index = RecommenderIndex.build(JOB_LISTINGS, 'fingerprint',
+                                       hash_features=2 ** 14)
+        self.assertEqual(index.vectorizers['text'].terms, [])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.bin')
+            index.save(path)
+            loaded = RecommenderIndex.load(path)
+            self.assertIsInstance(loaded.vectorizers['text'],
+                                  HashedVectorizer)
+            self.assertEqual(loaded.options, index.options)
+            for engine in ('exact', 'ann'):
+                self.assertEqual(
+                    loaded.recommend(USER_DATA, engine=engine,
+                                     explain=True),
+                    index.recommend(USER_DATA, engine=engine,
+                                    explain=True))
+        # Hashing keeps most of the exact ranking
+        top = set(self.index.rank(USER_DATA, 10).tolist())
+        self.assertGreaterEqual(
+            len(top & set(index.rank(USER_DATA, 10).tolist())), 8)
+
+    def test_load_index_refits_for_other_options(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            clean_path = os.path.join(tmp, 'cleaned_listings.json')
+            with open(clean_path, 'w') as job_file:
+                json.dump(JOB_LISTINGS[:60], job_file)
+            self.assertIsInstance(load_index(clean_path).vectorizers['text'],
+                                  QueryVectorizer)
+            hashed = load_index(clean_path, hash_features=2 ** 12)
+            self.assertIsInstance(hashed.vectorizers['text'],
+                                  HashedVectorizer)
+            self.assertIsNotNone(hashed.path)
+
+    def test_memory_report(self):
+        report = memory_report(
+            JOB_LISTINGS[:80], OTHER_USERS, k=5,
+            configurations={'float64': {'dtype': 'float64'},
+                            'float32': {}})
+        self.assertEqual(report['float64']['overlap_at_5'], 1.0)
+        self.assertLess(report['float32']['fields']['text']['matrix'],
+                        report['float64']['fields']['text']['matrix'])
+
+
+class TestExplain(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = RecommenderIndex.build(JOB_LISTINGS, 'fingerprint')
+
+    def test_explanations_add_up_to_the_scores(self):
+        scores = self.index.score(USER_DATA)
+        results = job_recommender(USER_DATA, index=self.index, k=10,
+                                  explain=True)
+        rows = self.index.rank(USER_DATA, 10)
+        for row, job in zip(rows, results):
+            explanation = job.pop('explanation')
+            # The ranking scores are accumulated in float32
+            self.assertAlmostEqual(explanation['score'], scores[row], 6)
+            self.assertAlmostEqual(sum(explanation['fields'].values()),
+                                   scores[row], 6)
+            self.assertEqual(set(explanation['fields']), set(WEIGHTS))
+            for name, matches in explanation['terms'].items():
+                shares = [share for _, share in matches]
+                self.assertEqual(shares, sorted(shares, reverse=True))
+                self.assertLessEqual(sum(shares),
+                                     explanation['fields'][name] + 1e-9)
+        # Without the explanations the listings are unchanged
+        self.assertEqual(results, job_recommender(USER_DATA,
+                                                  index=self.index, k=10))
+
+    def test_top_terms_come_from_the_input(self):
+        job = job_recommender(USER_DATA, index=self.index, k=1,
+                              explain=True)[0]
+        terms = [term for term, _ in job['explanation']['terms']['text']]
+        self.assertTrue(terms)
+        for term in terms:
+            self.assertIn(term, USER_DATA['textInput'].lower())
+
+    def test_encoded_payloads_match_the_records(self):
+        rows = self.index.rank(USER_DATA, 10)
+        encoded = job_recommender_json(USER_DATA, self.index, k=10,
+                                       explain=True)
+        self.assertEqual(json.loads(encoded),
+                         self.index.records(USER_DATA, rows, explain=True))
+        self.assertEqual(splice(b'{}', 'a', [1]), b'{"a":[1]}')
+
+    def test_cached_rankings_are_explained(self):
+        cache = ResultCache()
+        first = job_recommender(USER_DATA, index=self.index, cache=cache,
+                                explain=True)
+        second = job_recommender(USER_DATA, index=self.index, cache=cache,
+                                 explain=True)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(first, second)
+
+
+class TestIndexArtifact(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, 'index.bin')
+        cls.index = RecommenderIndex.build(JOB_LISTINGS, 'fingerprint')
+        cls.index.save(cls.path)
+        cls.loaded = RecommenderIndex.load(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_query_vectorizer_matches_tfidf(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        documents = [job['description'] for job in JOB_LISTINGS]
+        tfidf = TfidfVectorizer(stop_words='english').fit(documents)
+        queries = documents[:20] + ['Python, python and SQL', '', 'the']
+        difference = (tfidf.transform(queries)
+                      - QueryVectorizer.from_tfidf(tfidf).transform(queries))
+        self.assertAlmostEqual(abs(difference).max(), 0.0)
+
+    def test_loaded_index_matches_fitted_index(self):
+        self.assertEqual(self.loaded.fingerprint, 'fingerprint')
+        self.assertEqual(self.loaded.store.records(range(len(JOB_LISTINGS))),
+                         JOB_LISTINGS)
+        for user in [USER_DATA] + OTHER_USERS:
+            np.testing.assert_array_equal(self.loaded.score(user),
+                                          self.index.score(user))
+
+    def test_loaded_arrays_are_read_only_views(self):
+        matrix = self.loaded.matrix
+        self.assertFalse(matrix.data.flags.writeable)
+        self.assertFalse(self.loaded.store.codes['sector'].flags.writeable)
+
+    def test_arrays_round_trip(self):
+        path = os.path.join(self.tmp.name, 'arrays.bin')
+        arrays = {'empty': np.empty(0, dtype=np.int32),
+                  'grid': np.arange(12, dtype=np.float64).reshape(3, 4),
+                  'flags': np.array([True, False])}
+        write_arrays(path, {'name': 'test'}, arrays)
+        manifest, loaded = read_arrays(path)
+        self.assertEqual(manifest, {'name': 'test'})
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(loaded[name], array)
+            self.assertEqual(loaded[name].dtype, array.dtype)
+
+    def test_other_files_are_rejected(self):
+        with self.assertRaises(ValueError):
+            read_arrays(CLEAN_PATH)
+
+
+class TestAnnEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = RecommenderIndex.build(JOB_LISTINGS, 'fingerprint')
+
+    def test_small_corpus_matches_exact_engine(self):
+        # Fewer listings than candidates, so every listing is re-ranked
+        index = RecommenderIndex.build(JOB_LISTINGS[:150])
+        for user in [USER_DATA] + OTHER_USERS:
+            self.assertEqual(
+                job_recommender(user, index=index, k=10, engine='ann'),
+                job_recommender(user, index=index, k=10))
+
+    def test_search_returns_the_nearest_listings(self):
+        ann = self.index.ann
+        self.assertEqual(len(ann.list_rows), len(JOB_LISTINGS))
+        query = self.index.vectorizers['text'].transform(
+            ['python machine learning data'])
+        rows = ann.search(query, 20, probes=len(ann.centroids))
+        similarity = ann.vectors @ ann.project(query)[0]
+        best = np.argsort(-similarity, kind='stable')[:20]
+        self.assertEqual(list(rows), sorted(best))
+        # Probing fewer clusters still returns the requested count
+        self.assertEqual(len(ann.search(query, 20, probes=1)), 20)
+
+    def test_text_queries_find_the_exact_top_results(self):
+        user_data = {'textInput': 'registered nurse patient care'}
+        self.assertEqual(
+            job_recommender(user_data, index=self.index, engine='ann'),
+            job_recommender(user_data, index=self.index))
+
+    def test_recall_against_the_exact_engine(self):
+        # Many more listings than candidates, so most are never re-ranked
+        with open(RAW_PATH, 'r') as raw_file:
+            generator = ListingGenerator(json.load(raw_file))
+        index = RecommenderIndex.build(
+            clean_data(list(generator.listings(15 * ANN_CANDIDATES))))
+        recalls = []
+        for user in random_profiles(40):
+            candidates = index.ann_rows(user, 5)
+            self.assertLess(len(candidates), len(index) // 2)
+            expected = set(index.rank(user, 5).tolist())
+            found = set(index.rank(user, 5, engine='ann').tolist())
+            recalls.append(len(expected & found) / len(expected))
+        self.assertGreaterEqual(np.mean(recalls), 0.9)
+
+    def test_strict_mode_and_saved_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.bin')
+            self.index.save(path)
+            loaded = RecommenderIndex.load(path)
+        for user in [USER_DATA] + OTHER_USERS:
+            results = loaded.recommend(user, 10, strict=True, engine='ann')
+            self.assertEqual(
+                results, self.index.recommend(user, 10, strict=True,
+                                              engine='ann'))
+            for job in results:
+                self.assertIn(job, self.index.recommend(
+                    user, len(JOB_LISTINGS), strict=True))
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.index.rank(USER_DATA, 5, engine='bm25')
+
+
+class TestShardPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, 'index.bin')
+        RecommenderIndex.build(JOB_LISTINGS, 'fingerprint').save(cls.path)
+        cls.index = RecommenderIndex.load(cls.path)
+        cls.shards = ShardPool(3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.shards.close()
+        cls.tmp.cleanup()
+
+    def test_shard_bounds_cover_every_listing(self):
+        self.assertEqual(shard_bounds(10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(shard_bounds(2, 8), [(0, 1), (1, 2)])
+
+    def test_sharded_ranking_matches_single_process(self):
+        # An empty profile ties every listing, which checks the tie order
+        users = [USER_DATA, {}] + OTHER_USERS
+        for user in users:
+            for strict in (False, True):
+                for count in (1, 10, len(JOB_LISTINGS)):
+                    np.testing.assert_array_equal(
+                        self.index.rank(user, count, strict,
+                                        shards=self.shards),
+                        self.index.rank(user, count, strict))
+        self.assertEqual(
+            job_recommender(USER_DATA, index=self.index, k=5, offset=5,
+                            shards=self.shards),
+            job_recommender(USER_DATA, index=self.index, k=5, offset=5))
+
+    def test_workers_are_not_forked_from_request_threads(self):
+        context = self.shards.executor()._mp_context
+        self.assertIn(context.get_start_method(), ('forkserver', 'spawn'))
+
+    def test_shards_score_views_of_the_mapped_matrix(self):
+        block = row_block(self.index.matrix, 10, 30)
+        self.assertTrue(np.shares_memory(block.data, self.index.matrix.data))
+        self.assertTrue(np.shares_memory(block.indices,
+                                         self.index.matrix.indices))
+        scores = self.index.score_batch([USER_DATA])[0]
+        np.testing.assert_array_equal(
+            self.index.score_batch([USER_DATA], slice(10, 30))[0],
+            scores[10:30])
+        np.testing.assert_array_equal(
+            self.index.score_batch([USER_DATA], slice(5, 5))[0], [])
+
+    def test_replaced_file_falls_back_to_local_scoring(self):
+        path = os.path.join(self.tmp.name, 'replaced.bin')
+        RecommenderIndex.build(JOB_LISTINGS, 'old').save(path)
+        index = RecommenderIndex.load(path)
+        RecommenderIndex.build(JOB_LISTINGS[:10], 'new').save(path)
+        np.testing.assert_array_equal(
+            index.rank(USER_DATA, 10, shards=self.shards),
+            index.rank(USER_DATA, 10))
+
+
+class TestListingStore(unittest.TestCase):
+    def test_records_round_trip(self):
+        store = ListingStore.from_listings(JOB_LISTINGS)
+        self.assertEqual(len(store), len(JOB_LISTINGS))
+        self.assertEqual(store.records(range(len(store))), JOB_LISTINGS)
+
+    def test_categorical_fields_are_stored_as_codes(self):
+        store = ListingStore.from_listings(JOB_LISTINGS)
+        self.assertEqual(store.codes['arrangement'].dtype, np.uint8)
+        self.assertEqual(sorted(store.labels['arrangement']),
+                         ['Hybrid', 'On-site', 'Remote'])
+        self.assertNotIn('arrangement', store.columns)
+
+    def test_missing_fields_stay_missing(self):
+        listings = [{'title': 'A', 'url_site': '[x]'}, {'title': 'B'}]
+        store = ListingStore.from_listings(listings)
+        self.assertEqual(store.records([1, 0]), listings[::-1])
+        self.assertEqual(store.column('url_site'), ['[x]', ''])
+
+
+class TestCategoricalField(unittest.TestCase):
+    def test_labels_are_split_into_atoms(self):
+        self.assertEqual(label_atoms('Full-time, Contractor, and Internship'),
+                         ['fulltime', 'contractor', 'internship'])
+        self.assertEqual(label_atoms('On-site'), label_atoms('onsite'))
+
+    def test_scores_are_gathered_by_code(self):
+        labels = ['Full-time', 'Part-time', 'Full-time and Part-time']
+        field = CategoricalField('jobType', labels, np.array([2, 0, 1, 0]))
+        scores = field.score_batch([['Part-time'], 'Full-time', []])
+        np.testing.assert_allclose(scores, [
+            [np.sqrt(0.5), 0, 1, 0],
+            [np.sqrt(0.5), 1, 0, 1],
+            [0, 0, 0, 0]])
+
+    def test_inverted_index_candidates(self):
+        labels = ['Full-time', 'Part-time', 'Full-time and Part-time']
+        field = CategoricalField('jobType', labels, np.array([2, 0, 1, 0]))
+        self.assertEqual(list(field.candidates(['Full-time'])), [0, 1, 3])
+        self.assertEqual(list(field.candidates('Part-time')), [0, 2])
+        self.assertEqual(len(field.candidates(['Internship'])), 0)
+        self.assertIsNone(field.candidates([]))
+
+    def test_rare_labels_are_not_dropped(self):
+        # TF-IDF with min_df used to drop labels seen in under 1% of rows
+        labels = ['Senior-Level'] * 200 + ['Intermediate-Level']
+        field = CategoricalField('experience', ['Senior-Level',
+                                                'Intermediate-Level'],
+                                 np.array([label != 'Senior-Level'
+                                           for label in labels], dtype=int))
+        scores = field.score_batch(['Intermediate-Level'])[0]
+        self.assertEqual(scores[-1], 1.0)
+        self.assertEqual(scores[0], 0.5)
+
+    def test_partial_matches_between_neighbouring_levels(self):
+        field = CategoricalField(
+            'experience', ['Entry-Level', 'Junior-Level', 'Senior-Level'],
+            np.arange(3))
+        np.testing.assert_allclose(field.score_batch(['Entry-Level'])[0],
+                                   [1.0, 0.5, 0.0])
+
+
+class TestTopK(unittest.TestCase):
+    def test_matches_a_full_stable_sort(self):
+        rng = np.random.default_rng(0)
+        # Round the scores so that there are plenty of ties
+        scores = rng.random(1000).round(2)
+        expected = np.lexsort((np.arange(1000), -scores))
+        for k, offset in ((5, 0), (10, 5), (50, 940), (20, 990)):
+            self.assertEqual(list(top_k_indices(scores, k, offset)),
+                             list(expected[offset:offset + k]))
+
+    def test_ties_are_broken_by_position(self):
+        scores = np.array([0.5, 0.9, 0.5, 0.5, 0.1])
+        self.assertEqual(list(top_k_indices(scores, 3)), [1, 0, 2])
+        self.assertEqual(list(top_k_indices(np.zeros(4), 2, 1)), [1, 2])
+
+    def test_offset_past_the_end_is_empty(self):
+        self.assertEqual(len(top_k_indices(np.ones(3), 5, 3)), 0)
+
+
+class TestCorpusCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.clean_path = os.path.join(self.tmp.name, 'cleaned_listings.json')
+        self.write_listings(JOB_LISTINGS[:40])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_listings(self, listings):
+        with open(self.clean_path, 'w') as job_file:
+            json.dump(listings, job_file)
+
+    def test_new_file_is_swapped_in_without_touching_old_snapshot(self):
+        cache = CorpusCache(self.clean_path, check_interval=0)
+        old = cache.snapshot()
+        self.write_listings(JOB_LISTINGS[:60])
+        # Make sure the signature changes even on coarse mtime filesystems
+        os.utime(self.clean_path, ns=(0, 0))
+        cache.check(wait=True)
+        new = cache.snapshot()
+        self.assertEqual(len(old.index), 40)
+        self.assertEqual(len(new.index), 60)
+        self.assertNotEqual(old.version, new.version)
+        self.assertEqual(cache.reloads, 1)
+
+    def test_touching_the_file_keeps_the_fitted_index(self):
+        cache = CorpusCache(self.clean_path, check_interval=0)
+        old = cache.snapshot()
+        os.utime(self.clean_path, ns=(0, 0))
+        cache.check(wait=True)
+        self.assertIs(cache.snapshot().index, old.index)
+        self.assertEqual(cache.reloads, 0)
+
+    def test_invalid_file_keeps_serving_old_snapshot(self):
+        cache = CorpusCache(self.clean_path, check_interval=0)
+        old = cache.snapshot()
+        with open(self.clean_path, 'w') as job_file:
+            job_file.write('[{"title": ')
+        cache.check(wait=True)
+        self.assertIs(cache.snapshot().index, old.index)
+
+    def test_reload_runs_callbacks(self):
+        reloaded = []
+        cache = CorpusCache(self.clean_path, check_interval=0,
+                            on_reload=[reloaded.append])
+        self.write_listings(JOB_LISTINGS[:60])
+        os.utime(self.clean_path, ns=(0, 0))
+        cache.check(wait=True)
+        self.assertEqual(reloaded, [cache.snapshot()])
+
+    def test_background_load(self):
+        release = threading.Event()
+
+        def loader(path):
+            release.wait(5)
+            return load_index(path)
+
+        cache = CorpusCache(self.clean_path, check_interval=0, loader=loader,
+                            background=True, ready_timeout=0.01)
+        self.assertFalse(cache.ready)
+        with self.assertRaises(CorpusNotReady):
+            cache.snapshot()
+        release.set()
+        cache.ready_timeout = 5
+        self.assertEqual(len(cache.snapshot().index), 40)
+        self.assertTrue(cache.ready)
+        self.assertEqual(cache.reloads, 0)
+
+    def test_background_load_waits_for_the_file(self):
+        os.remove(self.clean_path)
+        cache = CorpusCache(self.clean_path, check_interval=0,
+                            background=True, ready_timeout=0)
+        self.assertFalse(cache.ready)
+        self.write_listings(JOB_LISTINGS[:40])
+        cache.check(wait=True)
+        self.assertTrue(cache.ready)
+        self.assertEqual(len(cache.snapshot().index), 40)
+
+
+class TestSegmentedIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.base = RecommenderIndex.build(JOB_LISTINGS[:200], 'v1')
+
+    def test_update_matches_an_index_of_the_live_listings(self):
+        changed = dict(JOB_LISTINGS[20], title='Senior Python Engineer')
+        listings = (JOB_LISTINGS[:10] + JOB_LISTINGS[15:20] + [changed]
+                    + JOB_LISTINGS[21:220])
+        index = SegmentedIndex.from_index(self.base).update(listings, 'v2')
+        self.assertEqual(len(index.segments), 2)
+        self.assertEqual(len(index), len(listings))
+        # Kept listings stay in place and new or changed ones are appended
+        expected = RecommenderIndex.build(
+            JOB_LISTINGS[:10] + JOB_LISTINGS[15:20] + JOB_LISTINGS[21:200]
+            + [changed] + JOB_LISTINGS[200:220],
+            vectorizers=self.base.vectorizers)
+        for user in [USER_DATA] + OTHER_USERS:
+            for strict in (False, True):
+                self.assertEqual(index.recommend(user, k=20, strict=strict),
+                                 expected.recommend(user, k=20,
+                                                    strict=strict))
+        self.assertEqual(index.recommend_batch([USER_DATA] + OTHER_USERS),
+                         expected.recommend_batch([USER_DATA] + OTHER_USERS))
+        for user in [USER_DATA] + OTHER_USERS:
+            rows, scores = index.rank_scores(user, 20)
+            expected_rows, expected_scores = expected.rank_scores(user, 20)
+            np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+            np.testing.assert_allclose(
+                scores, expected.score_batch([user], expected_rows)[0],
+                rtol=1e-6)
+        for job, other in zip(index.recommend(USER_DATA, explain=True),
+                              expected.recommend(USER_DATA, explain=True)):
+            self.assertAlmostEqual(job['explanation']['score'],
+                                   other['explanation']['score'])
+
+    def test_delta_segments_do_not_import_scikit_learn(self):
+        script = (
+            'import sys\n'
+            'from model.segments import update_index\n'
+            'from model.recommender import load_index\n'
+            'index = update_index(load_index(sys.argv[1]), sys.argv[2])\n'
+            'print(len(index.segments), "sklearn" in sys.modules)\n')
+        with tempfile.TemporaryDirectory() as tmp:
+            clean_path = os.path.join(tmp, 'cleaned_listings.json')
+            delta_path = os.path.join(tmp, 'delta.json')
+            with open(clean_path, 'w') as job_file:
+                json.dump(JOB_LISTINGS[:200], job_file)
+            with open(delta_path, 'w') as job_file:
+                json.dump(JOB_LISTINGS[:210], job_file)
+            load_index(clean_path)
+            output = subprocess.run(
+                [sys.executable, '-c', script, clean_path, delta_path],
+                check=True, capture_output=True, text=True, cwd=ROOT_DIR)
+        self.assertEqual(output.stdout.split()[-2:], ['2', 'False'])
+
+    def test_drift_triggers_compaction(self):
+        index = SegmentedIndex.from_index(self.base)
+        small = index.update(JOB_LISTINGS[:200] + JOB_LISTINGS[200:205])
+        self.assertFalse(small.needs_compaction)
+        self.assertEqual(small.update(JOB_LISTINGS[:200]).segments,
+                         [self.base])
+        large = small.update(JOB_LISTINGS[:200] + JOB_LISTINGS[200:])
+        self.assertTrue(large.needs_compaction)
+        new_terms, _ = self.base.vectorizers['text'].unknown_terms(
+            ['zyzzyva python'])
+        self.assertEqual(new_terms, {'zyzzyva': 1})
+
+    def test_corpus_cache_applies_deltas_then_compacts(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            clean_path = os.path.join(tmp, 'cleaned_listings.json')
+            loads = []
+
+            def loader(path):
+                loads.append(path)
+                return load_index(path)
+
+            def write_listings(listings):
+                with open(clean_path, 'w') as job_file:
+                    json.dump(listings, job_file)
+                os.utime(clean_path, ns=(len(listings), len(listings)))
+
+            write_listings(JOB_LISTINGS[:200])
+            cache = CorpusCache(clean_path, check_interval=0, loader=loader,
+                                updater=update_index)
+            write_listings(JOB_LISTINGS[:202])
+            cache.check(wait=True)
+            self.assertIsInstance(cache.snapshot().index, SegmentedIndex)
+            self.assertEqual(len(cache.snapshot().index), 202)
+            self.assertEqual((len(loads), cache.compactions), (1, 0))
+            write_listings(JOB_LISTINGS)
+            cache.check(wait=True)
+            self.assertIsInstance(cache.snapshot().index, RecommenderIndex)
+            self.assertEqual(len(cache.snapshot().index), len(JOB_LISTINGS))
+            self.assertEqual((len(loads), cache.compactions), (2, 1))
+
+
+class TestResultCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = RecommenderIndex.build(JOB_LISTINGS, 'fingerprint')
+
+    def test_equivalent_profiles_share_a_key(self):
+        messy = {'jobType': 'FULL-TIME', 'arrangement': ['Remote'],
+                 'sector': ['technology'], 'experience': ['Entry-Level'],
+                 'textInput': '  Python   Machine\nlearning ', 'k': 10}
+        self.assertEqual(canonical_profile(messy),
+                         canonical_profile(USER_DATA))
+        swapped = dict(OTHER_USERS[0], arrangement=['On-site', 'Hybrid'])
+        self.assertEqual(canonical_profile(swapped),
+                         canonical_profile(OTHER_USERS[0]))
+        # Equal keys must give equal rankings
+        self.assertEqual(job_recommender(messy, index=self.index, k=20),
+                         job_recommender(USER_DATA, index=self.index, k=20))
+
+    def test_cached_pages_match_uncached_pages(self):
+        cache = ResultCache()
+        for user in [USER_DATA] + OTHER_USERS:
+            for k, offset in ((5, 0), (5, 5), (10, 45), (3, 0)):
+                self.assertEqual(
+                    job_recommender(user, index=self.index, k=k,
+                                    offset=offset, cache=cache),
+                    job_recommender(user, index=self.index, k=k,
+                                    offset=offset))
+        # One miss per profile; a page past the cached window of 50 results
+        # finds the entry but ranks the profile again with a larger window
+        self.assertEqual((cache.misses, cache.hits), (3, 9))
+        self.assertEqual(len(cache), 3)
+        strict = job_recommender(USER_DATA, index=self.index, k=50,
+                                 strict=True, cache=cache)
+        self.assertEqual(
+            job_recommender(USER_DATA, index=self.index, k=50, offset=0,
+                            strict=True, cache=cache), strict)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')),
+                         (1, None, 3))
+
+    def test_entries_expire(self):
+        now = [0.0]
+        cache = ResultCache(ttl=10, clock=lambda: now[0])
+        cache.put('a', 1)
+        now[0] = 9.0
+        self.assertEqual(cache.get('a'), 1)
+        now[0] = 10.0
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'size': 0, 'max_size': 4096,
+                                         'hits': 1, 'misses': 1})
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency', 'Latency.', ('stage',),
+                              buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, stage='parse')
+        self.assertEqual(histogram.render()[2:], [
+            'latency_bucket{stage="parse",le="0.1"} 1',
+            'latency_bucket{stage="parse",le="1.0"} 2',
+            'latency_bucket{stage="parse",le="+Inf"} 3',
+            'latency_sum{stage="parse"} 5.55',
+            'latency_count{stage="parse"} 3'])
+
+    def test_stages_are_only_timed_inside_a_request(self):
+        index = RecommenderIndex.build(JOB_LISTINGS[:40])
+        index.recommend(USER_DATA)
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        try:
+            index.recommend(USER_DATA)
+        finally:
+            current_timer.reset(token)
+        self.assertEqual(set(timer.stages), {
+            'vectorize', 'similarity', 'top_k', 'records'})
+        self.assertIn('total;dur=', timer.server_timing())
+
+
+class TestApi(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import app
+        cls.client = app.app.test_client()
+        cls.index = app.corpus_cache.snapshot().index
+
+    def test_ready_endpoint(self):
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['ready'])
+        self.assertEqual(response.get_json()['listings'], len(JOB_LISTINGS))
+
+    def test_cold_start_skips_heavy_imports(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            clean_path = os.path.join(tmp, 'cleaned_listings.json')
+            with open(clean_path, 'w') as job_file:
+                json.dump(JOB_LISTINGS, job_file)
+            # Write the saved index, as clean_data.py does
+            load_index(clean_path)
+            results = cold_start(clean_path)
+        # The import time budget is checked by benchmarks/run.py
+        self.assertEqual(results['heavy_modules'], [])
+        self.assertGreaterEqual(results['ready_ms'], results['import_ms'])
+
+    def test_submit_rejects_invalid_profiles(self):
+        for invalid in ({'textInput': None}, {'jobType': [1]},
+                        {'sector': {}}, {'experience': 5}):
+            response = self.client.post('/api/submit',
+                                        json=dict(USER_DATA, **invalid))
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post(
+                '/api/submit/batch', json=[USER_DATA, dict(USER_DATA,
+                                                           **invalid)])
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/submit/batch', json=[USER_DATA, 1])
+        self.assertEqual(response.status_code, 400)
+        # A single string is accepted as well as a list
+        response = self.client.post('/api/submit', json=dict(
+            USER_DATA, sector='Technology', textInput='python'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_submit_weights(self):
+        weights = {'text': 1.0, 'sector': 0, 'experience': 0}
+        default = self.client.post('/api/submit?k=10', json=USER_DATA)
+        body = self.client.post('/api/submit?k=10',
+                                json=dict(USER_DATA, weights=weights))
+        query = self.client.post(
+            '/api/submit?k=10&weights=text:1,sector:0,experience:0',
+            json=USER_DATA)
+        self.assertEqual(body.get_json(), query.get_json())
+        self.assertNotEqual(body.get_json(), default.get_json())
+        self.assertEqual([job['job_id'] for job in body.get_json()],
+                         [job['job_id'] for job in job_recommender(
+                             USER_DATA, index=self.index, k=10,
+                             weights=weights)])
+        for query in ('weights=salary:1', 'weights=text', 'weights=text:x'):
+            response = self.client.post(f'/api/submit?{query}',
+                                        json=USER_DATA)
+            self.assertEqual(response.status_code, 400)
+
+    def test_submit_returns_top_five(self):
+        response = self.client.post('/api/submit', json=USER_DATA)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), 5)
+
+    def test_submit_pages_with_k_and_offset(self):
+        full = self.client.post('/api/submit?k=8', json=USER_DATA)
+        page = self.client.post('/api/submit',
+                                json=dict(USER_DATA, k=3, offset=5))
+        self.assertEqual(page.get_json(), full.get_json()[5:])
+        for query in ('k=0', 'k=1000', 'offset=-1', 'k=abc'):
+            response = self.client.post(f'/api/submit?{query}',
+                                        json=USER_DATA)
+            self.assertEqual(response.status_code, 400)
+
+    def test_submit_strict_mode(self):
+        user_data = dict(USER_DATA, strict=True)
+        response = self.client.post('/api/submit?k=50', json=user_data)
+        self.assertTrue(response.get_json())
+        for job in response.get_json():
+            self.assertEqual(job['arrangement'], 'Remote')
+            self.assertEqual(job['sector'], 'Technology')
+
+    def test_submit_engine(self):
+        response = self.client.post('/api/submit?engine=ann', json=USER_DATA)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), 5)
+        response = self.client.post('/api/submit',
+                                    json=dict(USER_DATA, engine='bm25'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_server_timing_is_opt_in(self):
+        response = self.client.post('/api/submit', json=USER_DATA)
+        self.assertNotIn('Server-Timing', response.headers)
+        # A new profile misses the result cache and is scored
+        user_data = dict(USER_DATA, textInput='server timing')
+        response = self.client.post('/api/submit?timing=1', json=user_data)
+        stages = [entry.split(';')[0] for entry in
+                  response.headers['Server-Timing'].split(', ')]
+        for name in ('parse', 'corpus', 'cache', 'vectorize', 'similarity',
+                     'top_k', 'records', 'serialize', 'total'):
+            self.assertIn(name, stages)
+
+    def test_metrics_endpoint(self):
+        self.client.post('/api/submit', json=USER_DATA)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE jhai_stage_seconds histogram', text)
+        self.assertIn('jhai_stage_seconds_count{stage="similarity"}', text)
+        self.assertIn('jhai_request_seconds_bucket{endpoint="submit",'
+                      'le="+Inf"}', text)
+        self.assertRegex(text, r'jhai_result_cache_hits_total \d+')
+        self.assertIn(f'jhai_corpus_listings {len(JOB_LISTINGS)}', text)
+
+    def test_submit_explain(self):
+        plain = self.client.post('/api/submit', json=USER_DATA).get_json()
+        response = self.client.post('/api/submit?explain=true',
+                                    json=USER_DATA)
+        explained = response.get_json()
+        self.assertTrue(all('explanation' in job for job in explained))
+        self.assertFalse(any('explanation' in job for job in plain))
+        for job in explained:
+            del job['explanation']
+        self.assertEqual(explained, plain)
+
+    def test_submit_summary_and_fields(self):
+        full = self.client.post('/api/submit', json=USER_DATA).get_json()
+        summary = self.client.post('/api/submit?summary=true',
+                                   json=USER_DATA).get_json()
+        for job, short in zip(full, summary):
+            self.assertLessEqual(len(short['description']),
+                                 SUMMARY_LENGTH + 1)
+            self.assertEqual(dict(short, description=job['description']),
+                             job)
+            response = self.client.get(f'/api/listing/{job["job_id"]}')
+            self.assertEqual(response.get_json(), job)
+        self.assertTrue(any(short['description'].endswith('\u2026')
+                            for short in summary))
+        fields = self.client.post(
+            '/api/submit', json=dict(USER_DATA, fields=['title', 'job_id']))
+        self.assertEqual(fields.get_json(), [
+            {'title': job['title'], 'job_id': job['job_id']}
+            for job in full])
+        picked = self.client.post(
+            '/api/submit?fields=title,description&summary=true',
+            json=USER_DATA)
+        self.assertEqual(picked.get_json(), [
+            {'title': job['title'], 'description': short['description']}
+            for job, short in zip(full, summary)])
+        response = self.client.get('/api/listing/missing')
+        self.assertEqual(response.status_code, 404)
+
+    def test_submit_rejects_missing_json(self):
+        response = self.client.post('/api/submit', data='not json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_returns_one_ranking_per_user(self):
+        users = [USER_DATA] + OTHER_USERS
+        single = [self.client.post('/api/submit', json=user).get_json()
+                  for user in users]
+        for body in (users, {'users': users}):
+            response = self.client.post('/api/submit/batch', json=body)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), single)
+
+    def test_batch_summary_and_fields(self):
+        users = [USER_DATA] + OTHER_USERS
+        single = [self.client.post(
+            '/api/submit?fields=title,description&summary=true',
+            json=user).get_json() for user in users]
+        response = self.client.post(
+            '/api/submit/batch?fields=title,description&summary=true',
+            json=users)
+        self.assertEqual(response.get_json(), single)
+
+    def test_batch_rejects_non_profiles(self):
+        response = self.client.post('/api/submit/batch', json=[1, 2])
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_requests_get_their_own_rankings(self):
+        import app
+        import requests
+        from concurrent.futures import ThreadPoolExecutor
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/api/submit?k=10'
+        users = [USER_DATA] + OTHER_USERS + [
+            dict(USER_DATA, textInput=word)
+            for word in ('java', 'nurse', 'finance', 'cloud', 'design')]
+        expected = [self.client.post('/api/submit?k=10', json=user)
+                    .get_json() for user in users]
+        try:
+            with requests.Session() as session, \
+                    ThreadPoolExecutor(max_workers=8) as pool:
+                results = list(pool.map(
+                    lambda user: session.post(url, json=user).json(),
+                    users * 8))
+        finally:
+            server.shutdown()
+        self.assertEqual(results, expected * 8)
+
+
+class TestListingClassifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(RAW_PATH, 'r') as raw_file:
+            cls.raw = json.load(raw_file)
+
+    @staticmethod
+    def first_matching_label(groups, text, flags=0):
+        # The original heuristics: one re.search() per pattern, in order
+        for label, patterns in groups:
+            if any(re.search(pattern, text, flags) for pattern in patterns):
+                return label
+        return None
+
+    def test_pattern_prefix(self):
+        self.assertEqual(cleaner.pattern_prefix(r'\bentry level\b'),
+                         ('en', 0))
+        self.assertEqual(cleaner.pattern_prefix(r'\sde-1'), ('de', -1))
+        self.assertEqual(cleaner.pattern_prefix(r'\b5+\b'), ('5', 0))
+        self.assertEqual(cleaner.pattern_prefix(r'\bph.d\b'), ('ph', 0))
+        with self.assertRaises(ValueError):
+            cleaner.pattern_prefix('senior')
+
+    def test_experience_matches_searching_each_pattern(self):
+        groups = [('Entry-Level', cleaner.ENTRY_LEVEL),
+                  ('Junior-Level', cleaner.JUNIOR_LEVEL),
+                  ('Senior-Level', cleaner.SENIOR_LEVEL),
+                  ('Intermediate-Level', cleaner.INT_LEVEL)]
+        matcher = cleaner.KeywordMatcher(groups)
+        texts = [job.get('description', '').lower() for job in self.raw]
+        texts += ['a phd or ph.d', 'sde-2 and 55 yrs', ' sde-1', 'masterss',
+                  'internships', 'senior 1-year intern', '']
+        for text in texts:
+            self.assertEqual(matcher.match(text),
+                             self.first_matching_label(groups, text))
+
+    def test_sector_matches_searching_each_list(self):
+        companies = [job.get('company_name', '') for job in self.raw]
+        companies += ['Goldman Sachs Health', 'mediator', 'Shell Retail',
+                      'Pearson Energy', 'Unknown Co', '']
+        groups = [('Technology', cleaner.TECH_COMPANIES),
+                  ('Finance', cleaner.FIN_COMPANIES),
+                  ('Healthcare', cleaner.HC_COMPANIES)]
+        later = [('Retail', cleaner.RE_COMPANIES),
+                 ('Energy', cleaner.EN_COMPANIES),
+                 ('Education', cleaner.EDU_COMPANIES)]
+        for company in companies:
+            for description in ('', 'Healthcare Software team'):
+                expected = self.first_matching_label(
+                    [(label, ['|'.join(patterns)])
+                     for label, patterns in groups], company, re.IGNORECASE)
+                if expected is None and 'healthcare software' in (
+                        description.lower()):
+                    expected = 'Healthcare'
+                if expected is None:
+                    expected = self.first_matching_label(
+                        [(label, ['|'.join(patterns)])
+                         for label, patterns in later],
+                        company, re.IGNORECASE)
+                self.assertEqual(
+                    cleaner.filter_sector(company, description),
+                    expected or 'Not specified')
+
+
+class TestCleanData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(RAW_PATH, 'r') as raw_file:
+            cls.raw = json.load(raw_file)[:30]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, 'cache.sqlite3')
+        self.output_path = os.path.join(self.tmp.name, 'cleaned.json')
+        self.input_path = os.path.join(self.tmp.name, 'raw.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_incremental(self, raw):
+        with open(self.input_path, 'w') as raw_file:
+            raw_file.writelines(json.dumps(job) + '\n' for job in raw)
+        return clean_data_incremental(iter_data(self.input_path),
+                                      self.cache_path, self.output_path)
+
+    def assert_output_matches_full_clean(self, raw):
+        expected_path = os.path.join(self.tmp.name, 'expected.json')
+        save_cleaned_data(expected_path, clean_data(raw))
+        with open(expected_path) as expected, open(self.output_path) as out:
+            self.assertEqual(out.read(), expected.read())
+
+    def test_only_changed_listings_are_cleaned(self):
+        stats = self.run_incremental(self.raw)
+        self.assertEqual(stats['cleaned'], 30)
+        self.assert_output_matches_full_clean(self.raw)
+
+        changed = [dict(job) for job in self.raw[:25]]
+        changed[3]['title'] = 'Senior Software Engineer'
+        changed.insert(0, self.raw[29])
+        stats = self.run_incremental(changed)
+        self.assertEqual(stats, {'cleaned': 1, 'unchanged': 25,
+                                 'removed': 4, 'total': 26})
+        self.assert_output_matches_full_clean(changed)
+
+    def test_duplicate_job_ids_are_kept_like_the_full_clean(self):
+        renamed = dict(self.raw[0], title='Senior Software Engineer')
+        raw = self.raw[:10] + [renamed, self.raw[0]]
+        stats = self.run_incremental(raw)
+        self.assertEqual(stats['total'], 12)
+        self.assert_output_matches_full_clean(raw)
+        stats = self.run_incremental(raw[::-1])
+        self.assertEqual(stats, {'cleaned': 0, 'unchanged': 12,
+                                 'removed': 0, 'total': 12})
+        self.assert_output_matches_full_clean(raw[::-1])
+
+    def test_parallel_cleaning_keeps_input_order(self):
+        self.assertEqual(clean_data(self.raw, workers=2), clean_data(self.raw))
+
+    def test_empty_input_writes_an_empty_array(self):
+        self.run_incremental([])
+        self.assert_output_matches_full_clean([])
+
+
+class TestDedupe(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(RAW_PATH, 'r') as raw_file:
+            cls.raw = json.load(raw_file)[:20]
+
+    def test_shipped_listings_have_no_duplicates(self):
+        deduped, exact, near = dedupe_listings(self.raw)
+        self.assertEqual((len(deduped), exact, near), (20, 0, 0))
+
+    def test_exact_and_near_duplicates_are_collapsed(self):
+        job = self.raw[0]
+        repost = dict(self.raw[2], job_id='repost',
+                      description=self.raw[2]['description'] + ' Apply!',
+                      apply_options=[{'title': 'Board', 'link': 'x'}])
+        other = dict(repost, job_id='other', company_name='Someone else')
+        listings = [job, self.raw[1], self.raw[2], dict(job), repost, other]
+        deduped, exact, near = dedupe_listings(listings)
+        self.assertEqual((exact, near), (1, 1))
+        self.assertEqual([j['job_id'] for j in deduped],
+                         [job['job_id'], self.raw[1]['job_id'],
+                          self.raw[2]['job_id'], 'other'])
+        # The canonical listing keeps its own options and gains the repost's
+        self.assertEqual(deduped[2]['apply_options'],
+                         self.raw[2]['apply_options']
+                         + repost['apply_options'])
+
+    def test_short_descriptions_are_not_near_duplicates(self):
+        listings = [dict(self.raw[0], job_id=str(i), description='Apply')
+                    for i in range(3)]
+        self.assertEqual(len(dedupe_listings(listings)[0]), 3)
+
+    def test_buckets_are_split_by_company(self):
+        description = shingles(self.raw[0]['description'])
+        signatures = minhash([description] * 4)
+        self.assertEqual(len(list(candidate_pairs(signatures))), 6)
+        self.assertEqual(list(candidate_pairs(
+            signatures, ['A', 'B', 'A', 'C'])), [(0, 2)])
+
+    def test_json_lines_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, 'listings.jsonl')
+            output_path = os.path.join(tmp, 'deduped.jsonl')
+            with open(input_path, 'w') as raw_file:
+                for job in self.raw + self.raw[:3]:
+                    raw_file.write(json.dumps(job) + '\n')
+            with contextlib.redirect_stdout(io.StringIO()):
+                dedupe_main(['--input', input_path, '--output',
+                             output_path])
+            with open(output_path, 'r') as deduped_file:
+                deduped = [json.loads(line) for line in deduped_file]
+        self.assertEqual(deduped, self.raw)
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_synthetic_listings_follow_the_raw_schema(self):
+        with open(RAW_PATH, 'r') as raw_file:
+            raw = json.load(raw_file)
+        first = list(ListingGenerator(raw, seed=1).listings(50))
+        self.assertEqual(first, list(ListingGenerator(raw, 1).listings(50)))
+        self.assertEqual(len({job['job_id'] for job in first}), 50)
+        for job in first:
+            self.assertLessEqual(set(job), set(raw[0]))
+        self.assertEqual(len(clean_data(first)), 50)
+
+    def test_latency_summary(self):
+        summary = latency_summary([0.001 * i for i in range(1, 101)])
+        self.assertAlmostEqual(summary['p50_ms'], 51)
+        self.assertAlmostEqual(summary['p99_ms'], 100)
+
+    def test_regressions_beyond_tolerance_fail(self):
+        baseline = {'runs': [{'size': 10, 'api': {'p50_ms': 10.0},
+                              'clean': {'listings_per_sec': 100.0}}]}
+        current = {'runs': [{'size': 10, 'api': {'p50_ms': 12.0},
+                             'clean': {'listings_per_sec': 60.0}},
+                            {'size': 20, 'api': {'p50_ms': 99.0}}]}
+        self.assertEqual(compare(current, baseline, 0.25), [
+            'size 10: clean.listings_per_sec is 60, baseline 100'])
+        self.assertEqual(len(compare(current, baseline, 0.1)), 2)
+
+
+class StubSerpApi(BaseHTTPRequestHandler):
+    """Serves three pages of ten jobs per query with next_page_token. The
+    first request of every query is rate limited, and the query 'Broken'
+    always fails with a 503. The query 'Chunked' breaks its first body
+    after the rate limit, and 'Garbled' always answers with invalid
+    JSON."""
+
+    def do_GET(self):
+        params = {key: values[0] for key, values
+                  in parse_qs(urlsplit(self.path).query).items()}
+        query = params['q']
+        with self.server.lock:
+            self.server.requests.append(params)
+            first = query not in self.server.seen
+            self.server.seen.add(query)
+            attempt = sum(sent['q'] == query
+                          for sent in self.server.requests)
+        if query == 'Broken' or first:
+            self.send_response(503 if query == 'Broken' else 429)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        if query == 'Chunked' and attempt == 2:
+            # An invalid chunk length cuts the body off
+            self.close_connection = True
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'zz\r\n')
+            return
+        if query == 'Garbled':
+            self.send_response(200)
+            self.send_header('Content-Length', '7')
+            self.end_headers()
+            self.wfile.write(b'{"jobs_')
+            return
+        page = int(params.get('next_page_token', '0'))
+        body = {'jobs_results': [{'title': f'{query} {page * 10 + i}'}
+                                 for i in range(10)]}
+        if page < 2:
+            body['serpapi_pagination'] = {'next_page_token': str(page + 1)}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetchJobs(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubSerpApi)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.seen = set()
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        host, port = self.server.server_address
+        self.fetcher = JobFetcher('key', base_url=f'http://{host}:{port}/',
+                                  rate=1000, burst=100, max_retries=2,
+                                  backoff=0.001)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.fetcher.session.close()
+
+    def test_pages_until_target_after_rate_limit(self):
+        jobs = self.fetcher.fetch_query('Data Engineer', 25)
+        self.assertEqual([job['title'] for job in jobs],
+                         [f'Data Engineer {i}' for i in range(25)])
+        # One 429, then three pages, the last one following the token
+        tokens = [params.get('next_page_token')
+                  for params in self.server.requests]
+        self.assertEqual(tokens, [None, None, '1', '2'])
+
+    def test_stops_when_pages_run_out(self):
+        jobs = self.fetcher.fetch_query('Intern', 100)
+        self.assertEqual(len(jobs), 30)
+
+    def test_failed_queries_are_reported(self):
+        jobs, failures = fetch_job_listings(
+            'key', ['Remote', 'Broken', 'Hybrid'], 10, self.fetcher)
+        self.assertEqual([job['title'] for job in jobs],
+                         [f'Remote {i}' for i in range(10)]
+                         + [f'Hybrid {i}' for i in range(10)])
+        self.assertEqual(list(failures), ['Broken'])
+        with self.assertRaises(FetchError):
+            self.fetcher.fetch_query('Broken', 10)
+
+    def test_broken_bodies_are_retried_or_reported(self):
+        jobs = self.fetcher.fetch_query('Chunked', 10)
+        self.assertEqual(len(jobs), 10)
+        # The 429, the broken body and then the first page
+        self.assertEqual(sum(params['q'] == 'Chunked'
+                             for params in self.server.requests), 3)
+        jobs, failures = fetch_job_listings(
+            'key', ['Remote', 'Garbled'], 10, self.fetcher)
+        self.assertEqual(len(jobs), 10)
+        self.assertEqual(list(failures), ['Garbled'])
+        self.assertIn('invalid JSON', str(failures['Garbled']))
+        self.assertEqual(sum(params['q'] == 'Garbled'
+                             for params in self.server.requests), 3)
+
+    def test_token_bucket_waits_for_refill(self):
+        now = [0.0]
+        waits = []
+
+        def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+        bucket = TokenBucket(2.0, 2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(waits, [0.5, 0.5])
+
+
 if __name__ == '__main__':
     unittest.main()